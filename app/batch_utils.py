@@ -0,0 +1,349 @@
+# -*- coding: utf-8 -*-
+import hashlib
+import json
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import httpx
+
+import generic_utils as gu
+
+# Limits of a single job file of the OpenAI batch API.
+MAX_JOB_REQUESTS = 50000
+MAX_JOB_BYTES = 100 * 2**20
+# Statuses after which a job does not change anymore.
+FINAL_JOB_STATUSES = ("completed", "failed", "expired", "cancelled")
+
+
+class OpenAIBatchBackend:
+    """Runs job files with the OpenAI batch API, which costs half as much as single
+    requests and finishes within 24 hours. The batch endpoints are called directly,
+    so they also work with openai versions without a batches resource."""
+
+    def submit(self, job_path: Path) -> str:
+        """Upload the job file, start the job and return its id."""
+        client = gu.get_openai_client()
+        with open(job_path, "rb") as f:
+            job_file = client.files.create(file=f, purpose="batch")
+        batch = client.post(
+            "/batches",
+            body={
+                "input_file_id": job_file.id,
+                "endpoint": "/v1/chat/completions",
+                "completion_window": "24h",
+            },
+            cast_to=object,
+        )
+        return batch["id"]
+
+    def get_status(self, job_id: str) -> str:
+        return gu.get_openai_client().get(f"/batches/{job_id}", cast_to=object)[
+            "status"
+        ]
+
+    def download_results(self, job_id: str, path: Path) -> None:
+        """Write the result lines of a finished job, including failed requests, to
+        path."""
+        client = gu.get_openai_client()
+        batch = client.get(f"/batches/{job_id}", cast_to=object)
+        with open(path, "w") as f:
+            for file_id in (batch.get("output_file_id"), batch.get("error_file_id")):
+                if file_id:
+                    r = client.get(f"/files/{file_id}/content", cast_to=httpx.Response)
+                    f.write(r.text.rstrip("\n") + "\n")
+
+
+class LocalBatchBackend:
+    """Stand-in for OpenAIBatchBackend, which runs the requests of a job file right
+    away with summarize (by default single, rate limited requests to the OpenAI API)
+    and writes the results in the format of the batch API. Useful for tests with a
+    fake summarize function and for accounts without access to the batch API.
+    Results are only kept in memory, so a job submitted by an earlier process has
+    no results."""
+
+    def __init__(self, summarize=None, workers: int = 4):
+        self.summarize = summarize or gu.generate_openai_summary
+        self.workers = workers
+        self._results = {}
+
+    def _run(self, request: dict) -> dict:
+        result = {"custom_id": request["custom_id"], "response": None, "error": None}
+        try:
+            text = request["body"]["messages"][-1]["content"]
+            summary = self.summarize(text)
+            result["response"] = {
+                "status_code": 200,
+                "body": {"choices": [{"message": {"content": summary}}]},
+            }
+        except Exception as e:
+            result["error"] = {"message": str(e)}
+        return result
+
+    def submit(self, job_path: Path) -> str:
+        with open(job_path, "r") as f:
+            requests = [json.loads(line) for line in f]
+        job_id = Path(job_path).stem
+        with ThreadPoolExecutor(self.workers) as pool:
+            self._results[job_id] = list(pool.map(self._run, requests))
+        return job_id
+
+    def get_status(self, job_id: str) -> str:
+        return "completed"
+
+    def download_results(self, job_id: str, path: Path) -> None:
+        with open(path, "w") as f:
+            for result in self._results.pop(job_id, []):
+                f.write(json.dumps(result) + "\n")
+
+
+def parse_result_line(result: dict) -> str:
+    """Return the summary of a result line of the batch API or raise an exception
+    with the reason why the request failed."""
+    if result.get("error"):
+        raise Exception(f"Batch request failed: {result['error']}")
+    response = result.get("response") or {}
+    if response.get("status_code") != 200:
+        raise Exception(f"Batch request failed: {response}")
+    return response["body"]["choices"][0]["message"]["content"]
+
+
+def get_summary_fields(pdf_summary) -> dict:
+    """Return the fields of an item for its result of BatchSummarizer.collect: status
+    OK with the summary, or status ERROR if summarizing failed or returned nothing."""
+    if isinstance(pdf_summary, Exception) or not pdf_summary:
+        return {
+            "status": "ERROR",
+            "error_msg": f"Exception in batch summary: {pdf_summary}",
+        }
+    return {"status": "OK", "pdf_summary": pdf_summary}
+
+
+def get_request_hash(request: dict) -> str:
+    """Return a hash of a request line of a job file, without its custom_id."""
+    payload = json.dumps(
+        {key: value for key, value in request.items() if key != "custom_id"},
+        sort_keys=True,
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class BatchSummarizer:
+    """Summarizes many texts with a batch backend instead of single requests, for
+    backfills where throughput and cost matter more than latency.
+
+    Texts are added with add, which writes the requests of their chunks right away to
+    JSONL job files in job_directory, so the texts are not kept in memory. collect
+    submits the job files, polls the backend every poll_interval seconds until they
+    are finished and returns the summaries. Texts that are too long for a single
+    request are split like in gu.summarize_text. Their chunks are summarized in the
+    batch and only the final reduce step is a single request. Summaries are looked up
+    in and added to summary_cache if given.
+
+    The ids of submitted jobs are stored in job_directory until their results are
+    read. If a run stops while polling, the next BatchSummarizer on the same
+    job_directory does not submit the requests of these jobs again, but polls the
+    jobs and takes their results.
+    """
+
+    def __init__(
+        self,
+        backend,
+        job_directory: Path,
+        summary_cache=None,
+        poll_interval: float = 60,
+    ):
+        self.backend = backend
+        self.job_directory = Path(job_directory)
+        self.summary_cache = summary_cache
+        self.poll_interval = poll_interval
+        # item_id -> number of chunks, custom_id -> request hash of the chunks
+        # without summary, and the summaries by (item_id, k) once known.
+        self._n_chunks = {}
+        self._request_hashes = {}
+        self._summaries = {}
+        # Job files that are written but not submitted yet, the last one is open.
+        self._job_paths = []
+        self._job_file = None
+        self._job_requests = self._job_bytes = 0
+        os.makedirs(self.job_directory, exist_ok=True)
+        # Submitted jobs, job_id -> job file name, and custom_id -> request hash of
+        # their requests.
+        self._submitted_jobs_path = self.job_directory / "submitted_jobs.json"
+        self._submitted_jobs = {}
+        if self._submitted_jobs_path.exists():
+            with open(self._submitted_jobs_path, "r") as f:
+                self._submitted_jobs = json.load(f)
+        self._submitted_requests = {}
+        for job_file_name in self._submitted_jobs.values():
+            for custom_id, request in self._read_requests(job_file_name):
+                self._submitted_requests[custom_id] = get_request_hash(request)
+
+    def __len__(self):
+        return len(self._n_chunks)
+
+    @property
+    def submitted_job_ids(self) -> list[str]:
+        """Ids of jobs that were submitted, but whose results were not read yet."""
+        return list(self._submitted_jobs)
+
+    def add(self, item_id: str, text: str) -> None:
+        max_chunk_tokens = gu.get_summary_max_chunk_tokens()
+        if gu.count_tokens(text) > max_chunk_tokens:
+            chunks = gu.split_text_into_chunks(text, max_chunk_tokens)
+        else:
+            chunks = [text]
+        self._n_chunks[item_id] = len(chunks)
+        for k, chunk in enumerate(chunks):
+            if self.summary_cache is not None:
+                summary = self.summary_cache.get(
+                    gu.get_summary_cache_key(self.summary_cache, chunk)
+                )
+                if summary is not None:
+                    self._summaries[(item_id, k)] = summary
+                    continue
+            request = {
+                "custom_id": f"{k}:{item_id}",
+                "method": "POST",
+                "url": "/v1/chat/completions",
+                "body": gu.get_summary_request_body(chunk),
+            }
+            request_hash = get_request_hash(request)
+            self._request_hashes[request["custom_id"]] = request_hash
+            # Requests of jobs submitted by an earlier run are not submitted again.
+            if self._submitted_requests.get(request["custom_id"]) != request_hash:
+                self._write_request(request)
+        if self._job_file is not None:
+            self._job_file.flush()
+
+    def _write_request(self, request: dict) -> None:
+        """Append request to the current job file, or to a new one if it would exceed
+        the limits of the batch API."""
+        line = json.dumps(request) + "\n"
+        n_bytes = len(line.encode("utf-8"))
+        if self._job_file is None or (
+            self._job_requests >= MAX_JOB_REQUESTS
+            or self._job_bytes + n_bytes > MAX_JOB_BYTES
+        ):
+            self._close_job_file()
+            # Job files of earlier runs are kept for their submitted jobs.
+            n = len(self._job_paths)
+            while True:
+                job_path = self.job_directory / (
+                    f"summaries_{time.strftime('%Y%m%d_%H%M%S')}_{n}.jsonl"
+                )
+                if not job_path.exists():
+                    break
+                n += 1
+            self._job_paths.append(job_path)
+            self._job_file = open(job_path, "w")
+            self._job_requests = self._job_bytes = 0
+        self._job_file.write(line)
+        self._job_requests += 1
+        self._job_bytes += n_bytes
+
+    def _close_job_file(self) -> None:
+        if self._job_file is not None:
+            self._job_file.close()
+            self._job_file = None
+
+    def _read_requests(self, job_file_name: str):
+        """Yield the custom_id and request of every line of a job file."""
+        job_path = self.job_directory / job_file_name
+        if not job_path.exists():
+            return
+        with open(job_path, "r") as f:
+            for line in f:
+                request = json.loads(line)
+                yield request["custom_id"], request
+
+    def _save_submitted_jobs(self) -> None:
+        tmp_path = self._submitted_jobs_path.with_suffix(".tmp")
+        with open(tmp_path, "w") as f:
+            json.dump(self._submitted_jobs, f)
+        os.replace(tmp_path, self._submitted_jobs_path)
+
+    def _read_results(self, job_id: str, path: Path) -> dict:
+        """Return the summaries and exceptions of a results file by (item_id, k) for
+        the requests of the added texts. Summaries of all requests of the job are
+        added to the summary cache, also of texts that were not added again after a
+        restart."""
+        requests = {}
+        for custom_id, request in self._read_requests(self._submitted_jobs[job_id]):
+            cache_key = None
+            if self.summary_cache is not None:
+                cache_key = gu.get_summary_cache_key(
+                    self.summary_cache, request["body"]["messages"][-1]["content"]
+                )
+            requests[custom_id] = (get_request_hash(request), cache_key)
+        results = {}
+        with open(path, "r") as f:
+            for line in f:
+                result = json.loads(line)
+                custom_id = result["custom_id"]
+                request_hash, cache_key = requests.get(custom_id, (None, None))
+                try:
+                    summary = parse_result_line(result)
+                except Exception as e:
+                    summary = e
+                if cache_key is not None and not isinstance(summary, Exception):
+                    self.summary_cache.put(cache_key, summary)
+                if request_hash and self._request_hashes.get(custom_id) == request_hash:
+                    k, item_id = custom_id.split(":", 1)
+                    results[(item_id, int(k))] = summary
+        return results
+
+    def collect(self) -> dict:
+        """Summarize all added texts and return item_id -> summary, or the exception
+        if the text could not be summarized."""
+        self._close_job_file()
+        for job_path in self._job_paths:
+            job_id = self.backend.submit(job_path)
+            # Stored right away, so a run that stops while polling can resume.
+            self._submitted_jobs[job_id] = job_path.name
+            self._save_submitted_jobs()
+        self._job_paths.clear()
+        pending = set(self._submitted_jobs)
+        while pending:
+            for job_id in list(pending):
+                status = self.backend.get_status(job_id)
+                if status in FINAL_JOB_STATUSES:
+                    pending.remove(job_id)
+                    results_path = self.job_directory / f"{job_id}.results.jsonl"
+                    # Expired jobs still deliver the requests finished in time.
+                    if status in ("completed", "expired"):
+                        self.backend.download_results(job_id, results_path)
+                        self._summaries.update(self._read_results(job_id, results_path))
+                    del self._submitted_jobs[job_id]
+                    self._save_submitted_jobs()
+            if pending:
+                time.sleep(self.poll_interval)
+
+        summaries = {}
+        for item_id, n_chunks in self._n_chunks.items():
+            partials = [
+                self._summaries.get(
+                    (item_id, k), Exception("No result from batch job, see job status.")
+                )
+                for k in range(n_chunks)
+            ]
+            errors = [p for p in partials if isinstance(p, Exception)]
+            if errors:
+                summaries[item_id] = errors[0]
+            elif len(partials) == 1:
+                summaries[item_id] = gu.clean_summary(partials[0])
+            else:
+                try:
+                    # Reduce the partial summaries with single requests.
+                    summaries[item_id] = gu.summarize_text(
+                        " ".join(gu.clean_summary(p) for p in partials),
+                        summary_cache=self.summary_cache,
+                    )
+                except Exception as e:
+                    summaries[item_id] = e
+        self._n_chunks.clear()
+        self._request_hashes.clear()
+        self._summaries.clear()
+        self._submitted_requests.clear()
+        return summaries
@@ -0,0 +1,116 @@
+# -*- coding: utf-8 -*-
+"""Check that the streaming parsers of schlieren_utils extract the same fields as
+the previous BeautifulSoup implementation on the fixtures of benchmarks.fixtures,
+and compare their parse time and peak memory. Run from the app directory:
+
+    python -m benchmarks.bench_parsing
+"""
+import argparse
+import json
+import re
+import time
+import tracemalloc
+
+from bs4 import BeautifulSoup
+
+import generic_utils as gu
+import schlieren_utils as su
+from benchmarks import fixtures
+
+
+def extract_items_soup(table_html: str, root_url: str) -> list[dict]:
+    """Previous implementation of su.extract_items on a full tree."""
+    soup = BeautifulSoup(table_html, "html.parser")
+    items_raw = json.loads(soup.find("table").attrs["data-entities"])["data"]
+    for i in items_raw:
+        i["item_url"] = root_url + re.search(r"href=\"(.*?)\"", i["title"]).groups()[0]
+        i["item_id"] = gu.get_rightmost_url_part(i["item_url"])
+        i["title"] = i["title-sort"].strip().capitalize()
+    return items_raw
+
+
+def get_detail_fields_soup(html: str) -> tuple:
+    """Previous extraction of author and pdf href of su.parse_detail_page."""
+    soup = BeautifulSoup(html, "html.parser")
+    author = None
+    author_tag = soup.find("dt", string=re.compile("Verfasser"))
+    if author_tag:
+        author_tag_a = author_tag.next_sibling.find("a")
+        if author_tag_a:
+            author = author_tag_a.get_text().strip()
+        else:
+            author = author_tag.next_sibling.get_text().strip()
+    pdf_href = soup.find(
+        lambda tag: tag.has_attr("href")
+        and "_doc" in tag["href"]
+        and "Download" in tag.string
+    )["href"]
+    return author, pdf_href
+
+
+def get_detail_fields(html: str) -> tuple:
+    parser = su.DetailPageParser()
+    try:
+        parser.feed(html)
+    except su._StopParsing:
+        pass
+    return parser.author, parser.pdf_href
+
+
+def measure(func, rounds: int) -> tuple[float, float]:
+    """Return the median time in seconds and peak memory in MB of func."""
+    timings = []
+    for _ in range(rounds):
+        start = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - start)
+    tracemalloc.start()
+    func()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return sorted(timings)[len(timings) // 2], peak / 2**20
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--rounds", type=int, default=5)
+    args = parser.parse_args()
+
+    table_html = fixtures.load_table_html()
+    detail_pages = fixtures.load_detail_pages()
+
+    # Equivalence on the fixtures.
+    assert su.extract_items(table_html, fixtures.ROOT_URL) == extract_items_soup(
+        table_html, fixtures.ROOT_URL
+    ), "extract_items differs from the BeautifulSoup implementation"
+    for page in detail_pages:
+        assert get_detail_fields(page["html"]) == get_detail_fields_soup(
+            page["html"]
+        ), f"Detail page of {page['item_raw']['item_url']} is parsed differently"
+    print(f"Equivalent on table page and {len(detail_pages)} detail pages.")
+
+    cases = {
+        "extract_items": (
+            lambda: extract_items_soup(table_html, fixtures.ROOT_URL),
+            lambda: su.extract_items(table_html, fixtures.ROOT_URL),
+        ),
+        "detail_pages": (
+            lambda: [get_detail_fields_soup(p["html"]) for p in detail_pages],
+            lambda: [get_detail_fields(p["html"]) for p in detail_pages],
+        ),
+    }
+    print(
+        f"{'case':>14} {'soup [s]':>9} {'stream [s]':>11} {'speedup':>8} "
+        f"{'soup [MB]':>10} {'stream [MB]':>12}"
+    )
+    for name, (soup_func, stream_func) in cases.items():
+        soup_seconds, soup_mb = measure(soup_func, args.rounds)
+        stream_seconds, stream_mb = measure(stream_func, args.rounds)
+        print(
+            f"{name:>14} {soup_seconds:>9.3f} {stream_seconds:>11.3f} "
+            f"{soup_seconds / stream_seconds:>8.1f} {soup_mb:>10.1f} {stream_mb:>12.1f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,136 @@
+# -*- coding: utf-8 -*-
+"""Benchmark read_pdf_text against the previous implementation, which joined the text
+of all pages and cleaned it in several passes over the whole document. Runs on the
+given pdfs (e.g. OCR'd pdfs from the pdf cache) or on a synthetic pdf with a text
+layer shaped like ocrmypdf output. Run from the app directory:
+
+    python -m benchmarks.bench_read_pdf_text --pages 500
+    python -m benchmarks.bench_read_pdf_text --pdfs ../dev/data/pdf_cache/*.pdf
+
+Peak memory is measured with tracemalloc and therefore only covers allocations of the
+Python interpreter, not those inside the MuPDF library.
+"""
+import argparse
+import random
+import tempfile
+import time
+import tracemalloc
+from pathlib import Path
+
+import pypdf
+from pypdf.generic import DecodedStreamObject, DictionaryObject, NameObject
+
+import generic_utils as gu
+
+WORDS = (
+    "der die das und in den von zu mit sich des auf für ist im dem nicht ein eine als "
+    "auch es an werden aus er hat dass sie nach wird bei einer um am sind noch wie "
+    "Gemeinderat Stadtrat Schlieren Antwort Anfrage Budget Kredit Sanierung Schulhaus "
+    "Verkehr Strasse Liegenschaft Abstimmung Kommission Vorlage Franken Jahr Projekt"
+).split()
+
+
+def read_pdf_text_joined(pdf_path: Path) -> str:
+    """Previous implementation of gu.read_pdf_text."""
+    with open(pdf_path, "rb") as f:
+        pdf = pypdf.PdfReader(f)
+        text = (
+            " ".join(page.extract_text() for page in pdf.pages)
+            .replace("\n", " ")
+            .replace("\r", " ")
+            .replace("\t", " ")
+            .strip()
+        )
+        text = " ".join(text.split())
+    return text
+
+
+def write_synthetic_pdf(path: Path, n_pages: int, lines_per_page: int = 50) -> None:
+    """Write a pdf with an invisible text layer (text render mode 3) of random german
+    words on every page, like ocrmypdf puts on top of scanned pages."""
+    rng = random.Random(42)
+    writer = pypdf.PdfWriter()
+    font = DictionaryObject(
+        {
+            NameObject("/Type"): NameObject("/Font"),
+            NameObject("/Subtype"): NameObject("/Type1"),
+            NameObject("/BaseFont"): NameObject("/Helvetica"),
+        }
+    )
+    font_ref = writer._add_object(font)
+    for _ in range(n_pages):
+        page = writer.add_blank_page(595, 842)
+        lines = []
+        for k in range(lines_per_page):
+            words = " ".join(rng.choice(WORDS) for _ in range(rng.randint(6, 12)))
+            lines.append(f"1 0 0 1 50 {800 - 15 * k} Tm ({words}) Tj")
+        content = DecodedStreamObject()
+        content.set_data(
+            ("BT 3 Tr /F1 10 Tf\n" + "\n".join(lines) + "\nET").encode("latin-1")
+        )
+        page[NameObject("/Contents")] = writer._add_object(content)
+        page[NameObject("/Resources")] = DictionaryObject(
+            {NameObject("/Font"): DictionaryObject({NameObject("/F1"): font_ref})}
+        )
+    writer.write(path)
+
+
+def measure(func, *args) -> tuple[float, float, str]:
+    """Return runtime in seconds, peak traced memory in MB and the result of func."""
+    start = time.perf_counter()
+    result = func(*args)
+    seconds = time.perf_counter() - start
+    # Measure memory in a separate run, tracemalloc slows down allocations.
+    tracemalloc.start()
+    func(*args)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return seconds, peak / 2**20, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--pdfs", type=Path, nargs="+", default=[])
+    parser.add_argument(
+        "--pages", type=int, default=500, help="Pages of the synthetic pdf."
+    )
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp_directory:
+        pdf_paths = args.pdfs
+        if not pdf_paths:
+            pdf_path = Path(tmp_directory) / f"synthetic_{args.pages}.pdf"
+            write_synthetic_pdf(pdf_path, args.pages)
+            pdf_paths = [pdf_path]
+        candidates = [("joined (previous)", read_pdf_text_joined)]
+        for backend in gu.PDF_TEXT_BACKENDS:
+            try:
+                gu.read_pdf_text(pdf_paths[0], max_chars=1, backend=backend)
+            except ImportError:
+                print(f"Skipping backend {backend}, it is not installed.")
+                continue
+            candidates.append(
+                (
+                    f"streaming {backend}",
+                    lambda path, backend=backend: gu.read_pdf_text(
+                        path, backend=backend
+                    ),
+                )
+            )
+        print(f"{'pdf':>24} {'extractor':>20} {'time [s]':>9} {'peak [MB]':>10}")
+        for pdf_path in pdf_paths:
+            reference = None
+            for name, func in candidates:
+                seconds, peak_mb, text = measure(func, pdf_path)
+                if reference is None:
+                    reference = text
+                elif name == "streaming pypdf":
+                    assert text == reference, "Streaming text differs from previous!"
+                print(
+                    f"{pdf_path.name[-24:]:>24} {name:>20} {seconds:>9.2f} "
+                    f"{peak_mb:>10.1f}"
+                )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,140 @@
+# -*- coding: utf-8 -*-
+"""Benchmark add_response_links_inplace against the brute-force pairwise comparison
+on synthetic titles. Run from the app directory:
+
+    python -m benchmarks.bench_related_items --sizes 1000 10000 50000
+"""
+import argparse
+import copy
+import random
+import time
+
+from thefuzz import fuzz
+
+import schlieren_utils as su
+
+SYLLABLES = (
+    "schul velo ver kehr bud get park platz kre dit sa nie rung stras se haus ener gie "
+    "ge mein de stadt rat fi nanz woh nung kin der be treu al ters heim ba di sport zen "
+    "trum bahn hof bus li nie quar tier lärm tem po bäu me fried was ser ab fall steu "
+    "ern per so nal di gi tal kul tur bib lio thek ju gend spiel platz weg brü cke"
+).split()
+PREFIXES = [
+    "Kleine Anfrage",
+    "Interpellation",
+    "Postulat",
+    "Motion",
+    "Schriftliche Anfrage",
+]
+FIRSTNAMES = (
+    "anna beat claudia daniel eva fritz gabi hans iris jonas karin luca".split()
+)
+LASTNAMES = (
+    "müller meier schmid keller weber huber schneider meyer steiner fischer".split()
+)
+PARTIES = "SP FDP SVP GLP Grüne EVP Mitte AL".split()
+
+
+def synthetic_word(rng: random.Random) -> str:
+    return "".join(rng.sample(SYLLABLES, rng.randint(2, 4)))
+
+
+def synthetic_date(rng: random.Random) -> str:
+    return f"{rng.randint(1, 28)}.{rng.randint(1, 12)}.{rng.randint(2000, 2024)}"
+
+
+def synthetic_items(n_items: int, seed: int = 42) -> list[dict]:
+    """Generate items with titles shaped like the politbusiness table: requests by
+    council members, council proposals and protocols. Roughly every fifth item is a
+    response ("Beantwortung") to an earlier request, sometimes with a small typo,
+    so there is a realistic share of related items."""
+    rng = random.Random(seed)
+    items = []
+    requests = []
+    for k in range(n_items):
+        r = rng.random()
+        if requests and r < 0.2:
+            title = "Beantwortung " + rng.choice(requests)
+            if rng.random() < 0.3:
+                pos = rng.randrange(len(title))
+                title = title[:pos] + title[pos + 1 :]
+        elif r < 0.3:
+            title = f"Protokoll Gemeindeparlament Sitzung vom {synthetic_date(rng)}"
+        elif r < 0.4:
+            topic = " ".join(synthetic_word(rng) for _ in range(rng.randint(1, 4)))
+            title = f"Vorlage Stadtrat {topic}"
+        else:
+            author = f"{rng.choice(FIRSTNAMES)} {rng.choice(LASTNAMES)}".title()
+            topic = " ".join(synthetic_word(rng) for _ in range(rng.randint(1, 5)))
+            title = (
+                f"{rng.choice(PREFIXES)} von {author}, {rng.choice(PARTIES)}, "
+                f"vom {synthetic_date(rng)} betreffend {topic}"
+            )
+            requests.append(title.lower())
+        items.append({"item_id": str(k), "title": title.strip().capitalize()})
+    return items
+
+
+def add_response_links_inplace_brute_force(items):
+    """Reference implementation comparing all pairs of titles."""
+    for i in items:
+        i["related_items"] = []
+    for i1 in range(len(items)):
+        item1 = items[i1]
+        i1_title = item1["title"].lower()
+        if "gemeindeparlament" in i1_title:
+            continue
+        for i2 in range(i1 + 1, len(items)):
+            item2 = items[i2]
+            i2_title = item2["title"].lower()
+            ratio = fuzz.partial_ratio(i1_title, i2_title)
+            if ratio > 95:
+                item1["related_items"].append(
+                    {"item_id": item2["item_id"], "title": item2["title"]}
+                )
+                item2["related_items"].append(
+                    {"item_id": item1["item_id"], "title": item1["title"]}
+                )
+
+
+def timed(func, items) -> float:
+    start = time.perf_counter()
+    func(items)
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000, 50000])
+    parser.add_argument(
+        "--max-brute-force",
+        type=int,
+        default=10000,
+        help="Largest size for which the brute-force version is actually run. "
+        "Above, its runtime is extrapolated quadratically from the largest measured size.",
+    )
+    args = parser.parse_args()
+
+    brute_force_ref = None
+    print(f"{'n_items':>8} {'indexed [s]':>12} {'brute force [s]':>16} {'speedup':>8}")
+    for n_items in args.sizes:
+        items = synthetic_items(n_items)
+        items_indexed = copy.deepcopy(items)
+        t_indexed = timed(su.add_response_links_inplace, items_indexed)
+        if n_items <= args.max_brute_force:
+            t_brute_force = timed(add_response_links_inplace_brute_force, items)
+            assert items == items_indexed, "Indexed result differs from brute force!"
+            brute_force_ref = (n_items, t_brute_force)
+            label = f"{t_brute_force:.2f}"
+        elif brute_force_ref:
+            n_ref, t_ref = brute_force_ref
+            t_brute_force = t_ref * (n_items / n_ref) ** 2
+            label = f"~{t_brute_force:.0f} (est.)"
+        else:
+            t_brute_force, label = None, "n/a"
+        speedup = f"{t_brute_force / t_indexed:.0f}x" if t_brute_force else "n/a"
+        print(f"{n_items:>8} {t_indexed:>12.2f} {label:>16} {speedup:>8}")
+
+
+if __name__ == "__main__":
+    main()
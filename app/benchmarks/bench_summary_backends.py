@@ -0,0 +1,92 @@
+# -*- coding: utf-8 -*-
+"""Benchmark latency and throughput of the summarization backends. Runs on the given
+text files (e.g. the txt files of the pdf cache) or on synthetic german documents.
+The openai backend is only run if OPENAI_API_KEY is set, as it costs money.
+Run from the app directory:
+
+    python -m benchmarks.bench_summary_backends --documents 50
+    python -m benchmarks.bench_summary_backends --texts ../dev/data/pdf_cache/*.txt
+"""
+import argparse
+import os
+import random
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import generic_utils as gu
+from benchmarks.bench_read_pdf_text import WORDS
+
+
+def synthetic_documents(n_documents: int, seed: int = 42) -> list[str]:
+    """Generate documents of 5 to 100 pages with about 25 sentences per page."""
+    rng = random.Random(seed)
+    documents = []
+    for _ in range(n_documents):
+        sentences = []
+        for _ in range(25 * rng.randint(5, 100)):
+            words = [rng.choice(WORDS) for _ in range(rng.randint(4, 25))]
+            sentences.append(" ".join(words).capitalize() + ".")
+        documents.append(" ".join(sentences))
+    return documents
+
+
+def percentile(values: list[float], p: float) -> float:
+    values = sorted(values)
+    return values[min(len(values) - 1, int(p * len(values)))]
+
+
+def run_backend(backend: str, texts: list[str], workers: int) -> tuple[float, list]:
+    """Summarize all texts with workers threads and return the total time and the
+    latencies of the single summaries."""
+    gu.configure_summary_backend(backend)
+
+    def summarize(text):
+        start = time.perf_counter()
+        gu.summarize_text(text)
+        return time.perf_counter() - start
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(workers) as pool:
+        latencies = list(pool.map(summarize, texts))
+    return time.perf_counter() - start, latencies
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--texts", type=Path, nargs="+", default=[])
+    parser.add_argument("--documents", type=int, default=50)
+    parser.add_argument("--backends", nargs="+", default=list(gu.SUMMARY_BACKENDS))
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=1,
+        help="Concurrent summaries. Threads only help the network bound openai "
+        "backend, run one process per core to scale textrank.",
+    )
+    args = parser.parse_args()
+
+    if args.texts:
+        texts = [path.read_text(encoding="utf-8") for path in args.texts]
+    else:
+        texts = synthetic_documents(args.documents)
+    n_chars = sum(len(text) for text in texts)
+    print(f"{len(texts)} documents, {n_chars / len(texts):.0f} characters on average")
+    print(
+        f"{'backend':>10} {'total [s]':>10} {'docs/s':>8} "
+        f"{'p50 [s]':>8} {'p95 [s]':>8} {'max [s]':>8}"
+    )
+    for backend in args.backends:
+        if backend == "openai" and not os.environ.get("OPENAI_API_KEY"):
+            print(f"{backend:>10} skipped, OPENAI_API_KEY is not set")
+            continue
+        total, latencies = run_backend(backend, texts, args.workers)
+        p50, p95 = percentile(latencies, 0.5), percentile(latencies, 0.95)
+        print(
+            f"{backend:>10} {total:>10.2f} {len(texts) / total:>8.2f} "
+            f"{p50:>8.3f} {p95:>8.3f} {max(latencies):>8.3f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,188 @@
+# -*- coding: utf-8 -*-
+"""Fixtures of the benchmark suite: the politbusiness table page, item detail pages
+and pdfs. The committed table.html.gz and detail_pages.json.gz are synthetic: they
+were written by hand in the structure of the live pages, including detail pages
+with the documents before the details and pages without an author, because the
+live site was not reachable when the suite was added. They can be replaced by
+captures of the live site with
+
+    python -m benchmarks.fixtures --record
+
+which stores them gzipped in benchmarks/fixtures. The table is trimmed to its first
+N_TABLE_ITEMS items, so every fixture stays below the 500 KB limit of the
+pre-commit hooks, a pdf above it is not recorded. Benchmarks never access the
+network. Fixtures that are missing are generated synthetically with the same
+structure, so the suite also runs offline, but timings are only comparable between
+runs using the same fixtures.
+"""
+import argparse
+import gzip
+import html
+import json
+import random
+import re
+from pathlib import Path
+
+import generic_utils as gu
+import http_utils as hu
+import schlieren_utils as su
+from benchmarks.bench_read_pdf_text import write_synthetic_pdf
+from benchmarks.bench_related_items import synthetic_items
+
+FIXTURE_DIRECTORY = Path(__file__).parent / "fixtures"
+TABLE_URL = "https://www.schlieren.ch/politbusiness"
+ROOT_URL = "https://www.schlieren.ch"
+N_DETAIL_PAGES = 20
+N_TABLE_ITEMS = 1000
+MAX_FIXTURE_BYTES = 500 * 1024
+CATEGORIES = ["Anfrage", "Interpellation", "Postulat", "Motion", "Vorlage Stadtrat"]
+
+
+def record(directory: Path = FIXTURE_DIRECTORY) -> None:
+    """Download the table page with all years, the detail pages of the first
+    N_DETAIL_PAGES items and the pdf of the first item."""
+    directory.mkdir(parents=True, exist_ok=True)
+    table_html = trim_table_html(su.get_full_table_html(TABLE_URL), N_TABLE_ITEMS)
+    write_gzip(directory / "table.html.gz", table_html.encode("utf-8"))
+    items_raw = su.extract_items(table_html, ROOT_URL)
+    detail_pages = []
+    for item_raw in items_raw[:N_DETAIL_PAGES]:
+        item_raw = {**item_raw, "related_items": []}
+        detail_pages.append(
+            {"item_raw": item_raw, "html": gu.fetch(item_raw["item_url"]).text}
+        )
+    write_gzip(
+        directory / "detail_pages.json.gz", json.dumps(detail_pages).encode("utf-8")
+    )
+    pdf_url = su.enrich_item_from_detail_page(detail_pages[0]["item_raw"])["pdf_url"]
+    try:
+        gu.download_and_save_pdf(
+            pdf_url, directory / "document.pdf", max_bytes=MAX_FIXTURE_BYTES
+        )
+    except hu.ResponseTooLargeError:
+        print(f"{pdf_url} is too large to be recorded, using a synthetic pdf.")
+    for path in directory.glob("[!.]*"):
+        if path.stat().st_size > MAX_FIXTURE_BYTES:
+            print(f"{path} is larger than {MAX_FIXTURE_BYTES} bytes, do not commit it.")
+
+
+def trim_table_html(table_html: str, n_items: int) -> str:
+    """Return table_html with only the first n_items items in the data-entities
+    attribute of the table, leaving the rest of the markup as it is."""
+    match = re.search(r'data-entities="([^"]*)"', table_html)
+    entities = json.loads(html.unescape(match.group(1)))
+    entities["data"] = entities["data"][:n_items]
+    trimmed = html.escape(json.dumps(entities), quote=True)
+    return table_html[: match.start(1)] + trimmed + table_html[match.end(1) :]
+
+
+def write_gzip(path: Path, data: bytes) -> None:
+    with gzip.open(path, "wb") as f:
+        f.write(data)
+
+
+def read_gzip(path: Path) -> bytes:
+    with gzip.open(path, "rb") as f:
+        return f.read()
+
+
+def synthetic_table_html(n_items: int = 5000, seed: int = 42) -> str:
+    """Return a table page shaped like the politbusiness page, with all items in the
+    data-entities attribute of the table and the first page rendered as rows."""
+    rng = random.Random(seed)
+    entities = []
+    for item in synthetic_items(n_items, seed):
+        url = f"/politbusiness/{100000 + int(item['item_id'])}"
+        date = (
+            f"{rng.randint(2000, 2024)}-{rng.randint(1, 12):02}-{rng.randint(1, 28):02}"
+        )
+        category = rng.choice(CATEGORIES)
+        entities.append(
+            {
+                "title": f'<a href="{url}">{html.escape(item["title"])}</a>',
+                "title-sort": item["title"],
+                "_kategorieId": category,
+                "_kategorieId-sort": category.lower(),
+                "_geschaeftsdatum": date,
+                "_geschaeftsdatum-sort": date,
+            }
+        )
+    rows = "".join(
+        f"<tr><td>{e['title']}</td><td>{e['_kategorieId']}</td>"
+        f"<td>{e['_geschaeftsdatum']}</td></tr>"
+        for e in entities[:50]
+    )
+    data_entities = html.escape(json.dumps({"data": entities}), quote=True)
+    navigation = "".join(
+        f'<li><a href="/page{k}">Seite {k}</a></li>' for k in range(200)
+    )
+    return (
+        "<!DOCTYPE html><html><head><title>Politbusiness</title></head><body>"
+        f"<nav><ul>{navigation}</ul></nav>"
+        '<form><input id="politische_geschaefte_suchformular__token" value="x"></form>'
+        f'<table data-entities="{data_entities}"><tbody>{rows}</tbody></table>'
+        "</body></html>"
+    )
+
+
+def synthetic_detail_page(item_raw: dict, seed: int) -> str:
+    rng = random.Random(seed)
+    paragraphs = "".join(
+        f"<p>{' '.join(rng.choice(item_raw['title'].split()) for _ in range(40))}</p>"
+        for _ in range(5)
+    )
+    navigation = "".join(f'<li><a href="/nav{k}">Menü {k}</a></li>' for k in range(300))
+    return (
+        "<!DOCTYPE html><html><head><title>Geschäft</title></head><body>"
+        f"<nav><ul>{navigation}</ul></nav><main><h1>{html.escape(item_raw['title'])}</h1>"
+        f"{paragraphs}<dl><dt>Geschäftsart</dt><dd>Anfrage</dd>"
+        '<dt>Verfasser</dt><dd><a href="/person">Anna Müller</a></dd></dl>'
+        f'<a href="/_docn/{seed}/dokument.pdf">Download</a></main></body></html>'
+    )
+
+
+def load_table_html(directory: Path = FIXTURE_DIRECTORY) -> str:
+    path = directory / "table.html.gz"
+    if path.exists():
+        return read_gzip(path).decode("utf-8")
+    return synthetic_table_html()
+
+
+def load_detail_pages(directory: Path = FIXTURE_DIRECTORY) -> list[dict]:
+    """Return a list of {"item_raw": ..., "html": ...} of detail pages."""
+    path = directory / "detail_pages.json.gz"
+    if path.exists():
+        return json.loads(read_gzip(path))
+    items_raw = su.extract_items(synthetic_table_html(N_DETAIL_PAGES), ROOT_URL)
+    return [
+        {
+            "item_raw": {**item_raw, "related_items": []},
+            "html": synthetic_detail_page(item_raw, k),
+        }
+        for k, item_raw in enumerate(items_raw)
+    ]
+
+
+def get_pdf_path(directory: Path = FIXTURE_DIRECTORY) -> Path:
+    """Return the path of the recorded pdf, or of a synthetic pdf with a text layer
+    of 100 pages, which is generated on first use."""
+    path = directory / "document.pdf"
+    if path.exists():
+        return path
+    path = directory / "synthetic_document.pdf"
+    if not path.exists():
+        directory.mkdir(parents=True, exist_ok=True)
+        write_synthetic_pdf(path, 100)
+    return path
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--record", action="store_true")
+    args = parser.parse_args()
+    if args.record:
+        record()
+
+
+if __name__ == "__main__":
+    main()
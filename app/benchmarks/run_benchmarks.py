@@ -0,0 +1,224 @@
+# -*- coding: utf-8 -*-
+"""Benchmark suite for the scraping and processing hot paths. Uses only the fixtures
+of benchmarks.fixtures, never the network. Run from the app directory:
+
+    python -m benchmarks.run_benchmarks --output ../dev/benchmarks/before.json
+    python -m benchmarks.run_benchmarks --compare ../dev/benchmarks/before.json
+
+Every benchmark is run once to warm up and then for --rounds rounds. Results are
+written as json together with the commit they were measured on. With --compare, the
+median of every benchmark is compared to the one of an earlier result file and the
+exit status is 1 if any benchmark got slower by more than --threshold.
+"""
+import argparse
+import copy
+import datetime
+import json
+import platform
+import statistics
+import subprocess
+import tempfile
+import time
+from pathlib import Path
+
+import generic_utils as gu
+import schlieren_utils as su
+from benchmarks import fixtures
+from benchmarks.bench_related_items import synthetic_items
+
+# name -> setup function returning the function to time. Setup is not timed.
+BENCHMARKS = {}
+
+
+def benchmark(name: str):
+    def decorator(setup):
+        BENCHMARKS[name] = setup
+        return setup
+
+    return decorator
+
+
+@benchmark("parse_table_html")
+def setup_parse_table_html():
+    table_html = fixtures.load_table_html()
+    return lambda: su.parse_table_page(table_html)
+
+
+@benchmark("extract_items")
+def setup_extract_items():
+    table_html = fixtures.load_table_html()
+    return lambda: su.extract_items(table_html, fixtures.ROOT_URL)
+
+
+def setup_add_response_links(n_items: int):
+    items = synthetic_items(n_items)
+    return lambda: su.add_response_links_inplace(copy.deepcopy(items))
+
+
+for _n_items in (1000, 2500, 5000):
+    benchmark(f"add_response_links_inplace[{_n_items}]")(
+        lambda n_items=_n_items: setup_add_response_links(n_items)
+    )
+
+
+@benchmark("parse_detail_page")
+def setup_parse_detail_page():
+    detail_pages = fixtures.load_detail_pages()
+
+    def parse_all():
+        for page in detail_pages:
+            su.parse_detail_page(page["item_raw"], page["html"])
+
+    return parse_all
+
+
+@benchmark("read_pdf_text")
+def setup_read_pdf_text():
+    pdf_path = fixtures.get_pdf_path()
+    return lambda: gu.read_pdf_text(pdf_path)
+
+
+@benchmark("clean_text")
+def setup_clean_text():
+    # Text of a long document with the whitespace of raw pdf text.
+    text = "\n".join(
+        f"Zeile {k}\tmit  etwas\r\nText   aus einem Dokument." for k in range(50000)
+    )
+    return lambda: gu.clean_text(text)
+
+
+def get_items_json(n_items: int = 2000) -> dict:
+    """Return a result json like items.json with n_items items with pdf text."""
+    items = synthetic_items(n_items)
+    su.add_response_links_inplace(items)
+    text = " ".join(["Der Stadtrat beantragt dem Gemeindeparlament."] * 500)
+    for item in items:
+        item.update(
+            {
+                "status": "OK",
+                "error_msg": "",
+                "processed_asof": "2024-01-01",
+                "item_url": f"https://www.schlieren.ch/politbusiness/{item['item_id']}",
+                "pdf_url": f"https://www.schlieren.ch/_docn/{item['item_id']}/doc.pdf",
+                "pdf_text": text,
+                "pdf_summary": text[:500],
+            }
+        )
+    return {"processed_asof": "2024-01-01", "data": items}
+
+
+@benchmark("write_json")
+def setup_write_json():
+    data = get_items_json()
+    path = Path(tempfile.mkdtemp()) / "items.json"
+    return lambda: gu.write_json(data, path)
+
+
+@benchmark("read_json")
+def setup_read_json():
+    path = Path(tempfile.mkdtemp()) / "items.json"
+    gu.write_json(get_items_json(), path)
+    return lambda: gu.read_json(path)
+
+
+def run(func, rounds: int) -> dict:
+    func()
+    timings = []
+    for _ in range(rounds):
+        start = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - start)
+    return {
+        "rounds": rounds,
+        "min": min(timings),
+        "median": statistics.median(timings),
+        "mean": statistics.mean(timings),
+        "stddev": statistics.stdev(timings) if rounds > 1 else 0.0,
+    }
+
+
+def get_commit() -> str:
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+        dirty = subprocess.run(
+            ["git", "status", "--porcelain", "--untracked-files=no"],
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+        return f"{commit}-dirty" if dirty else commit
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def compare(results: dict, previous: dict, threshold: float) -> list[str]:
+    """Print a comparison of the medians and return the names of regressions."""
+    print(f"\nComparison with {previous['commit']} ({previous['datetime']}):")
+    print(f"{'benchmark':>36} {'before [s]':>11} {'after [s]':>11} {'ratio':>7}")
+    regressions = []
+    for name, result in results["benchmarks"].items():
+        if name not in previous["benchmarks"]:
+            continue
+        before = previous["benchmarks"][name]["median"]
+        ratio = result["median"] / before
+        flag = ""
+        if ratio > threshold:
+            regressions.append(name)
+            flag = "  slower!"
+        print(
+            f"{name:>36} {before:>11.4f} {result['median']:>11.4f} {ratio:>7.2f}{flag}"
+        )
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--rounds", type=int, default=5)
+    parser.add_argument(
+        "--filter", default="", help="Only run benchmarks containing this string."
+    )
+    parser.add_argument("--output", type=Path, help="Write results to this json file.")
+    parser.add_argument("--compare", type=Path, help="Earlier results to compare to.")
+    parser.add_argument(
+        "--threshold",
+        type=float,
+        default=1.2,
+        help="Slowdown factor of the median that counts as regression.",
+    )
+    args = parser.parse_args()
+
+    results = {
+        "commit": get_commit(),
+        "datetime": datetime.datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "benchmarks": {},
+    }
+    print(f"{'benchmark':>36} {'median [s]':>11} {'min [s]':>11} {'stddev':>9}")
+    for name, setup in BENCHMARKS.items():
+        if args.filter not in name:
+            continue
+        result = run(setup(), args.rounds)
+        results["benchmarks"][name] = result
+        print(
+            f"{name:>36} {result['median']:>11.4f} {result['min']:>11.4f} "
+            f"{result['stddev']:>9.4f}"
+        )
+    if args.output:
+        args.output.parent.mkdir(parents=True, exist_ok=True)
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=4)
+    if args.compare:
+        with open(args.compare, "r") as f:
+            previous = json.load(f)
+        if compare(results, previous, args.threshold):
+            raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,291 @@
+# -*- coding: utf-8 -*-
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+from pathlib import Path
+
+
+def get_file_hash(path: Path) -> str:
+    """Return the sha256 hex digest of a file's content."""
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def write_file_atomic(data: bytes, path: Path) -> None:
+    """Write data to a temporary file next to path and move it into place, so
+    readers never see a partially written file."""
+    tmp_path = path.with_name(f".{path.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+    with open(tmp_path, "wb") as f:
+        f.write(data)
+    os.replace(tmp_path, path)
+
+
+class PdfCache:
+    """Persistent on-disk cache for OCR'd pdfs and their extracted text.
+
+    Entries are keyed by pdf_id and the hash of the downloaded (not yet OCR'd) pdf,
+    so a document whose content changed under the same pdf_id is processed again,
+    while the same document is never sent through ghostscript and ocrmypdf twice.
+    Every entry consists of a pdf file and a txt file per text extraction, keyed
+    additionally by the text backend and the maximal number of characters, as both
+    change the extracted text. Text for other settings is extracted again from the
+    cached pdf (see get_pdf_path), without OCR. Whenever the cache grows beyond
+    max_size_bytes, the least recently used entries are evicted. Usage is tracked
+    with the modification time of the files, which is refreshed on hits.
+
+    Texts cached before they were keyed by the text settings were all extracted with
+    LEGACY_TEXT_BACKEND and without character limit, they are renamed accordingly
+    when the cache is opened.
+    """
+
+    LEGACY_TEXT_BACKEND = "pypdf"
+
+    def __init__(self, directory: Path, max_size_bytes: int):
+        self.directory = Path(directory)
+        self.max_size_bytes = max_size_bytes
+        self._lock = threading.Lock()
+        os.makedirs(self.directory, exist_ok=True)
+        self._migrate_legacy_texts()
+
+    def _migrate_legacy_texts(self) -> None:
+        """Rename texts of entries named <stem>.txt next to <stem>.pdf to the name of
+        their text settings."""
+        for text_path in self.directory.glob("*.txt"):
+            if text_path.with_suffix(".pdf").exists():
+                pdf_id, content_hash = text_path.stem.rsplit("_", 1)
+                _, new_text_path = self._paths(
+                    pdf_id, content_hash, self.LEGACY_TEXT_BACKEND, None
+                )
+                os.replace(text_path, new_text_path)
+
+    def _paths(
+        self, pdf_id: str, content_hash: str, text_backend: str, max_text_chars: int
+    ) -> tuple[Path, Path]:
+        stem = f"{pdf_id}_{content_hash}"
+        text_key = f"{text_backend}-{max_text_chars or 'all'}"
+        return (
+            self.directory / f"{stem}.pdf",
+            self.directory / f"{stem}.{text_key}.txt",
+        )
+
+    def get_text(
+        self,
+        pdf_id: str,
+        content_hash: str,
+        text_backend: str,
+        max_text_chars: int = None,
+    ) -> str | None:
+        """Return the cached text of a pdf extracted with text_backend and
+        max_text_chars (see gu.read_pdf_text) or None if it is not cached."""
+        pdf_path, text_path = self._paths(
+            pdf_id, content_hash, text_backend, max_text_chars
+        )
+        with self._lock:
+            try:
+                text = text_path.read_text(encoding="utf-8")
+                # Mark entry as recently used.
+                text_path.touch()
+                pdf_path.touch()
+            except FileNotFoundError:
+                return None
+        return text
+
+    def get_pdf_path(self, pdf_id: str, content_hash: str) -> Path | None:
+        """Return the path of the cached OCR'd pdf or None if it is not cached."""
+        pdf_path = self.directory / f"{pdf_id}_{content_hash}.pdf"
+        with self._lock:
+            if not pdf_path.exists():
+                return None
+            # Mark entry as recently used.
+            pdf_path.touch()
+        return pdf_path
+
+    def put(
+        self,
+        pdf_id: str,
+        content_hash: str,
+        pdf_path: Path,
+        text: str,
+        text_backend: str,
+        max_text_chars: int = None,
+    ) -> None:
+        """Store a copy of the OCR'd pdf at pdf_path, unless it is cached already, and
+        its text extracted with text_backend and max_text_chars, then evict least
+        recently used entries if the cache is too large."""
+        cached_pdf_path, text_path = self._paths(
+            pdf_id, content_hash, text_backend, max_text_chars
+        )
+        with self._lock:
+            if not cached_pdf_path.exists():
+                write_file_atomic(Path(pdf_path).read_bytes(), cached_pdf_path)
+            # The text file is written last, so an entry only counts as cached
+            # once both files are complete.
+            write_file_atomic(text.encode("utf-8"), text_path)
+            self._evict()
+
+    def _evict(self) -> None:
+        # Entry stem -> (size, last used, paths), the texts of a pdf belong to it.
+        entries = {}
+        for path in self.directory.iterdir():
+            if path.suffix == ".pdf":
+                stem = path.stem
+            elif path.suffix == ".txt":
+                stem = path.stem.rsplit(".", 1)[0]
+            else:
+                continue
+            stat = path.stat()
+            size, last_used, paths = entries.get(stem, (0, 0, []))
+            entries[stem] = (
+                size + stat.st_size,
+                max(last_used, stat.st_mtime),
+                paths + [path],
+            )
+        total_size = sum(size for size, _, _ in entries.values())
+        for size, _, paths in sorted(entries.values(), key=lambda e: e[1]):
+            if total_size <= self.max_size_bytes:
+                break
+            # Texts first, so an entry never has a text without its pdf.
+            for path in sorted(paths, key=lambda p: p.suffix != ".txt"):
+                path.unlink(missing_ok=True)
+            total_size -= size
+
+
+class SummaryCache:
+    """Persistent summary store in a SQLite database.
+
+    Summaries are keyed by the hash of everything that determines the response of the
+    API: the cleaned text, the system prompt, the model name and the temperature.
+    Changing the prompt or model therefore never returns stale summaries. The connection
+    is shared between threads and guarded by a lock.
+    """
+
+    def __init__(self, db_path: Path):
+        os.makedirs(Path(db_path).parent, exist_ok=True)
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(db_path, check_same_thread=False)
+        with self._lock, self._connection:
+            self._connection.execute(
+                "CREATE TABLE IF NOT EXISTS summaries (key TEXT PRIMARY KEY, summary TEXT)"
+            )
+
+    @staticmethod
+    def get_key(text: str, system_prompt: str, model: str, temperature: float) -> str:
+        payload = json.dumps([text, system_prompt, model, temperature])
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def get(self, key: str) -> str | None:
+        """Return the cached summary or None if it is not cached."""
+        with self._lock:
+            row = self._connection.execute(
+                "SELECT summary FROM summaries WHERE key = ?", (key,)
+            ).fetchone()
+        return row[0] if row else None
+
+    def put(self, key: str, summary: str) -> None:
+        with self._lock, self._connection:
+            self._connection.execute(
+                "INSERT OR REPLACE INTO summaries (key, summary) VALUES (?, ?)",
+                (key, summary),
+            )
+
+    def close(self) -> None:
+        with self._lock:
+            self._connection.close()
+
+
+class HttpCache:
+    """On-disk cache of http response bodies for conditional requests.
+
+    For every cache key (usually the url) the body and the validators of the last
+    response (ETag and Last-Modified headers) are stored, so the next request can ask
+    the server to only send the body if it changed. Entries without validators are
+    not stored, because they could never be revalidated. Whenever the cache grows
+    beyond max_size_bytes, the least recently used entries are evicted, tracked like
+    in PdfCache with the modification time of the files. Without max_size_bytes the
+    cache is not limited.
+    """
+
+    def __init__(self, directory: Path, max_size_bytes: int = None):
+        self.directory = Path(directory)
+        self.max_size_bytes = max_size_bytes
+        self._lock = threading.Lock()
+        os.makedirs(self.directory, exist_ok=True)
+
+    def _paths(self, key: str) -> tuple[Path, Path]:
+        stem = hashlib.sha256(key.encode("utf-8")).hexdigest()
+        return self.directory / f"{stem}.json", self.directory / f"{stem}.body"
+
+    def get(self, key: str) -> tuple[dict, bytes] | None:
+        """Return (headers, body) of the cached response or None if not cached."""
+        headers_path, body_path = self._paths(key)
+        with self._lock:
+            try:
+                with open(headers_path, "r") as f:
+                    headers = json.load(f)
+                body = body_path.read_bytes()
+                # Mark entry as recently used.
+                headers_path.touch()
+                body_path.touch()
+            except FileNotFoundError:
+                return None
+        return headers, body
+
+    def get_conditional_headers(self, key: str) -> dict:
+        """Return the request headers to revalidate the cached response of key."""
+        headers_path, _ = self._paths(key)
+        try:
+            with open(headers_path, "r") as f:
+                headers = json.load(f)
+        except FileNotFoundError:
+            return {}
+        conditional_headers = {}
+        if "etag" in headers:
+            conditional_headers["If-None-Match"] = headers["etag"]
+        if "last-modified" in headers:
+            conditional_headers["If-Modified-Since"] = headers["last-modified"]
+        return conditional_headers
+
+    def put(self, key: str, headers: dict, body: bytes) -> None:
+        # The body is stored decoded, so drop headers describing the transfer.
+        headers = {
+            k.lower(): v
+            for k, v in headers.items()
+            if k.lower()
+            not in ("content-encoding", "content-length", "transfer-encoding")
+        }
+        if "etag" not in headers and "last-modified" not in headers:
+            return
+        headers_path, body_path = self._paths(key)
+        with self._lock:
+            # The body is written first, so the validators never refer to an old body.
+            write_file_atomic(body, body_path)
+            write_file_atomic(json.dumps(headers).encode("utf-8"), headers_path)
+            if self.max_size_bytes is not None:
+                self._evict()
+
+    def _evict(self) -> None:
+        # Entry stem -> (size, last used, paths).
+        entries = {}
+        for path in self.directory.iterdir():
+            if path.suffix not in (".json", ".body"):
+                continue
+            stat = path.stat()
+            size, last_used, paths = entries.get(path.stem, (0, 0, []))
+            entries[path.stem] = (
+                size + stat.st_size,
+                max(last_used, stat.st_mtime),
+                paths + [path],
+            )
+        total_size = sum(size for size, _, _ in entries.values())
+        for size, _, paths in sorted(entries.values(), key=lambda e: e[1]):
+            if total_size <= self.max_size_bytes:
+                break
+            # Validators first, so they never refer to a missing body.
+            for path in sorted(paths, key=lambda p: p.suffix != ".json"):
+                path.unlink(missing_ok=True)
+            total_size -= size
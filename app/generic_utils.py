@@ -1,18 +1,27 @@
 # -*- coding: utf-8 -*-
-from bs4 import BeautifulSoup
-import requests
-from functools import wraps
+from functools import lru_cache, wraps
 import time
 from urllib.parse import urlparse
 from pathlib import Path
+import io
 import json
 import os
 import pypdf
 import traceback
+import openai
 from openai import OpenAI
 import logging
 import shutil
 import random
+import threading
+import re
+import bisect
+from concurrent.futures import ThreadPoolExecutor
+import http_utils as hu
+import ocr_utils as ou
+import textrank_utils as tu
+import metrics_utils as mu
+from collections import Counter, defaultdict
 
 
 def get_default_file_and_stream_logger(
@@ -55,8 +64,9 @@ def write_json(data, path):
         f.write(json.dumps(data, indent=4))
 
 
-def with_retry(max_retries=5, retry_wait=3):
-    """Decorator that retries a function call a specified number of times"""
+def with_retry(max_retries=5, retry_wait=3, fatal_exceptions=()):
+    """Decorator that retries a function call a specified number of times.
+    Exceptions of a type in fatal_exceptions are re-raised without retrying."""
 
     def decorator(func):
         @wraps(func)
@@ -66,8 +76,11 @@ def with_retry(max_retries=5, retry_wait=3):
                 try:
                     r = func(*args, **kwargs)
                     break
+                except fatal_exceptions:
+                    raise
                 except Exception as e:
                     if n_retries < max_retries:
+                        mu.metrics.increment(f"retries.{func.__name__}")
                         time.sleep(retry_wait)
                         n_retries += 1
                     else:
@@ -82,19 +95,147 @@ def with_retry(max_retries=5, retry_wait=3):
 
 
 @with_retry(max_retries=5, retry_wait=3)
-def fetch(url):
+def fetch(url, cache_key=None, use_cache=True):
     """
     Send GET request to a specified url and retrieve html as string.
     Raises exception for non-200 status codes.
+    Uses the shared, pooled http client, so connections are kept alive and
+    requests to the same host are rate limited. Unchanged pages are revalidated
+    from the http cache if configured, see http_utils.get for cache_key and
+    use_cache.
     """
-    r = requests.get(url, timeout=10)
+    r = hu.get(url, timeout=10, cache_key=cache_key, use_cache=use_cache)
     r.raise_for_status()
     return r
 
 
-def get_soup(url: str) -> BeautifulSoup:
-    """Get BeautifulSoup object from url."""
-    return BeautifulSoup(fetch(url).text, "html.parser")
+def get_partial_ratio_candidate_pairs(
+    strings: list[str],
+    min_score: float,
+    query_indices: list[int] = None,
+    piece_len: int = 3,
+) -> set[tuple[int, int]]:
+    """Return index pairs (i, j) with i < j of strings that might have a fuzz.partial_ratio
+    of at least min_score. The result is a superset of all such pairs, so the caller still
+    has to compute the actual partial_ratio for each candidate, but can skip all others.
+    If query_indices is given, only pairs involving at least one of these indices are returned.
+
+    Background: partial_ratio aligns the shorter string (needle) with windows of at most
+    the same length in the longer string (haystack). A score of at least min_score means
+    the needle can be turned into such a window with at most
+    d = floor(2 * (1 - min_score / 100) * len(needle)) character insertions/deletions.
+    We cut the needle into p disjoint pieces of piece_len characters. Every edit breaks at
+    most one piece, so at least p - d pieces must appear unchanged in the haystack. We
+    keep the pairs where at least p - d of all pieces of the needle occur in a haystack
+    that is not shorter than the needle.
+
+    Titles share many common pieces like "anfrage von ", so walking a posting list of
+    owners per piece and haystack grows quadratically with the number of strings. Instead,
+    every piece gets a bitset of the haystacks containing it and the hits of a needle are
+    counted for all haystacks at once with a bit-sliced adder, so that a common piece
+    costs a few integer operations per needle instead of one step per haystack.
+    """
+    max_edit_ratio = 2 * (1 - min_score / 100)
+    # Piece string -> number of times it occurs in the needle, per needle.
+    needle_pieces = {}
+    required_hits = {}
+    unindexable = []
+    for owner, string in enumerate(strings):
+        n_pieces = len(string) // piece_len
+        n_edits = int(max_edit_ratio * len(string))
+        if n_pieces <= n_edits:
+            # Too short to guarantee an unchanged piece, compare to everything.
+            unindexable.append(owner)
+            continue
+        needle_pieces[owner] = Counter(
+            string[k * piece_len : (k + 1) * piece_len] for k in range(n_pieces)
+        )
+        required_hits[owner] = n_pieces - n_edits
+
+    def add_pair(pairs, i, j):
+        if i != j:
+            pairs.add((min(i, j), max(i, j)))
+
+    def add_candidate_pairs(pairs, owners, haystacks):
+        if not owners or not haystacks:
+            return
+        # Bit k of contained_in[piece] is set if strings[haystacks[k]] contains piece.
+        pieces = {piece for owner in owners for piece in needle_pieces[owner]}
+        contained_in = defaultdict(lambda: bytearray((len(haystacks) + 7) // 8))
+        for k, haystack in enumerate(haystacks):
+            string = strings[haystack]
+            found = {
+                string[pos : pos + piece_len]
+                for pos in range(len(string) - piece_len + 1)
+            }
+            for piece in found.intersection(pieces):
+                contained_in[piece][k >> 3] |= 1 << (k & 7)
+        contained_in = {
+            piece: int.from_bytes(bits, "little")
+            for piece, bits in contained_in.items()
+        }
+        # Bit k of not_shorter[length] is set if strings[haystacks[k]] has at least
+        # this length.
+        by_length = defaultdict(list)
+        for k, haystack in enumerate(haystacks):
+            by_length[len(strings[haystack])].append(k)
+        lengths = sorted(by_length)
+        not_shorter = {}
+        bits = bytearray((len(haystacks) + 7) // 8)
+        for length in reversed(lengths):
+            for k in by_length[length]:
+                bits[k >> 3] |= 1 << (k & 7)
+            not_shorter[length] = int.from_bytes(bits, "little")
+        all_haystacks = (1 << len(haystacks)) - 1
+        for owner in owners:
+            length = len(strings[owner])
+            pieces = needle_pieces[owner]
+            found = pieces.keys() & contained_in.keys()
+            if (
+                length > lengths[-1]
+                or sum(map(pieces.__getitem__, found)) < required_hits[owner]
+            ):
+                continue
+            # Count the hits per haystack in binary, one bitset per bit, starting at
+            # 2**n_bits - required_hits, so that the carry into the highest bit is set
+            # for exactly the haystacks with at least required_hits hits.
+            n_bits = sum(pieces.values()).bit_length()
+            start = 2**n_bits - required_hits[owner]
+            counter = [all_haystacks if start >> i & 1 else 0 for i in range(n_bits)]
+            counter.append(0)
+            for piece in found:
+                for _ in range(pieces[piece]):
+                    carry = contained_in[piece]
+                    for i in range(len(counter)):
+                        if not carry:
+                            break
+                        counter[i], carry = counter[i] ^ carry, counter[i] & carry
+            min_length = lengths[bisect.bisect_left(lengths, length)]
+            matches = bin(counter[-1] & not_shorter[min_length])[:1:-1]
+            k = matches.find("1")
+            while k != -1:
+                add_pair(pairs, owner, haystacks[k])
+                k = matches.find("1", k + 1)
+
+    # Needles that are queries are compared to all strings, the other needles only
+    # to the queries.
+    queries = set(range(len(strings)) if query_indices is None else query_indices)
+    pairs = set()
+    add_candidate_pairs(
+        pairs,
+        [owner for owner in needle_pieces if owner in queries],
+        list(range(len(strings))),
+    )
+    add_candidate_pairs(
+        pairs,
+        [owner for owner in needle_pieces if owner not in queries],
+        sorted(queries),
+    )
+    for owner in unindexable:
+        for other in range(len(strings)):
+            if owner in queries or other in queries:
+                add_pair(pairs, owner, other)
+    return pairs
 
 
 def get_rightmost_url_part(url):
@@ -112,51 +253,104 @@ def get_url_root(url: str) -> str:
     return urlparse(url).scheme + "://" + urlparse(url).netloc
 
 
-def get_previous_run_json_as_id_dict(file: Path) -> dict:
-    """Load result json file from previous runs if it exists.
-    Returns dict with file id as keys and item dict as values if file exists.
-    Returns empty dict if no file exists.
+def download_and_save_pdf(pdf_url, path, max_bytes=None):
     """
+    Download pdf file from pdf_url with retry logic and save to path.
+    Raises exception for non-200 status codes and for pdfs larger than max_bytes.
+    The pdf is streamed to a partial file next to path, so retries resume the
+    download where it failed, and moved to path once complete.
+    """
+    part_path = path.with_name(f"{path.name}.part")
+    part_path.unlink(missing_ok=True)
+    download = with_retry(
+        max_retries=5, retry_wait=3, fatal_exceptions=(hu.ResponseTooLargeError,)
+    )(hu.download_to_file)
     try:
-        result_json = read_json(file)
-        # The result json has some top level metadata which is not of interest.
-        # We only want the data array, which contains a list of item dicts.
-        return {i["item_id"]: i for i in result_json["data"]}
-    except FileNotFoundError:
-        return {}
+        download(pdf_url, part_path, max_bytes=max_bytes)
+        os.replace(part_path, path)
+    finally:
+        part_path.unlink(missing_ok=True)
 
 
-def download_and_save_pdf(pdf_url, path):
-    """
-    Download pdf file from pdf_url with retry logic and save to path.
-    Raises exception for non-200 status codes.
-    """
-    r = fetch(pdf_url)
-    with open(path, "wb") as f:
-        f.write(r.content)
+def iter_pdf_page_texts_pypdf(pdf_path: Path):
+    """Yield the raw text of each page of a pdf, extracted with pypdf."""
+    with open(pdf_path, "rb") as f:
+        pdf = pypdf.PdfReader(f)
+        for page in pdf.pages:
+            yield page.extract_text()
+
+
+def iter_pdf_page_texts_pymupdf(pdf_path: Path):
+    """Yield the raw text of each page of a pdf, extracted with PyMuPDF, which is
+    several times faster than pypdf but AGPL licensed, so it is an optional
+    dependency (poetry install --extras pymupdf)."""
+    import pymupdf
+
+    with pymupdf.open(pdf_path) as pdf:
+        for page in pdf:
+            yield page.get_text()
+
+
+PDF_TEXT_BACKENDS = {
+    "pypdf": iter_pdf_page_texts_pypdf,
+    "pymupdf": iter_pdf_page_texts_pymupdf,
+}
 
 
-def read_pdf_text(pdf_path: Path) -> str:
-    """Given a path to a pdf file, return the text content of the pdf.
+def get_pdf_text_backend(name: str = "auto"):
+    """Return the page text extractor named name (see PDF_TEXT_BACKENDS). "auto"
+    prefers pymupdf if it is installed and falls back to pypdf."""
+    if name == "auto":
+        try:
+            import pymupdf  # noqa: F401
+
+            name = "pymupdf"
+        except ImportError:
+            name = "pypdf"
+    if name not in PDF_TEXT_BACKENDS:
+        raise ValueError(
+            f"Unknown pdf text backend {name}, expected one of "
+            f"{', '.join(PDF_TEXT_BACKENDS)} or auto."
+        )
+    return PDF_TEXT_BACKENDS[name]
+
+
+def write_pdf_text(
+    pdf_path: Path, f, max_chars: int = None, backend: str = "pypdf"
+) -> int:
+    """Extract the text of a pdf page by page and write it to the text file object f,
+    with all whitespace collapsed to single spaces. Only one page is held in memory at
+    a time. Stops after max_chars characters if given. Returns the number of
+    characters written."""
+    n_chars = 0
+    for page_text in get_pdf_text_backend(backend)(pdf_path):
+        page_text = " ".join(page_text.split())
+        if not page_text:
+            continue
+        if n_chars:
+            page_text = " " + page_text
+        if max_chars is not None and n_chars + len(page_text) >= max_chars:
+            n_chars += f.write(page_text[: max_chars - n_chars])
+            break
+        n_chars += f.write(page_text)
+    return n_chars
+
+
+def read_pdf_text(pdf_path: Path, max_chars: int = None, backend: str = "pypdf") -> str:
+    """Given a path to a pdf file, return the text content of the pdf with all
+    whitespace collapsed to single spaces, at most max_chars characters.
 
     Args:
         path (str): Path to pdf file.
+        max_chars (int): Maximal number of characters to extract, all if None.
+        backend (str): Page text extractor, see get_pdf_text_backend.
 
     Returns:
         str: Content of pdf file.
     """
-    with open(pdf_path, "rb") as f:
-        pdf = pypdf.PdfReader(f)
-        text = (
-            " ".join(page.extract_text() for page in pdf.pages)
-            .replace("\n", " ")
-            .replace("\r", " ")
-            .replace("\t", " ")
-            .strip()
-        )
-        # Get rid of multiple whitespaces using join/split pattern.
-        text = " ".join(text.split())
-    return text
+    text = io.StringIO()
+    write_pdf_text(pdf_path, text, max_chars, backend)
+    return text.getvalue()
 
 
 def clean_text(text: str) -> str:
@@ -165,109 +359,384 @@ def clean_text(text: str) -> str:
     return " ".join(text.split()).strip()
 
 
-def generate_openai_summary(text_to_summarize):
-    """Text summarization in german using ChatGPT API."""
-    client = OpenAI(api_key=os.environ.get("OPENAI_API_KEY"))
-    system_prompt = clean_text(
-        """
-        Als deutschsprachiger Zusammenfassungsroboter erhältst du einen Text und sollst
-        eine prägnante TL;DR (Too Long; Didn't Read)-Zusammenfassung auf Deutsch erstellen.
-        Du darfst höchstens 5 Sätze verwenden. Der Anfang und das Ende des bereitgestellten
-        Textes könnten aus Unsinnswörter oder zufälligen Zeichen bestehen,
-        die ignoriert werden sollten. Die Zusammenfassung endet mit korrekter Interpunktion.
-        Du gibst nur die Zusammenfassung zurück.
-        """
+SUMMARY_SYSTEM_PROMPT = clean_text(
+    """
+    Als deutschsprachiger Zusammenfassungsroboter erhältst du einen Text und sollst
+    eine prägnante TL;DR (Too Long; Didn't Read)-Zusammenfassung auf Deutsch erstellen.
+    Du darfst höchstens 5 Sätze verwenden. Der Anfang und das Ende des bereitgestellten
+    Textes könnten aus Unsinnswörter oder zufälligen Zeichen bestehen,
+    die ignoriert werden sollten. Die Zusammenfassung endet mit korrekter Interpunktion.
+    Du gibst nur die Zusammenfassung zurück.
+    """
+)
+SUMMARY_MODEL = "gpt-3.5-turbo-1106"  # "gpt-4-32k"
+SUMMARY_TEMPERATURE = 0.3
+
+
+# Quota of the OpenAI API, shared by all threads summarizing concurrently.
+OPENAI_REQUESTS_PER_MINUTE = 3500
+OPENAI_TOKENS_PER_MINUTE = 60000
+# Length of a summary in tokens assumed when taking quota for a request. The estimate
+# is corrected with the actual usage reported in the response.
+SUMMARY_EXPECTED_OUTPUT_TOKENS = 300
+
+_openai_client = None
+_openai_client_lock = threading.Lock()
+_openai_limiter = hu.RateLimiter(OPENAI_REQUESTS_PER_MINUTE, OPENAI_TOKENS_PER_MINUTE)
+
+
+def configure_openai(requests_per_minute: float, tokens_per_minute: float) -> None:
+    """Set the quota of the OpenAI API for all following requests."""
+    global _openai_limiter
+    _openai_limiter = hu.RateLimiter(requests_per_minute, tokens_per_minute)
+
+
+def get_openai_client() -> OpenAI:
+    """Return the shared OpenAI client. It does not retry on its own, retries are
+    coordinated with the rate limiter in summarize_chunk."""
+    global _openai_client
+    with _openai_client_lock:
+        if _openai_client is None:
+            _openai_client = OpenAI(
+                api_key=os.environ.get("OPENAI_API_KEY"), max_retries=0
+            )
+        return _openai_client
+
+
+def get_summary_request_body(text: str) -> dict:
+    """Return the body of the chat completion request summarizing text."""
+    return {
+        "model": SUMMARY_MODEL,
+        "messages": [
+            {"role": "system", "content": SUMMARY_SYSTEM_PROMPT},
+            {"role": "user", "content": text},
+        ],
+        "temperature": SUMMARY_TEMPERATURE,
+    }
+
+
+def get_summary_cache_key(summary_cache, text: str) -> str:
+    """Return the key of the summary of text in summary_cache."""
+    return summary_cache.get_key(
+        clean_text(text), SUMMARY_SYSTEM_PROMPT, SUMMARY_MODEL, SUMMARY_TEMPERATURE
     )
-    return (
-        client.chat.completions.create(
-            model="gpt-3.5-turbo-1106",  # "gpt-4-32k",
-            messages=[
-                {"role": "system", "content": system_prompt},
-                {"role": "user", "content": text_to_summarize},
-            ],
-            temperature=0.3,
+
+
+def clean_summary(summary: str) -> str:
+    # ChatGPT might start TL;DR responses with "TL;DR:", which we remove here.
+    return clean_text(summary).replace("TL;DR:", "").strip()
+
+
+def generate_openai_summary(text_to_summarize, summary_cache=None):
+    """Text summarization in german using ChatGPT API.
+    If a summary_cache (cache_utils.SummaryCache) is given, a summary for the same
+    text, prompt, model and temperature is returned from it without calling the API.
+    Requests wait for the quota shared by all threads (see configure_openai).
+    """
+    if summary_cache is not None:
+        cache_key = get_summary_cache_key(summary_cache, text_to_summarize)
+        summary = summary_cache.get(cache_key)
+        if summary is not None:
+            mu.metrics.increment("summary_cache.hits")
+            return summary
+        mu.metrics.increment("summary_cache.misses")
+    estimated_tokens = (
+        count_tokens(SUMMARY_SYSTEM_PROMPT)
+        + count_tokens(text_to_summarize)
+        + SUMMARY_EXPECTED_OUTPUT_TOKENS
+    )
+    with mu.metrics.timer("openai.rate_limit_wait"):
+        _openai_limiter.acquire(estimated_tokens)
+    mu.metrics.increment("openai.requests")
+    with mu.metrics.timer("openai.request"):
+        response = get_openai_client().chat.completions.with_raw_response.create(
+            **get_summary_request_body(text_to_summarize)
+        )
+    remaining = {
+        name: int(response.headers[f"x-ratelimit-remaining-{name}"])
+        for name in ("requests", "tokens")
+        if f"x-ratelimit-remaining-{name}" in response.headers
+    }
+    _openai_limiter.update(remaining.get("requests"), remaining.get("tokens"))
+    completion = response.parse()
+    if completion.usage is not None:
+        _openai_limiter.consume(completion.usage.total_tokens - estimated_tokens)
+        mu.metrics.increment("openai.tokens", completion.usage.total_tokens)
+    summary = completion.choices[0].message.content
+    if summary_cache is not None and summary:
+        summary_cache.put(cache_key, summary)
+    return summary
+
+
+# Context window of SUMMARY_MODEL in tokens, of which SUMMARY_RESERVED_TOKENS are kept
+# free for the summary itself and the message overhead of the chat format.
+SUMMARY_CONTEXT_TOKENS = 16385
+SUMMARY_RESERVED_TOKENS = 1500
+# Number of chunks of a long text that are summarized concurrently.
+SUMMARY_MAP_WORKERS = 4
+# Characters per token assumed if the tokenizer is not available. Conservative for
+# german text, which has about 3 to 4 characters per token.
+SUMMARY_FALLBACK_CHARS_PER_TOKEN = 2
+
+
+_summary_encoding_lock = threading.Lock()
+
+
+@lru_cache(maxsize=1)
+def _load_summary_encoding():
+    """Return the tiktoken encoding of SUMMARY_MODEL or None if it is not available.
+    tiktoken downloads the encoding on first use, which fails without network access."""
+    try:
+        import tiktoken
+
+        return tiktoken.encoding_for_model(SUMMARY_MODEL)
+    except Exception:
+        logging.getLogger(__name__).warning(
+            "Tokenizer not available, estimating token counts from text length."
         )
-        .choices[0]
-        .message.content
+        return None
+
+
+def get_summary_encoding():
+    with _summary_encoding_lock:
+        return _load_summary_encoding()
+
+
+def count_tokens(text: str) -> int:
+    """Return the number of tokens of text for SUMMARY_MODEL."""
+    encoding = get_summary_encoding()
+    if encoding is None:
+        return len(text) // SUMMARY_FALLBACK_CHARS_PER_TOKEN + 1
+    return len(encoding.encode(text, disallowed_special=()))
+
+
+def get_summary_max_chunk_tokens() -> int:
+    """Return the number of tokens of the longest text that can be summarized in a
+    single request."""
+    return (
+        SUMMARY_CONTEXT_TOKENS
+        - SUMMARY_RESERVED_TOKENS
+        - count_tokens(SUMMARY_SYSTEM_PROMPT)
     )
 
 
-def summarize_text(text, max_attempts=5):
-    """Given a text, return a summary of the text using ChatGPT API.
-    Requiers OPENAI_API_KEY env variable to be set."""
+def split_text_into_chunks(text: str, max_tokens: int) -> list[str]:
+    """Split text into chunks of at most max_tokens tokens. Chunks end at sentence
+    boundaries, only sentences longer than max_tokens are split between words."""
+    chunks = []
+    chunk, chunk_tokens = [], 0
+    for sentence in re.split(r"(?<=[.!?])\s+", text):
+        # Count the separating space as well, so the joined chunk never exceeds.
+        sentence_tokens = count_tokens(sentence) + 1
+        if sentence_tokens > max_tokens:
+            pieces = sentence.split()
+        else:
+            pieces = [sentence]
+        for piece in pieces:
+            piece_tokens = (
+                sentence_tokens if len(pieces) == 1 else count_tokens(piece) + 1
+            )
+            if chunk and chunk_tokens + piece_tokens > max_tokens:
+                chunks.append(" ".join(chunk))
+                chunk, chunk_tokens = [], 0
+            chunk.append(piece)
+            chunk_tokens += piece_tokens
+    if chunk:
+        chunks.append(" ".join(chunk))
+    return chunks
+
+
+def summarize_chunk(text, max_attempts=5, summary_cache=None):
+    """Given a text that fits into the context of SUMMARY_MODEL, return its summary
+    using ChatGPT API, retrying on errors."""
     attempt = 0
     while True:
         attempt += 1
         try:
-            summary = generate_openai_summary(text)
+            summary = generate_openai_summary(text, summary_cache=summary_cache)
             break
         except Exception as e:
-            # There are many things that can go wrong here, some of them are our fault (too many tokens), but
-            # openai has also been wonky due to server overload. Therefore, we need some retry logic here.
-            # We distinguish between openai errors and non-openai errors. In most cases we just sleep and retry,
-            # following a kinda exponential backoff, example for 6 attempts: 4, 8, 16, 32, 64, 128s with minimal randomness.
-            # In case of too many input tokens, we recursively split the text and
-            # summarize each part, which in case is then summarized again.
-            if attempt > max_attempts:
+            # Openai has been wonky due to server overload. Therefore, we need some retry logic here.
+            # We just sleep and retry, following a kinda exponential backoff,
+            # example for 6 attempts: 4, 8, 16, 32, 64, 128s with minimal randomness.
+            # If we hit the rate limit, all threads pause for as long as the server
+            # asks for, so they do not keep running into it.
+            if (
+                attempt > max_attempts
+                or getattr(e, "code", None) == "insufficient_quota"
+            ):
                 raise Exception(
-                    f"Failed to summarize text after {max_attempts} attempts! Last exception: {e} - {traceback.format_exc()}"
-                )
-            elif "Please reduce the length of the messages." in str(e):
-                text = (
-                    summarize_text(text[: len(text) // 2])
-                    + ". "
-                    + summarize_text(text[len(text) // 2 :])
+                    f"Failed to summarize text after {attempt} attempts! Last exception: {e} - {traceback.format_exc()}"
                 )
+            mu.metrics.increment("retries.summarize_chunk")
+            backoff = 2 * 2**attempt + 2 * random.random()
+            if isinstance(e, openai.RateLimitError):
+                mu.metrics.increment("openai.rate_limited")
+                retry_after = hu.get_retry_after_seconds(e.response.headers)
+                if retry_after is not None:
+                    backoff = retry_after + random.random()
+                _openai_limiter.pause(backoff)
             else:
-                time.sleep(2 * 2**attempt + 2 * random.random())
-    # ChatGPT might start TL;DR responses with "TL;DR:", which we remove here.
-    return clean_text(summary).replace("TL;DR:", "").strip()
+                time.sleep(backoff)
+    return clean_summary(summary)
 
 
-def create_pdf_summary(pdf_url: str, pdf_tmp_directory: Path) -> str:
-    """Given an url pointing to a pdf file, return a summary of its content.
-    This function will apply OCR if needed and use ChatGPT API for summarization.
+# Summarization backends: "openai" (ChatGPT API) or "textrank" (extractive, local).
+SUMMARY_BACKENDS = ("openai", "textrank")
+_summary_backend = "openai"
 
-    Args:
-        pdf_url (str): url to pdf file
 
-    Returns:
-        str: summary of pdf content.
-    """
+def configure_summary_backend(name: str) -> None:
+    """Set the summarization backend (see SUMMARY_BACKENDS) used by summarize_text."""
+    global _summary_backend
+    if name not in SUMMARY_BACKENDS:
+        raise ValueError(
+            f"Unknown summary backend {name}, expected one of {', '.join(SUMMARY_BACKENDS)}."
+        )
+    _summary_backend = name
 
-    pdf_id = get_rightmost_url_part(pdf_url)
-    tmp_pdf_path = pdf_tmp_directory / f"{pdf_id}.pdf"
-    download_and_save_pdf(pdf_url, tmp_pdf_path)
-    ocr_pdf_german_inplace(tmp_pdf_path)
-    text = read_pdf_text(tmp_pdf_path)
-    assert text, "Error in read_pdf_text: PDF text was empty!"
-    summary = summarize_text(text)
-    assert summary, "PDF summary was empty!"
-    return summary
 
+def summarize_text(text, max_attempts=5, summary_cache=None, max_chunk_tokens=None):
+    """Given a text, return a summary of the text using the configured backend
+    (see configure_summary_backend). The openai backend uses the ChatGPT API and
+    requiers OPENAI_API_KEY env variable to be set, the textrank backend runs
+    locally on the whole text (see textrank_utils.summarize_text).
 
-def ocr_pdf_german_inplace(pdf_path: Path):
-    tmp_pdf_path_aux = None
+    Tokens are counted before sending, so the API never rejects a text as too long.
+    A text that does not fit into the context of the model (or into max_chunk_tokens)
+    is split into chunks at sentence boundaries, which are summarized concurrently
+    (map). The joined partial summaries are then summarized again (reduce), repeatedly
+    if they are still too long. Summaries, including the ones of chunks, are looked up
+    in and added to summary_cache if given.
+    """
+    if _summary_backend == "textrank":
+        return tu.summarize_text(text)
+    if max_chunk_tokens is None:
+        max_chunk_tokens = get_summary_max_chunk_tokens()
+    while count_tokens(text) > max_chunk_tokens:
+        chunks = split_text_into_chunks(text, max_chunk_tokens)
+        with ThreadPoolExecutor(min(SUMMARY_MAP_WORKERS, len(chunks))) as pool:
+            summaries = pool.map(
+                lambda chunk: summarize_chunk(chunk, max_attempts, summary_cache),
+                chunks,
+            )
+            text = " ".join(summaries)
+    return summarize_chunk(text, max_attempts, summary_cache)
+
+
+# A page has a usable text layer if it contains at least this many non-whitespace
+# characters, of which at least this share is alphanumeric (and not OCR garbage).
+OCR_MIN_CHARS_PER_PAGE = 100
+OCR_MIN_ALNUM_RATIO = 0.5
+
+
+def get_pages_without_text(pdf_path: Path) -> tuple[int, list[int]]:
+    """Return the number of pages of a pdf and the 1-based numbers of the pages
+    without a usable text layer, which need OCR."""
+    with open(pdf_path, "rb") as f:
+        pdf = pypdf.PdfReader(f)
+        pages_without_text = []
+        for page_number, page in enumerate(pdf.pages, 1):
+            try:
+                text = "".join(page.extract_text().split())
+            except Exception:
+                text = ""
+            n_alnum = sum(c.isalnum() for c in text)
+            if len(
+                text
+            ) < OCR_MIN_CHARS_PER_PAGE or n_alnum < OCR_MIN_ALNUM_RATIO * len(text):
+                pages_without_text.append(page_number)
+        return len(pdf.pages), pages_without_text
+
+
+def ocr_pdf_german_inplace(
+    pdf_path: Path,
+    engine: str = "single",
+    pages_per_chunk: int = 20,
+    timeout=600,
+    **limits,
+) -> dict:
+    """Apply OCR to the pages of a pdf without usable text layer in-place.
+
+    With engine "single" the pdf is OCR'd by a single ocrmypdf process. With engine
+    "page_parallel" pdfs with more than pages_per_chunk pages are split into chunks,
+    which are OCR'd in parallel (see ocr_utils.ocr_pdf_page_parallel). Every external
+    command is stopped after timeout seconds and limited by limits (max_cpu_seconds,
+    max_memory_bytes, see ocr_utils.run_command).
+    Returns statistics {"pages": ..., "pages_ocr": ..., "ocr_seconds": ...,
+    "ocr_errors": [...], "commands": [...]}, where pages is None if the pdf could not
+    be read before OCR and commands are the results of all external commands.
+    """
+    start = time.perf_counter()
+    # Born-digital pdfs already have a good text layer, OCR would only cost time.
+    # If pypdf cannot read the pdf, OCR everything as ghostscript might repair it.
+    try:
+        n_pages, pages_ocr = get_pages_without_text(pdf_path)
+    except Exception:
+        n_pages, pages_ocr = None, None
+    if pages_ocr == []:
+        return {
+            "pages": n_pages,
+            "pages_ocr": 0,
+            "ocr_seconds": 0.0,
+            "ocr_errors": [],
+            "commands": [],
+        }
+    ocr_errors = []
+    commands = []
+    tmp_pdf_path_aux = pdf_path.with_name(f"{pdf_path.stem}_aux.pdf")
+    tmp_pdf_path_ocr = pdf_path.with_name(f"{pdf_path.stem}_ocr.pdf")
     try:
         # Perform OCR on PDF file:
         # Firstly, rewrite file with ghostscript, because it seems to decrease errors when using ocrmypdf:
         # https://ocrmypdf.readthedocs.io/en/latest/errors.html#input-file-filename-is-not-a-valid-pdf
-        # Then perform OCR (german) in-place. If this does not work it is okay,
-        # and we will just try to read the original PDF below.
+        # Then perform OCR (german) of the pages without text, the others keep their
+        # text layer. The result only replaces the original file if OCR succeeded.
+        # If this does not work it is okay, and we will just try to read the original
+        # PDF below, but the errors are reported.
         # Implementation note:
         # It seems ghostscript cannot read and write to same file, so introduce another temporary file here
-        # which is then used for ocrmypdf. Output of ocrmypdf will then overwrite orignal file. That way
-        # the downstream code can just use the original file path, no matter if OCR was applied or not.
-        pdf_id = pdf_path.stem
-        directory = pdf_path.parent
-        tmp_pdf_path_aux = directory / f"{pdf_id}_aux.pdf"
-        os.system(f"gs -q -o {tmp_pdf_path_aux} -dSAFER -sDEVICE=pdfwrite {pdf_path}")
-        os.system(
-            f"ocrmypdf -q --output-type pdf --redo-ocr -l deu {tmp_pdf_path_aux} {pdf_path}"
-        )
+        # which is then used for ocrmypdf. That way the downstream code can just use the original file path,
+        # no matter if OCR was applied or not.
+        try:
+            commands.append(
+                ou.rewrite_pdf_with_ghostscript(
+                    pdf_path, tmp_pdf_path_aux, timeout, **limits
+                )
+            )
+            ocr_input_path = tmp_pdf_path_aux
+        except ou.CommandError as e:
+            commands.append(e.result)
+            ocr_input_path = pdf_path
+        if engine == "page_parallel" and n_pages and n_pages > pages_per_chunk:
+            commands += ou.ocr_pdf_page_parallel(
+                ocr_input_path,
+                tmp_pdf_path_ocr,
+                pages_ocr,
+                pages_per_chunk,
+                timeout,
+                **limits,
+            )
+        else:
+            commands.append(
+                ou.ocrmypdf_german(
+                    ocr_input_path, tmp_pdf_path_ocr, pages_ocr, timeout, **limits
+                )
+            )
+        os.replace(tmp_pdf_path_ocr, pdf_path)
+    except ou.CommandError as e:
+        commands.append(e.result)
     except Exception as e:
-        pass
+        ocr_errors.append(str(e))
     finally:
-        # Remove temporary file in any case if exists.
-        if tmp_pdf_path_aux and tmp_pdf_path_aux.exists():
-            tmp_pdf_path_aux.unlink()
+        # Remove temporary files in any case if they exist.
+        tmp_pdf_path_aux.unlink(missing_ok=True)
+        tmp_pdf_path_ocr.unlink(missing_ok=True)
+    return {
+        "pages": n_pages,
+        "pages_ocr": len(pages_ocr) if pages_ocr is not None else n_pages,
+        "ocr_seconds": time.perf_counter() - start,
+        "ocr_errors": [c["error"] for c in commands if c["status"] != "OK"]
+        + ocr_errors,
+        "commands": commands,
+    }
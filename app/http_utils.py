@@ -0,0 +1,266 @@
+# -*- coding: utf-8 -*-
+import re
+import threading
+import time
+from pathlib import Path
+from collections import defaultdict
+from contextlib import contextmanager
+from urllib.parse import urlparse
+
+import httpx
+
+import cache_utils as cu
+import metrics_utils as mu
+
+# Politeness defaults towards a single host: at most this many concurrent requests
+# and at least this many seconds between the start of two requests.
+MAX_CONNECTIONS_PER_HOST = 4
+MIN_REQUEST_INTERVAL = 0.2
+
+
+class ResponseTooLargeError(Exception):
+    """Raised if a download exceeds its size limit."""
+
+
+class HostLimiter:
+    """Per-host concurrency limit and minimal interval between request starts,
+    shared by all threads. Use as `with limiter.limit(url): ...`."""
+
+    def __init__(self, max_concurrent: int, min_interval: float):
+        self.max_concurrent = max_concurrent
+        self.min_interval = min_interval
+        self._lock = threading.Lock()
+        self._semaphores = defaultdict(
+            lambda: threading.BoundedSemaphore(self.max_concurrent)
+        )
+        self._next_start = defaultdict(float)
+
+    def _reserve_start(self, host: str) -> float:
+        """Reserve the next start slot of host and return how long to wait for it."""
+        with self._lock:
+            now = time.monotonic()
+            start = max(now, self._next_start[host])
+            self._next_start[host] = start + self.min_interval
+            return start - now
+
+    @contextmanager
+    def limit(self, url: str):
+        host = urlparse(url).netloc
+        with self._lock:
+            semaphore = self._semaphores[host]
+        with semaphore:
+            time.sleep(self._reserve_start(host))
+            yield
+
+
+class RateLimiter:
+    """Token buckets for requests per minute and tokens per minute of an API quota,
+    shared by all threads. Callers block in acquire until both buckets allow their
+    request. If the server reports a rate limit, pause stops all callers and update
+    aligns the buckets with the remaining quota reported by the server."""
+
+    def __init__(self, requests_per_minute: float, tokens_per_minute: float):
+        self.requests_per_minute = requests_per_minute
+        self.tokens_per_minute = tokens_per_minute
+        self._lock = threading.Lock()
+        self._requests = requests_per_minute
+        self._tokens = tokens_per_minute
+        self._last_refill = time.monotonic()
+        self._paused_until = 0.0
+
+    def _refill(self, now: float) -> None:
+        minutes = (now - self._last_refill) / 60
+        self._requests = min(
+            self.requests_per_minute,
+            self._requests + minutes * self.requests_per_minute,
+        )
+        self._tokens = min(
+            self.tokens_per_minute, self._tokens + minutes * self.tokens_per_minute
+        )
+        self._last_refill = now
+
+    def acquire(self, tokens: int) -> None:
+        """Block until a request using tokens tokens is allowed and take them."""
+        # Larger requests could never be allowed, let them through once the bucket
+        # is full.
+        tokens = min(tokens, self.tokens_per_minute)
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._refill(now)
+                wait = max(
+                    self._paused_until - now,
+                    (1 - self._requests) / self.requests_per_minute * 60,
+                    (tokens - self._tokens) / self.tokens_per_minute * 60,
+                )
+                if wait <= 0:
+                    self._requests -= 1
+                    self._tokens -= tokens
+                    return
+            time.sleep(wait)
+
+    def consume(self, tokens: int) -> None:
+        """Take additional tokens (or give back, if negative), e.g. when the actual
+        usage of a request differs from the estimate passed to acquire."""
+        with self._lock:
+            self._tokens -= tokens
+
+    def update(self, remaining_requests: int = None, remaining_tokens: int = None):
+        """Lower the buckets to the remaining quota reported by the server, which
+        also counts requests of other clients using the same quota."""
+        with self._lock:
+            self._refill(time.monotonic())
+            if remaining_requests is not None:
+                self._requests = min(self._requests, remaining_requests)
+            if remaining_tokens is not None:
+                self._tokens = min(self._tokens, remaining_tokens)
+
+    def pause(self, seconds: float) -> None:
+        """Let no request start during the next seconds."""
+        with self._lock:
+            self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+
+
+def get_retry_after_seconds(headers) -> float | None:
+    """Return how long to wait before retrying according to the Retry-After header
+    (in seconds) or the rate limit reset headers of the OpenAI API (e.g. "6m0s",
+    "1.5s" or "20ms"). Returns None if there is no such header."""
+    if "retry-after" in headers:
+        try:
+            return float(headers["retry-after"])
+        except ValueError:
+            pass
+    waits = []
+    for name in ("x-ratelimit-reset-requests", "x-ratelimit-reset-tokens"):
+        value = headers.get(name)
+        if not value:
+            continue
+        seconds = 0.0
+        for number, unit in re.findall(r"([\d.]+)(ms|h|m|s)", value):
+            seconds += float(number) * {"ms": 0.001, "s": 1, "m": 60, "h": 3600}[unit]
+        waits.append(seconds)
+    return max(waits) if waits else None
+
+
+_client = None
+_client_lock = threading.Lock()
+_limiter = HostLimiter(MAX_CONNECTIONS_PER_HOST, MIN_REQUEST_INTERVAL)
+_http_cache = None
+
+
+def configure(
+    max_connections_per_host: int,
+    min_request_interval: float,
+    cache_directory: Path = None,
+    cache_max_size_bytes: int = None,
+) -> None:
+    """Set the politeness limits for all following requests. Must be called before
+    the first request, as the connection pool is sized accordingly. If cache_directory
+    is given, responses of get are cached there and revalidated with conditional
+    requests, evicting the least recently used ones beyond cache_max_size_bytes."""
+    global _limiter, _http_cache, MAX_CONNECTIONS_PER_HOST, MIN_REQUEST_INTERVAL
+    MAX_CONNECTIONS_PER_HOST = max_connections_per_host
+    MIN_REQUEST_INTERVAL = min_request_interval
+    _limiter = HostLimiter(max_connections_per_host, min_request_interval)
+    _http_cache = (
+        cu.HttpCache(cache_directory, max_size_bytes=cache_max_size_bytes)
+        if cache_directory
+        else None
+    )
+
+
+def _get_limits() -> httpx.Limits:
+    # Keep connections to a host alive, so e.g. detail pages and pdfs of the same
+    # site reuse established TLS connections.
+    return httpx.Limits(
+        max_connections=None,
+        max_keepalive_connections=4 * MAX_CONNECTIONS_PER_HOST,
+        keepalive_expiry=30,
+    )
+
+
+def get_client() -> httpx.Client:
+    """Return the shared, thread-safe http client with connection pooling."""
+    global _client
+    with _client_lock:
+        if _client is None:
+            _client = httpx.Client(limits=_get_limits(), follow_redirects=True)
+        return _client
+
+
+def get(
+    url: str, timeout: float = 10, cache_key: str = None, use_cache: bool = True
+) -> httpx.Response:
+    """Send GET request using the shared client, respecting the per-host limits.
+
+    If an http cache is configured, a cached response is revalidated with a conditional
+    request. If the server answers 304 Not Modified, the cached response is returned
+    as 200 response with response.extensions["from_cache"] set to True. cache_key
+    defaults to url, pass a different one for urls with volatile parts like tokens.
+    Pass use_cache=False for pages that must always be transferred, e.g. because
+    they embed a token that changes even if the server reports them as unchanged.
+    """
+    cache_key = cache_key or url
+    http_cache = _http_cache if use_cache else None
+    headers = http_cache.get_conditional_headers(cache_key) if http_cache else {}
+    with _limiter.limit(url), mu.metrics.timer("http.get"):
+        r = get_client().get(url, headers=headers, timeout=timeout)
+    mu.metrics.increment("http.requests")
+    mu.metrics.increment("http.bytes_downloaded", len(r.content))
+    if http_cache is None:
+        return r
+    if r.status_code == 304:
+        cached = http_cache.get(cache_key)
+        if cached is not None:
+            mu.metrics.increment("http_cache.hits")
+            cached_headers, body = cached
+            return httpx.Response(
+                200,
+                headers=cached_headers,
+                content=body,
+                request=r.request,
+                extensions={"from_cache": True},
+            )
+    elif r.status_code == 200:
+        mu.metrics.increment("http_cache.misses")
+        http_cache.put(cache_key, r.headers, r.content)
+    return r
+
+
+def download_to_file(
+    url: str, path: Path, max_bytes: int = None, timeout: float = 10
+) -> None:
+    """Stream the response body of url to path in chunks, without holding it in memory.
+    If path already contains the beginning of the body from a failed attempt, only the
+    rest is requested with a Range header and appended. Servers that ignore the Range
+    header send the whole body, which then replaces the partial file.
+    Raises ResponseTooLargeError if the body is larger than max_bytes and an
+    httpx.HTTPStatusError for error status codes.
+    """
+    path = Path(path)
+    offset = path.stat().st_size if path.exists() else 0
+    headers = {"Range": f"bytes={offset}-"} if offset else {}
+    mu.metrics.increment("http.requests")
+    with _limiter.limit(url), mu.metrics.timer("http.download"):
+        with get_client().stream("GET", url, headers=headers, timeout=timeout) as r:
+            if offset and r.status_code == 416:
+                # The partial file already contains the whole body.
+                return
+            r.raise_for_status()
+            if r.status_code != 206:
+                offset = 0
+            size = offset + int(r.headers.get("Content-Length", 0))
+            if max_bytes and size > max_bytes:
+                raise ResponseTooLargeError(
+                    f"{url} has {size} bytes, more than the limit of {max_bytes} bytes."
+                )
+            with open(path, "ab" if offset else "wb") as f:
+                for chunk in r.iter_bytes(1024 * 1024):
+                    offset += len(chunk)
+                    # Content-Length might be missing or wrong, check while streaming.
+                    if max_bytes and offset > max_bytes:
+                        raise ResponseTooLargeError(
+                            f"{url} has more than the limit of {max_bytes} bytes."
+                        )
+                    f.write(chunk)
+                    mu.metrics.increment("http.bytes_downloaded", len(chunk))
@@ -1,6 +1,14 @@
 # -*- coding: utf-8 -*-
 import generic_utils as gu
 import schlieren_utils as su
+import pipeline_utils as pu
+import cache_utils as cu
+import store_utils as st
+import http_utils as hu
+import batch_utils as bu
+import metrics_utils as mu
+import search_utils as sr
+import retrieval_utils as ru
 
 import traceback
 from pathlib import Path
@@ -12,8 +20,104 @@ import shutil
 table_url = "https://www.schlieren.ch/politbusiness"
 data_directory = Path("../dev/data")
 pdf_tmp_directory = data_directory / "pdf"
+pdf_cache_directory = data_directory / "pdf_cache"
+http_cache_directory = data_directory / "http_cache"
+summary_cache_db = data_directory / "summary_cache.sqlite"
+summary_batch_directory = data_directory / "summary_batches"
+metrics_directory = data_directory / "metrics"
 frontend_directory = Path("../dev/frontend")
 result_json = data_directory / "items.json"
+items_db = data_directory / "items.sqlite"
+passages_db = data_directory / "passages.sqlite"
+jobs_db = data_directory / "jobs.sqlite"
+
+# Pipeline configuration. In sequential mode (default) items are processed strictly
+# one after another. In staged mode several items are processed concurrently, each
+# stage with its own bounded worker pool: threads for fetching detail pages and pdfs,
+# processes for OCR and text extraction and a separately throttled thread pool for
+# OpenAI summaries.
+pipeline_mode = os.getenv("PIPELINE_MODE", "sequential")
+pipeline_network_workers = int(os.getenv("PIPELINE_NETWORK_WORKERS", "8"))
+pipeline_ocr_workers = int(os.getenv("PIPELINE_OCR_WORKERS", str(os.cpu_count() or 1)))
+pipeline_summary_workers = int(os.getenv("PIPELINE_SUMMARY_WORKERS", "2"))
+
+# Politeness limits for requests to the same host, shared by all network workers.
+http_max_connections_per_host = int(os.getenv("HTTP_MAX_CONNECTIONS_PER_HOST", "4"))
+http_min_request_interval = float(os.getenv("HTTP_MIN_REQUEST_INTERVAL", "0.2"))
+
+# Quota of the OpenAI account, shared by all summary workers. Set it to the limits of
+# the account's usage tier to get close to them without running into rate limits.
+openai_requests_per_minute = float(os.getenv("OPENAI_REQUESTS_PER_MINUTE", "3500"))
+openai_tokens_per_minute = float(os.getenv("OPENAI_TOKENS_PER_MINUTE", "60000"))
+
+# Summary backend: "openai" summarizes with the ChatGPT API, "textrank" extracts the
+# most central sentences locally on the CPU, without network access or costs.
+summary_backend = os.getenv("SUMMARY_BACKEND", "openai")
+
+# Summary mode: "online" summarizes every item right away. "batch" is meant for
+# backfills: items are only enqueued while processing and summarized all at once at
+# the end of the run with the SUMMARY_BATCH_BACKEND ("openai" for the cheaper OpenAI
+# batch API, "local" for single requests), which is polled every
+# SUMMARY_BATCH_POLL_SECONDS.
+summary_mode = os.getenv("SUMMARY_MODE", "online")
+summary_batch_backend = os.getenv("SUMMARY_BATCH_BACKEND", "openai")
+summary_batch_poll_seconds = float(os.getenv("SUMMARY_BATCH_POLL_SECONDS", "60"))
+if summary_mode not in ("online", "batch"):
+    raise ValueError(f"Unknown SUMMARY_MODE {summary_mode}, expected online or batch.")
+if summary_mode == "batch" and summary_backend != "openai":
+    raise ValueError("SUMMARY_MODE batch requires SUMMARY_BACKEND openai.")
+if summary_batch_backend not in ("openai", "local"):
+    raise ValueError(
+        f"Unknown SUMMARY_BATCH_BACKEND {summary_batch_backend}, expected openai or local."
+    )
+
+# OCR engine: "single" runs one ocrmypdf process per pdf, "page_parallel" splits pdfs
+# with more than OCR_PAGES_PER_CHUNK pages into chunks, which are OCR'd in parallel on
+# all cores. As this already uses all cores, combine it with PIPELINE_OCR_WORKERS=1.
+# Every OCR command is stopped after OCR_TIMEOUT seconds and killed by the kernel if a
+# process uses more than OCR_MAX_CPU_SECONDS cpu time or OCR_MAX_MEMORY_MB memory.
+ocr_engine = os.getenv("OCR_ENGINE", "single")
+ocr_pages_per_chunk = int(os.getenv("OCR_PAGES_PER_CHUNK", "20"))
+ocr_timeout = float(os.getenv("OCR_TIMEOUT", "600"))
+ocr_max_cpu_seconds = int(os.getenv("OCR_MAX_CPU_SECONDS", "1200"))
+ocr_max_memory_mb = int(os.getenv("OCR_MAX_MEMORY_MB", "4096"))
+if ocr_engine not in ("single", "page_parallel"):
+    raise ValueError(
+        f"Unknown OCR_ENGINE {ocr_engine}, expected single or page_parallel."
+    )
+
+# Text extraction: PDF_TEXT_BACKEND is pypdf, pymupdf (faster, optional dependency) or
+# auto (pymupdf if installed). If PDF_MAX_TEXT_CHARS is set, the text of a pdf is
+# truncated after that many characters.
+pdf_text_backend = os.getenv("PDF_TEXT_BACKEND", "pypdf")
+pdf_max_text_chars = int(os.getenv("PDF_MAX_TEXT_CHARS", "0")) or None
+# Fail early on an unknown backend.
+gu.get_pdf_text_backend(pdf_text_backend)
+
+# Larger pdfs are not downloaded and the item ends up with status ERROR.
+pdf_max_mb = int(os.getenv("PDF_MAX_MB", "200"))
+
+# OCR'd pdfs and their text are cached across runs, so retries of failed items and
+# documents shared by several items do not go through OCR again.
+pdf_cache_max_mb = int(os.getenv("PDF_CACHE_MAX_MB", "2048"))
+# Table and detail pages kept for conditional requests, least recently used first out.
+http_cache_max_mb = int(os.getenv("HTTP_CACHE_MAX_MB", "512"))
+
+# Frontend export: "json" writes all items into a single items_slim.json, "sharded"
+# additionally writes columnar, dictionary encoded and precompressed files per year
+# to frontend/data, of which the table page loads the newest year first and the
+# others on demand. items_slim.json is always written, because the logs page and
+# assistant/setup_assistant.py read it.
+frontend_export = os.getenv("FRONTEND_EXPORT", "json")
+if frontend_export not in ("json", "sharded"):
+    raise ValueError(
+        f"Unknown FRONTEND_EXPORT {frontend_export}, expected json or sharded."
+    )
+
+# Items that fail are retried in later runs with exponential backoff, starting after
+# RETRY_BACKOFF_HOURS and doubling with every failure up to RETRY_MAX_BACKOFF_HOURS.
+retry_backoff_hours = float(os.getenv("RETRY_BACKOFF_HOURS", "12"))
+retry_max_backoff_hours = float(os.getenv("RETRY_MAX_BACKOFF_HOURS", "720"))
 
 # Setup
 logger = gu.get_default_file_and_stream_logger("politdocs", data_directory)
@@ -21,53 +125,125 @@ logger.info(
     f"Creating data directory {data_directory.absolute()} and pdf tmp directory {pdf_tmp_directory.absolute()}."
 )
 gu.create_directory(data_directory, purge=False)
-gu.create_directory(pdf_tmp_directory, purge=True)
+# Pdfs of items that were downloaded but not yet OCR'd are kept for resumed jobs.
+gu.create_directory(pdf_tmp_directory, purge=False)
 gu.create_directory(frontend_directory, purge=True)
-result_dict = {
+# Table and detail pages are revalidated with conditional requests, so unchanged
+# pages are not transferred again.
+hu.configure(
+    http_max_connections_per_host,
+    http_min_request_interval,
+    cache_directory=http_cache_directory,
+    cache_max_size_bytes=http_cache_max_mb * 2**20,
+)
+gu.configure_openai(openai_requests_per_minute, openai_tokens_per_minute)
+gu.configure_summary_backend(summary_backend)
+pdf_cache = cu.PdfCache(pdf_cache_directory, max_size_bytes=pdf_cache_max_mb * 2**20)
+# Summaries are cached by text, prompt, model and temperature, so reruns do not call
+# the OpenAI API again for texts that were already summarized.
+summary_cache = cu.SummaryCache(summary_cache_db)
+batch_summarizer = bu.BatchSummarizer(
+    bu.OpenAIBatchBackend()
+    if summary_batch_backend == "openai"
+    else bu.LocalBatchBackend(),
+    summary_batch_directory,
+    summary_cache=summary_cache,
+    poll_interval=summary_batch_poll_seconds,
+)
+# Processed items are persisted one by one in the item store. items.json is only
+# exported from it at the end of a run.
+item_store = st.ItemStore(items_db)
+# Items that are not processed successfully yet are jobs in a persistent queue, which
+# records the last finished stage of every item, so a restarted run resumes there.
+job_queue = st.JobQueue(
+    jobs_db,
+    backoff_seconds=retry_backoff_hours * 3600,
+    max_backoff_seconds=retry_max_backoff_hours * 3600,
+)
+resumable_pdfs = job_queue.get_item_ids("downloaded")
+for pdf_path in pdf_tmp_directory.glob("*.pdf"):
+    if pdf_path.stem not in resumable_pdfs:
+        pdf_path.unlink()
+result_metadata = {
     "processed_asof": datetime.datetime.now().strftime("%Y-%m-%d"),
     "version": os.getenv(
         "VERSION",
         "You should not see this, because a VERSION env variable should always be set.",
     ),
-    "data": [],
 }
 
+if pipeline_mode == "staged":
+    stage_pools = pu.StagePools(
+        network_workers=pipeline_network_workers,
+        cpu_workers=pipeline_ocr_workers,
+        summary_workers=pipeline_summary_workers,
+    )
+    # Enough items in flight to keep every pool busy.
+    pipeline_max_in_flight = (
+        pipeline_network_workers + pipeline_ocr_workers + pipeline_summary_workers
+    )
+elif pipeline_mode == "sequential":
+    stage_pools = pu.StagePools()
+    pipeline_max_in_flight = 1
+else:
+    raise ValueError(
+        f"Unknown PIPELINE_MODE {pipeline_mode}, expected sequential or staged."
+    )
+
 # Create backup of previous run, so we (hopefully) never lose data.
 logger.info(f"Creating backup of previous run at {result_json.absolute().parent}")
 if result_json.exists():
     shutil.copy(result_json, result_json.with_suffix(".json.bak"))
+    # Runs before the item store existed only left items.json, start from it.
+    if not len(item_store):
+        logger.info(f"Importing {result_json.absolute()} into empty item store.")
+        item_store.import_json(result_json)
+item_store.backup(items_db.with_suffix(".sqlite.bak"))
 
 # Processing
 logger.info(f"Fetching data from {table_url}.")
-table_soup = su.get_full_table_soup(table_url)
+table_html = su.get_full_table_html(table_url)
+
+logger.info(f"Load index of items from previous runs if any to avoid redundant work.")
+# Only status, title and related_items are loaded for every item, full items are
+# only loaded from the item store when they are exported.
+prev_run = item_store.get_index()
 
 logger.info(f"Extracting items from {table_url} and idenfitfying related items.")
 table_root_url = gu.get_url_root(table_url)
-items_raw = su.extract_items(table_soup, table_root_url)
-su.add_response_links_inplace(items_raw)
+items_raw = su.extract_items(table_html, table_root_url)
+# Only new or renamed items are compared against all others, links between
+# items already known from the previous run are reused.
+su.add_response_links_inplace(items_raw, prev_run)
+# Stored items that are not processed in this run, e.g. because they wait for their
+# retry backoff, still get the links and position of the current table.
+item_store.update_links(items_raw)
+
+# Items processed successfully before stay in the item store as they are, only
+# their links and position were updated above. All others are jobs: new items
+# first, failed items only once their backoff has passed.
+open_item_ids = [
+    item_raw["item_id"]
+    for item_raw in items_raw
+    if prev_run.get(item_raw["item_id"], {}).get("status") != "OK"
+]
+n_new_jobs = job_queue.add_missing(open_item_ids)
+due_item_ids = job_queue.get_due(open_item_ids)
+logger.info(
+    f"{len(open_item_ids)} items to process ({n_new_jobs} new), of which "
+    f"{len(open_item_ids) - len(due_item_ids)} wait for their retry backoff."
+)
+mu.metrics.increment("items.backoff", len(open_item_ids) - len(due_item_ids))
+mu.metrics.increment("items.reused", len(items_raw) - len(open_item_ids))
+items_raw_by_id = {item_raw["item_id"]: item_raw for item_raw in items_raw}
+items_to_process = [items_raw_by_id[item_id] for item_id in due_item_ids]
 
-logger.info(f"Load file from previous runs if it exists to avoid redundant work.")
-prev_run = gu.get_previous_run_json_as_id_dict(result_json)
 
-logger.info(f"Processing {len(items_raw)} items...")
-for i, item_raw in enumerate(items_raw, 1):
+def process_item(item_raw: dict) -> dict:
+    """Process a single raw item and return the resulting item dict with status OK or ERROR.
+    Stages are dispatched to the worker pools in stage_pools."""
     item_raw_id = item_raw["item_id"]
-    logger.info(f"Processing item {i}/{len(items_raw)} (id: {item_raw_id})")
-
-    # Check whether the item was already successfully processed.
-    # If so, copy it from previous run and just update the related_items
-    # to make sure its up to date. If anything bad happens, log it and continue
-    # as if no previous run existed.
-    try:
-        if prev_run.get(item_raw_id, {}).get("status") == "OK":
-            item = prev_run[item_raw_id]
-            item["related_items"] = item_raw["related_items"]
-            result_dict["data"].append(item)
-            continue
-    except Exception as e:
-        logger.error(
-            f"Error when checking if item {item_raw_id} was already processed: {e}"
-        )
+    logger.info(f"Processing item {item_raw_id}")
 
     # The item was not processed in previous runs or failed in previous runs.
     # Create item skeleton.
@@ -80,17 +256,124 @@ for i, item_raw in enumerate(items_raw, 1):
     # Enrich item with details, download pdf and perform ocr,
     # extract text from pdf and summarize. Whenever something goes wrong,
     # set status to ERROR and add error message and go to next item.
+    # Duration and outcome of every stage are recorded in item["stages"].
+    # Stages finished in an earlier run, as recorded in the job queue, are skipped.
     pdf_tmp_path = None
+    job = None
+
+    def finished(stage: str) -> bool:
+        return st.JOB_STAGES.index(job["stage"]) >= st.JOB_STAGES.index(stage)
+
     try:
-        item.update(su.enrich_item_from_detail_page(item_raw))
+        job = job_queue.get(item_raw_id)
+        if job["stage"] != "new":
+            logger.info(f"Resuming item {item_raw_id} after stage {job['stage']}")
+        if finished("fetched"):
+            item.update(job["data"]["detail"])
+            # The detail was stored by an earlier run, the links of this run win.
+            item["related_items"] = item_raw["related_items"]
+        else:
+            with pu.record_stage(item, "detail_page"):
+                detail = stage_pools.run_network(
+                    su.enrich_item_from_detail_page, item_raw
+                )
+            item.update(detail)
+            job_queue.advance(item_raw_id, "fetched", {"detail": detail})
         pdf_url = item["pdf_url"]
         pdf_id = gu.get_rightmost_url_part(pdf_url)
-        pdf_tmp_path = pdf_tmp_directory / f"{pdf_id}.pdf"
-        gu.download_and_save_pdf(pdf_url, pdf_tmp_path)
-        gu.ocr_pdf_german_inplace(pdf_tmp_path)
-        pdf_text = gu.read_pdf_text(pdf_tmp_path)
-        assert pdf_text, "Error in read_pdf_text: PDF text was empty!"
-        pdf_summary = gu.summarize_text(pdf_text)
+        pdf_tmp_path = pdf_tmp_directory / f"{item_raw_id}.pdf"
+        # The text of a downloaded pdf is in the pdf cache once it is extracted,
+        # and so is the OCR'd pdf, from which text for other text settings is
+        # extracted without OCR. Only download the pdf (again) if neither is there.
+        pdf_text = None
+        cached_pdf_path = None
+        if finished("downloaded"):
+            pdf_hash = job["data"]["pdf_hash"]
+            pdf_text = pdf_cache.get_text(
+                pdf_id, pdf_hash, pdf_text_backend, pdf_max_text_chars
+            )
+            cached_pdf_path = pdf_cache.get_pdf_path(pdf_id, pdf_hash)
+        if (
+            pdf_text is None
+            and cached_pdf_path is None
+            and not (finished("downloaded") and pdf_tmp_path.exists())
+        ):
+            with pu.record_stage(item, "download"):
+                stage_pools.run_network(
+                    gu.download_and_save_pdf,
+                    pdf_url,
+                    pdf_tmp_path,
+                    max_bytes=pdf_max_mb * 2**20,
+                )
+            # Hash the pdf before OCR modifies it in-place.
+            pdf_hash = cu.get_file_hash(pdf_tmp_path)
+            job_queue.advance(item_raw_id, "downloaded", {"pdf_hash": pdf_hash})
+            pdf_text = pdf_cache.get_text(
+                pdf_id, pdf_hash, pdf_text_backend, pdf_max_text_chars
+            )
+            cached_pdf_path = pdf_cache.get_pdf_path(pdf_id, pdf_hash)
+        mu.metrics.increment(
+            "pdf_cache.misses" if pdf_text is None else "pdf_cache.hits"
+        )
+        if pdf_text is None and cached_pdf_path is not None:
+            mu.metrics.increment("pdf_cache.pdf_hits")
+            logger.info(f"Extracting text of cached OCR'd pdf {pdf_id}.")
+            with pu.record_stage(item, "text"):
+                pdf_text = stage_pools.run_cpu(
+                    gu.read_pdf_text,
+                    cached_pdf_path,
+                    max_chars=pdf_max_text_chars,
+                    backend=pdf_text_backend,
+                )
+                assert pdf_text, "Error in read_pdf_text: PDF text was empty!"
+            pdf_cache.put(
+                pdf_id,
+                pdf_hash,
+                cached_pdf_path,
+                pdf_text,
+                pdf_text_backend,
+                pdf_max_text_chars,
+            )
+        elif pdf_text is None:
+            with pu.record_stage(item, "ocr") as stage:
+                pdf_text, ocr_stats = stage_pools.run_cpu(
+                    pu.ocr_and_read_pdf_text,
+                    pdf_tmp_path,
+                    text_backend=pdf_text_backend,
+                    max_text_chars=pdf_max_text_chars,
+                    engine=ocr_engine,
+                    pages_per_chunk=ocr_pages_per_chunk,
+                    timeout=ocr_timeout,
+                    max_cpu_seconds=ocr_max_cpu_seconds,
+                    max_memory_bytes=ocr_max_memory_mb * 2**20,
+                )
+                stage["commands"] = ocr_stats["commands"]
+                ocr_report.add(ocr_stats)
+                for ocr_error in ocr_stats["ocr_errors"]:
+                    logger.warning(f"OCR error for pdf {pdf_id}: {ocr_error}")
+                assert pdf_text, "Error in read_pdf_text: PDF text was empty!"
+            pdf_cache.put(
+                pdf_id,
+                pdf_hash,
+                pdf_tmp_path,
+                pdf_text,
+                pdf_text_backend,
+                pdf_max_text_chars,
+            )
+        else:
+            logger.info(f"Using cached text of pdf {pdf_id}.")
+        if not finished("extracted"):
+            job_queue.advance(item_raw_id, "extracted", {})
+        # The pdf is not needed anymore once its text is cached.
+        pdf_tmp_path.unlink(missing_ok=True)
+        if summary_mode == "batch":
+            # Summarized by batch_summarizer after all items are processed.
+            item.update({"status": "SUMMARY_PENDING", "pdf_text": pdf_text})
+            return item
+        with pu.record_stage(item, "summary"):
+            pdf_summary = stage_pools.run_summary(
+                gu.summarize_text, pdf_text, summary_cache=summary_cache
+            )
         assert pdf_summary, "PDF summary was empty!"
         item.update(
             {
@@ -99,7 +382,6 @@ for i, item_raw in enumerate(items_raw, 1):
                 "pdf_summary": pdf_summary,
             }
         )
-        result_dict["data"].append(item)
     except Exception as e:
         logger.info(f"Error when processing item {item_raw_id}: {e}")
         item.update(
@@ -108,35 +390,120 @@ for i, item_raw in enumerate(items_raw, 1):
                 "error_msg": f"Exception: {e}. Original exception Traceback: {traceback.format_exc()}",
             }
         )
-    finally:
-        # Delete pdf from tmp directory in any case.
-        if pdf_tmp_path and pdf_tmp_path.exists():
-            pdf_tmp_path.unlink()
+        # Failed items start over in their next attempt, as intermediate results
+        # like the pdf may be the cause of the failure.
+        if pdf_tmp_path:
+            pdf_tmp_path.unlink(missing_ok=True)
+    return item
+
 
-        # Overwrite result json every 25 items to persist results.
-        if i % 25 == 0:
-            logger.info(f"Persist result to {result_json.absolute()}")
-            gu.write_json(result_dict, result_json)
+def finish_job(item: dict) -> None:
+    """Remove the job of an item with status OK, postpone the job of a failed item."""
+    if item["status"] == "OK":
+        job_queue.finish(item["item_id"])
+    elif item["status"] == "ERROR":
+        backoff = job_queue.fail(item["item_id"], item["error_msg"])
+        logger.info(
+            f"Item {item['item_id']} is retried in {backoff / 3600:.1f} hours at the earliest."
+        )
 
-# Persist result as json file.
-logger.info(f"Persist result to {result_json.absolute()}")
-gu.write_json(result_dict, result_json)
 
-# Prepare static files for frontend.
 logger.info(
-    f"Prepare slim version of result json without full pdf text and copy together with static files to {frontend_directory.absolute()}"
+    f"Processing {len(items_to_process)} items in {pipeline_mode} mode with up to {pipeline_max_in_flight} items in flight..."
+)
+item_order = {item_raw["item_id"]: n for n, item_raw in enumerate(items_raw)}
+ocr_report = pu.OcrReport()
+with stage_pools:
+    for i, item in pu.process_items(
+        process_item, items_to_process, pipeline_max_in_flight
+    ):
+        logger.info(
+            f"Finished item {i}/{len(items_to_process)} (id: {item['item_id']})"
+        )
+        # Persist every finished item right away. Items with status ERROR are
+        # stored as well, but never replace an OK item because those are not
+        # processed again.
+        item_store.put(item, item_order[item["item_id"]])
+        finish_job(item)
+        if item["status"] == "SUMMARY_PENDING":
+            batch_summarizer.add(item["item_id"], item["pdf_text"])
+
+logger.info(ocr_report.summary())
+
+# Jobs submitted by an earlier run that stopped while polling are collected as well,
+# their summaries end up in the summary cache.
+if len(batch_summarizer) or batch_summarizer.submitted_job_ids:
+    logger.info(f"Summarizing {len(batch_summarizer)} items in batch mode...")
+    for item_id, pdf_summary in batch_summarizer.collect().items():
+        item = item_store.get(item_id)
+        item.update(bu.get_summary_fields(pdf_summary))
+        if item["status"] == "ERROR":
+            logger.info(f"Error when summarizing item {item_id}: {pdf_summary}")
+        item_store.put(item, item_order[item_id])
+        finish_job(item)
+
+# Persist result as json file. As before, only successfully processed items of the
+# current table make it into the result, in table order.
+table_item_ids = [item_raw["item_id"] for item_raw in items_raw]
+logger.info(f"Export result to {result_json.absolute()}")
+st.write_result_json(
+    result_metadata, item_store.iter_items(table_item_ids, status="OK"), result_json
 )
-result_dict_slim = {
-    "processed_asof": result_dict["processed_asof"],
-    "version": result_dict["version"],
-    "data": [
+
+# Update the passage index of the assistant, which retrieves passages of the pdf
+# texts relevant to a question. Only new and changed items are indexed.
+logger.info(f"Update passage index {passages_db.absolute()}")
+item_index = item_store.get_index()
+passage_index = ru.PassageIndex(passages_db)
+with mu.metrics.timer("passage_index"):
+    n_indexed = passage_index.update(item_store.iter_items(table_item_ids, status="OK"))
+    n_removed = passage_index.remove_except(
+        [i for i in table_item_ids if item_index.get(i, {}).get("status") == "OK"]
+    )
+passage_index.close()
+logger.info(f"Indexed {n_indexed} new or changed items, removed {n_removed} items.")
+
+# Prepare static files for frontend. Items are read from the item store again for
+# every file, so they are never held in memory all at once.
+def get_slim_items():
+    return (
         {k: v for k, v in item_dict.items() if k != "pdf_text"}
-        for item_dict in result_dict["data"]
-    ],
-}
-gu.write_json(result_dict_slim, frontend_directory / "items_slim.json")
+        for item_dict in item_store.iter_items(table_item_ids, status="OK")
+    )
+
+
+if frontend_export == "sharded":
+    logger.info(
+        f"Write items without full pdf text as shards per year to {(frontend_directory / 'data').absolute()}"
+    )
+    st.write_frontend_shards(
+        result_metadata, get_slim_items(), frontend_directory / "data"
+    )
+logger.info(
+    f"Prepare slim version of result json without full pdf text and copy together with static files to {frontend_directory.absolute()}"
+)
+st.write_result_json(
+    result_metadata, get_slim_items(), frontend_directory / "items_slim.json"
+)
+
+# The frontend searches titles, summaries and pdf texts with a prebuilt index, so it
+# never downloads the pdf texts themselves.
+logger.info(f"Write full text search index to {frontend_directory.absolute()}")
+with mu.metrics.timer("search_index"):
+    sr.write_search_index(
+        item_store.iter_items(table_item_ids, status="OK"),
+        frontend_directory / "search",
+    )
 shutil.copytree(
     Path("./static_website_templates"), frontend_directory, dirs_exist_ok=True
 )
 
+# Write metrics of this run, kept per run and shown next to the logs in the frontend.
+for item_id in table_item_ids:
+    mu.metrics.increment(f"items.{item_index.get(item_id, {}).get('status')}")
+metrics_json = metrics_directory / f"{mu.metrics.started:%Y%m%d_%H%M%S}.json"
+logger.info(f"Write run metrics to {metrics_json.absolute()}")
+mu.write_metrics_json(metrics_json)
+shutil.copy(metrics_json, frontend_directory / "metrics.json")
+
 logger.info("Done.")
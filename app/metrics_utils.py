@@ -0,0 +1,96 @@
+# -*- coding: utf-8 -*-
+import datetime
+import json
+import os
+import threading
+import time
+from collections import Counter, defaultdict
+from contextlib import contextmanager
+from pathlib import Path
+
+# Upper bounds in seconds of the buckets of the timing histograms.
+TIMING_BUCKETS = (0.1, 0.5, 1, 2, 5, 10, 30, 60, 120, 300, 600)
+
+
+class RunMetrics:
+    """Counters and timing histograms of a pipeline run, shared by all threads.
+
+    Counters are named like "http.bytes_downloaded" or "retries.fetch". Counters of a
+    cache are named "<cache>.hits" and "<cache>.misses", from which to_dict derives
+    the hit rate. Work done in worker processes is not recorded here, the main
+    process records it from the results the workers return.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.started = datetime.datetime.now()
+        self.counters = Counter()
+        self.timings = defaultdict(list)
+
+    def increment(self, name: str, value: int = 1) -> None:
+        with self._lock:
+            self.counters[name] += value
+
+    def observe(self, name: str, seconds: float) -> None:
+        with self._lock:
+            self.timings[name].append(seconds)
+
+    @contextmanager
+    def timer(self, name: str):
+        """Observe the duration of the with block under name, also if it raises."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start)
+
+    def to_dict(self) -> dict:
+        with self._lock:
+            counters = dict(sorted(self.counters.items()))
+            timings = {name: list(v) for name, v in sorted(self.timings.items())}
+        cache_hit_rates = {}
+        for name in counters:
+            if name.endswith(".hits"):
+                cache = name[: -len(".hits")]
+                total = counters[name] + counters.get(f"{cache}.misses", 0)
+                cache_hit_rates[cache] = round(counters[name] / total, 4)
+        return {
+            "started": self.started.isoformat(timespec="seconds"),
+            "finished": datetime.datetime.now().isoformat(timespec="seconds"),
+            "counters": counters,
+            "cache_hit_rates": cache_hit_rates,
+            "timings": {
+                name: get_histogram(values) for name, values in timings.items()
+            },
+        }
+
+
+def get_histogram(values: list[float]) -> dict:
+    """Summarize timings in seconds with count, sum, percentiles and the number of
+    values per bucket of TIMING_BUCKETS (plus "inf" for longer ones)."""
+    values = sorted(values)
+    buckets = {str(bound): 0 for bound in TIMING_BUCKETS}
+    buckets["inf"] = 0
+    for value in values:
+        bound = next((b for b in TIMING_BUCKETS if value <= b), "inf")
+        buckets[str(bound)] += 1
+    return {
+        "count": len(values),
+        "sum": round(sum(values), 3),
+        "min": round(values[0], 3),
+        "p50": round(values[len(values) // 2], 3),
+        "p95": round(values[min(len(values) - 1, int(0.95 * len(values)))], 3),
+        "max": round(values[-1], 3),
+        "buckets": buckets,
+    }
+
+
+# Metrics of the current run, recorded by all modules.
+metrics = RunMetrics()
+
+
+def write_metrics_json(path: Path) -> None:
+    """Write the metrics of the current run to path."""
+    os.makedirs(Path(path).parent, exist_ok=True)
+    with open(path, "w") as f:
+        json.dump(metrics.to_dict(), f, indent=4)
@@ -0,0 +1,181 @@
+# -*- coding: utf-8 -*-
+import os
+import signal
+import subprocess
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import pypdf
+
+
+class CommandError(Exception):
+    """Raised if an external command fails or times out. The command result of
+    run_command is available as attribute result."""
+
+    def __init__(self, message: str, result: dict):
+        super().__init__(message)
+        self.result = result
+
+
+def run_command(
+    args: list[str],
+    timeout: float,
+    max_cpu_seconds: int = None,
+    max_memory_bytes: int = None,
+) -> dict:
+    """Run an external command without a shell and return its result
+    {"command": ..., "status": "OK", "returncode": ..., "seconds": ...}.
+
+    The command and all its subprocesses are killed after timeout seconds wall-clock
+    time. CPU time and address space of each process are limited with rlimits.
+    Raises CommandError with status "ERROR" or "TIMEOUT" and the end of the captured
+    stderr if the command cannot be started, exits with a non-zero status (which
+    includes being killed for exceeding an rlimit) or times out.
+    """
+    result = {"command": args[0], "status": "OK", "returncode": None, "seconds": 0.0}
+    # Limits are set by the prlimit wrapper of util-linux before it executes the
+    # command, instead of with preexec_fn, which is not safe when several threads
+    # start commands. Subprocesses inherit them. If a limit cannot be set, prlimit
+    # fails with its reason on stderr.
+    limits = []
+    if max_cpu_seconds:
+        limits.append(f"--cpu={max_cpu_seconds}")
+    if max_memory_bytes:
+        limits.append(f"--as={max_memory_bytes}")
+    command = ["prlimit", *limits, "--", *args] if limits else args
+    start = time.perf_counter()
+    try:
+        # Own session, so the whole process group can be killed on timeout.
+        process = subprocess.Popen(
+            command,
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.PIPE,
+            start_new_session=True,
+        )
+    except OSError as e:
+        result.update(
+            {"status": "ERROR", "error": f"{command[0]} could not be started: {e}"}
+        )
+        raise CommandError(result["error"], result)
+    try:
+        _, stderr = process.communicate(timeout=timeout)
+    except subprocess.TimeoutExpired:
+        os.killpg(process.pid, signal.SIGKILL)
+        _, stderr = process.communicate()
+        result["status"] = "TIMEOUT"
+    result["seconds"] = round(time.perf_counter() - start, 3)
+    result["returncode"] = process.returncode
+    if result["status"] == "OK" and process.returncode == 0:
+        return result
+    stderr = stderr.decode("utf-8", errors="replace").strip()[-500:]
+    if result["status"] == "TIMEOUT":
+        result["error"] = f"{args[0]} timed out after {timeout}s: {stderr}"
+    else:
+        result["status"] = "ERROR"
+        result[
+            "error"
+        ] = f"{args[0]} failed with exit status {process.returncode}: {stderr}"
+    raise CommandError(result["error"], result)
+
+
+def rewrite_pdf_with_ghostscript(
+    pdf_path: Path, output_path: Path, timeout: float, **limits
+) -> dict:
+    return run_command(
+        [
+            "gs",
+            "-q",
+            "-o",
+            str(output_path),
+            "-dSAFER",
+            "-sDEVICE=pdfwrite",
+            str(pdf_path),
+        ],
+        timeout,
+        **limits,
+    )
+
+
+def ocrmypdf_german(
+    pdf_path: Path,
+    output_path: Path,
+    pages: list[int],
+    timeout: float,
+    jobs: int = None,
+    **limits,
+) -> dict:
+    """OCR the given 1-based pages (all pages if None) of pdf_path in german.
+    Returns the command result of run_command."""
+    args = ["ocrmypdf", "-q", "--output-type", "pdf", "--redo-ocr", "-l", "deu"]
+    if pages is not None:
+        args += ["--pages", ",".join(map(str, pages))]
+    if jobs is not None:
+        args += ["--jobs", str(jobs)]
+    return run_command(args + [str(pdf_path), str(output_path)], timeout, **limits)
+
+
+def ocr_pdf_page_parallel(
+    pdf_path: Path,
+    output_path: Path,
+    pages: list[int],
+    pages_per_chunk: int,
+    timeout: float,
+    workers: int = None,
+    **limits,
+) -> list[dict]:
+    """OCR the given 1-based pages (all pages if None) of pdf_path in chunks of
+    pages_per_chunk consecutive pages, which are processed in parallel by up to
+    workers (default: number of cores) single-threaded ocrmypdf processes.
+    The chunks are merged back in order into output_path. Chunks whose OCR fails
+    keep their original pages. Returns the command results of all chunks, with the
+    page range prefixed to the error message of failed ones.
+    """
+    reader = pypdf.PdfReader(pdf_path)
+    n_pages = len(reader.pages)
+    pages = set(range(1, n_pages + 1) if pages is None else pages)
+    directory = output_path.parent
+    chunks = []
+
+    def ocr_chunk(chunk):
+        chunk_path, chunk_pages, chunk_pages_ocr = chunk
+        if not chunk_pages_ocr:
+            return chunk_path, None
+        ocr_path = chunk_path.with_name(f"{chunk_path.stem}_ocr.pdf")
+        try:
+            result = ocrmypdf_german(
+                chunk_path, ocr_path, chunk_pages_ocr, timeout, jobs=1, **limits
+            )
+            return ocr_path, result
+        except CommandError as e:
+            e.result["error"] = f"Pages {chunk_pages[0]}-{chunk_pages[-1]}: {e}"
+            return chunk_path, e.result
+
+    results = []
+    try:
+        for first_page in range(1, n_pages + 1, pages_per_chunk):
+            chunk_pages = range(
+                first_page, min(first_page + pages_per_chunk, n_pages + 1)
+            )
+            # Page numbers relative to the chunk of pages that need OCR.
+            chunk_pages_ocr = [p - first_page + 1 for p in chunk_pages if p in pages]
+            chunk_path = directory / f"{pdf_path.stem}_chunk{first_page}.pdf"
+            writer = pypdf.PdfWriter()
+            for p in chunk_pages:
+                writer.add_page(reader.pages[p - 1])
+            writer.write(chunk_path)
+            chunks.append((chunk_path, chunk_pages, chunk_pages_ocr))
+        with ThreadPoolExecutor(workers or os.cpu_count() or 1) as pool:
+            chunk_results = list(pool.map(ocr_chunk, chunks))
+        writer = pypdf.PdfWriter()
+        for result_path, result in chunk_results:
+            if result:
+                results.append(result)
+            for page in pypdf.PdfReader(result_path).pages:
+                writer.add_page(page)
+        writer.write(output_path)
+    finally:
+        for chunk_path, _, _ in chunks:
+            chunk_path.unlink(missing_ok=True)
+            chunk_path.with_name(f"{chunk_path.stem}_ocr.pdf").unlink(missing_ok=True)
+    return results
@@ -0,0 +1,185 @@
+# -*- coding: utf-8 -*-
+from concurrent.futures import (
+    FIRST_COMPLETED,
+    ProcessPoolExecutor,
+    ThreadPoolExecutor,
+    wait,
+)
+from contextlib import contextmanager
+from pathlib import Path
+import threading
+import time
+
+import generic_utils as gu
+import metrics_utils as mu
+
+
+class StagePools:
+    """Bounded worker pools for the stages of processing a single item.
+
+    Network stages (detail page fetch, pdf download) run in a thread pool, OCR and text
+    extraction run in a process pool because they are CPU bound, and summarization runs
+    in a separate, small thread pool so calls to the OpenAI API can be throttled
+    independently of the other stages.
+    A pool size of 0 runs the respective stage inline in the calling thread, so
+    StagePools() without arguments reproduces the plain sequential processing.
+    """
+
+    def __init__(
+        self, network_workers: int = 0, cpu_workers: int = 0, summary_workers: int = 0
+    ):
+        self.network_pool = (
+            ThreadPoolExecutor(network_workers, thread_name_prefix="network")
+            if network_workers
+            else None
+        )
+        self.cpu_pool = ProcessPoolExecutor(cpu_workers) if cpu_workers else None
+        self.summary_pool = (
+            ThreadPoolExecutor(summary_workers, thread_name_prefix="summary")
+            if summary_workers
+            else None
+        )
+
+    @staticmethod
+    def _run(pool, func, *args, **kwargs):
+        if pool is None:
+            return func(*args, **kwargs)
+        # Block the calling item until its stage is done. Exceptions raised
+        # in the worker are re-raised here, so error handling per item stays
+        # exactly the same as in sequential mode.
+        return pool.submit(func, *args, **kwargs).result()
+
+    def run_network(self, func, *args, **kwargs):
+        return self._run(self.network_pool, func, *args, **kwargs)
+
+    def run_cpu(self, func, *args, **kwargs):
+        return self._run(self.cpu_pool, func, *args, **kwargs)
+
+    def run_summary(self, func, *args, **kwargs):
+        return self._run(self.summary_pool, func, *args, **kwargs)
+
+    def shutdown(self):
+        for pool in (self.network_pool, self.cpu_pool, self.summary_pool):
+            if pool is not None:
+                pool.shutdown(wait=True, cancel_futures=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.shutdown()
+
+
+def ocr_and_read_pdf_text(
+    pdf_path: Path,
+    text_backend: str = "pypdf",
+    max_text_chars: int = None,
+    **ocr_options,
+) -> tuple[str, dict]:
+    """OCR a pdf in-place and return its text (see gu.read_pdf_text) and the OCR
+    statistics of gu.ocr_pdf_german_inplace, which gets ocr_options, with the time
+    spent on text extraction added as text_seconds. Module level
+    function, so it can be pickled and sent to a worker process of
+    StagePools.cpu_pool."""
+    ocr_stats = gu.ocr_pdf_german_inplace(pdf_path, **ocr_options)
+    start = time.perf_counter()
+    text = gu.read_pdf_text(pdf_path, max_chars=max_text_chars, backend=text_backend)
+    ocr_stats["text_seconds"] = time.perf_counter() - start
+    return text, ocr_stats
+
+
+class OcrReport:
+    """Collects the OCR statistics of all documents of a run, thread-safe."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.documents = 0
+        self.documents_skipped = 0
+        self.pages = 0
+        self.pages_skipped = 0
+        self.ocr_seconds = 0.0
+        self.documents_failed = 0
+
+    def add(self, ocr_stats: dict) -> None:
+        # OCR runs in worker processes, so its metrics are recorded here.
+        for command in ocr_stats["commands"]:
+            mu.metrics.observe(f"ocr.{command['command']}", command["seconds"])
+            if command["status"] != "OK":
+                mu.metrics.increment(f"ocr.{command['command']}.{command['status']}")
+        if "text_seconds" in ocr_stats:
+            mu.metrics.observe("text_extraction", ocr_stats["text_seconds"])
+        with self._lock:
+            self.documents += 1
+            self.ocr_seconds += ocr_stats["ocr_seconds"]
+            if ocr_stats["ocr_errors"]:
+                self.documents_failed += 1
+            if ocr_stats["pages"] is None:
+                return
+            self.pages += ocr_stats["pages"]
+            self.pages_skipped += ocr_stats["pages"] - ocr_stats["pages_ocr"]
+            if not ocr_stats["pages_ocr"]:
+                self.documents_skipped += 1
+
+    def summary(self) -> str:
+        pages_ocr = self.pages - self.pages_skipped
+        # Estimate the time saved with the average OCR time per page of this run.
+        seconds_per_page = self.ocr_seconds / pages_ocr if pages_ocr else 0.0
+        return (
+            f"OCR skipped for {self.pages_skipped}/{self.pages} pages with text layer "
+            f"({self.documents_skipped}/{self.documents} documents completely), "
+            f"took {self.ocr_seconds:.0f}s with errors for {self.documents_failed} "
+            f"documents, "
+            f"estimated time saved {self.pages_skipped * seconds_per_page:.0f}s."
+        )
+
+
+def process_items(process_item, items: list, max_in_flight: int = 1):
+    """Apply process_item to each item and yield (index, result) tuples, index starting at 1.
+
+    With max_in_flight <= 1 items are processed one after another in the calling thread
+    and results are yielded in input order. Otherwise up to max_in_flight items are
+    processed concurrently and results are yielded in order of completion. Items are only
+    submitted as others complete, and results are not referenced here once yielded, so
+    at most max_in_flight results (e.g. with their pdf text) are held at a time.
+    process_item is expected to handle its own errors, any exception escaping it is re-raised
+    here.
+    """
+    if max_in_flight <= 1:
+        for i, item in enumerate(items, 1):
+            yield i, process_item(item)
+        return
+    items = iter(items)
+    i = 0
+    with ThreadPoolExecutor(max_in_flight, thread_name_prefix="item") as pool:
+        pending = set()
+        while True:
+            for item in items:
+                pending.add(pool.submit(process_item, item))
+                if len(pending) >= max_in_flight:
+                    break
+            if not pending:
+                return
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                i += 1
+                yield i, future.result()
+
+
+@contextmanager
+def record_stage(item: dict, stage: str):
+    """Record duration and outcome of a processing stage of item in
+    item["stages"][stage] as {"seconds": ..., "status": "OK" or "ERROR"}.
+    Yields the record, so the stage can add details. Exceptions are re-raised.
+    The duration is also observed in the run metrics as stage.<stage>."""
+    record = item.setdefault("stages", {}).setdefault(stage, {})
+    start = time.perf_counter()
+    try:
+        yield record
+        record["status"] = "OK"
+    except Exception:
+        record["status"] = "ERROR"
+        mu.metrics.increment(f"stage.{stage}.errors")
+        raise
+    finally:
+        record["seconds"] = round(time.perf_counter() - start, 3)
+        mu.metrics.observe(f"stage.{stage}", record["seconds"])
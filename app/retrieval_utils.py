@@ -0,0 +1,190 @@
+# -*- coding: utf-8 -*-
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+from pathlib import Path
+
+import search_utils as sr
+
+# Passages are windows of PASSAGE_WORDS words of the pdf text, overlapping by
+# PASSAGE_OVERLAP_WORDS so that sentences at the border are found in one of them.
+PASSAGE_WORDS = 200
+PASSAGE_OVERLAP_WORDS = 50
+# BM25 weights of the title and the passage text. The title is indexed with every
+# passage of an item, as it often names the topic the text leaves implicit.
+TITLE_WEIGHT = 2.0
+TEXT_WEIGHT = 1.0
+# Query terms occurring in more than this share of the passages are dropped, unless
+# all terms are that common. Their BM25 idf is about zero, so they hardly change the
+# ranking, but matching them means scoring most of the index.
+MAX_TERM_PASSAGE_SHARE = 0.5
+
+
+def split_passages(text: str) -> list[str]:
+    """Split text into overlapping passages of PASSAGE_WORDS words."""
+    words = text.split()
+    step = PASSAGE_WORDS - PASSAGE_OVERLAP_WORDS
+    return [
+        " ".join(words[start : start + PASSAGE_WORDS])
+        for start in range(0, max(len(words) - PASSAGE_OVERLAP_WORDS, 1), step)
+    ]
+
+
+def get_item_hash(item: dict) -> str:
+    payload = json.dumps([item["title"], item.get("pdf_url"), item.get("pdf_text")])
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class PassageIndex:
+    """Persistent BM25 index over passages of the pdf texts of items, in a SQLite
+    database with a FTS5 full text index.
+
+    Title and passage are indexed as search terms of search_utils, i.e. normalized and
+    stemmed like the frontend search, and ranked with the bm25 function of FTS5.
+    Every item is stored with the hash of its title, pdf_url and pdf_text, so update
+    only re-indexes items that changed. The connection is shared between threads and
+    guarded by a lock.
+    """
+
+    def __init__(self, db_path: Path):
+        os.makedirs(Path(db_path).parent, exist_ok=True)
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(db_path, check_same_thread=False)
+        with self._lock, self._connection:
+            self._connection.execute(
+                "CREATE TABLE IF NOT EXISTS items (item_id TEXT PRIMARY KEY, "
+                "item_hash TEXT, title TEXT, item_url TEXT, pdf_url TEXT)"
+            )
+            self._connection.execute(
+                "CREATE TABLE IF NOT EXISTS passages (passage_id INTEGER PRIMARY KEY, "
+                "item_id TEXT, position INTEGER, text TEXT)"
+            )
+            self._connection.execute(
+                "CREATE INDEX IF NOT EXISTS passages_item_id ON passages (item_id)"
+            )
+            self._connection.execute(
+                "CREATE VIRTUAL TABLE IF NOT EXISTS passage_terms "
+                "USING fts5(title_terms, text_terms)"
+            )
+            self._connection.execute(
+                "CREATE VIRTUAL TABLE IF NOT EXISTS passage_terms_vocab "
+                "USING fts5vocab(passage_terms, 'row')"
+            )
+
+    def __len__(self):
+        with self._lock:
+            row = self._connection.execute("SELECT COUNT(*) FROM passages").fetchone()
+        return row[0]
+
+    def update(self, items) -> int:
+        """Index new and changed items and return their number. Items can be any
+        iterable of item dicts with item_id, title, item_url, pdf_url and pdf_text."""
+        with self._lock:
+            hashes = dict(
+                self._connection.execute("SELECT item_id, item_hash FROM items")
+            )
+        n_updated = 0
+        for item in items:
+            item_hash = get_item_hash(item)
+            if hashes.get(item["item_id"]) == item_hash:
+                continue
+            # Tokenizing is the expensive part, done outside of the lock.
+            title_terms = " ".join(sr.get_terms(item["title"]))
+            passages = [
+                (text, " ".join(sr.get_terms(text)))
+                for text in split_passages(item.get("pdf_text") or "")
+            ]
+            with self._lock, self._connection:
+                self._delete(item["item_id"])
+                self._connection.execute(
+                    "INSERT INTO items (item_id, item_hash, title, item_url, pdf_url) "
+                    "VALUES (?, ?, ?, ?, ?)",
+                    (
+                        item["item_id"],
+                        item_hash,
+                        item["title"],
+                        item.get("item_url"),
+                        item.get("pdf_url"),
+                    ),
+                )
+                for position, (text, text_terms) in enumerate(passages):
+                    passage_id = self._connection.execute(
+                        "INSERT INTO passages (item_id, position, text) VALUES (?, ?, ?)",
+                        (item["item_id"], position, text),
+                    ).lastrowid
+                    self._connection.execute(
+                        "INSERT INTO passage_terms (rowid, title_terms, text_terms) "
+                        "VALUES (?, ?, ?)",
+                        (passage_id, title_terms, text_terms),
+                    )
+            n_updated += 1
+        return n_updated
+
+    def remove_except(self, item_ids: list[str]) -> int:
+        """Remove all items not in item_ids and return their number."""
+        keep = set(item_ids)
+        with self._lock, self._connection:
+            removed = [
+                item_id
+                for (item_id,) in self._connection.execute("SELECT item_id FROM items")
+                if item_id not in keep
+            ]
+            for item_id in removed:
+                self._delete(item_id)
+        return len(removed)
+
+    def _delete(self, item_id: str) -> None:
+        """Delete an item and its passages. Must be called holding the lock."""
+        self._connection.execute(
+            "DELETE FROM passage_terms WHERE rowid IN "
+            "(SELECT passage_id FROM passages WHERE item_id = ?)",
+            (item_id,),
+        )
+        self._connection.execute("DELETE FROM passages WHERE item_id = ?", (item_id,))
+        self._connection.execute("DELETE FROM items WHERE item_id = ?", (item_id,))
+
+    def search(self, query: str, k: int = 10) -> list[dict]:
+        """Return the k passages ranking highest for query by BM25 as dicts with
+        item_id, title, item_url, pdf_url, position (of the passage within the pdf
+        text), text and score (higher is better). Passages match if they contain any
+        term of the query, see MAX_TERM_PASSAGE_SHARE for very common terms."""
+        terms = sorted(set(sr.get_terms(query)))
+        if not terms:
+            return []
+        with self._lock:
+            n_passages = self._connection.execute(
+                "SELECT COUNT(*) FROM passages"
+            ).fetchone()[0]
+            n_term_passages = dict(
+                self._connection.execute(
+                    "SELECT term, doc FROM passage_terms_vocab WHERE term IN "
+                    f"({', '.join('?' * len(terms))})",
+                    terms,
+                )
+            )
+            max_term_passages = MAX_TERM_PASSAGE_SHARE * n_passages
+            rare_terms = [
+                term
+                for term in terms
+                if 0 < n_term_passages.get(term, 0) <= max_term_passages
+            ]
+            match = " OR ".join(f'"{term}"' for term in rare_terms or terms)
+            # Rank within the full text index first, where FTS5 can order by bm25
+            # efficiently, and only join the top k passages.
+            rows = self._connection.execute(
+                "SELECT p.item_id, i.title, i.item_url, i.pdf_url, p.position, p.text, "
+                "-top.rank FROM ("
+                "SELECT rowid, rank FROM passage_terms "
+                "WHERE passage_terms MATCH ? AND rank MATCH ? ORDER BY rank LIMIT ?"
+                ") top JOIN passages p ON p.passage_id = top.rowid "
+                "JOIN items i ON i.item_id = p.item_id ORDER BY top.rank",
+                (match, f"bm25({TITLE_WEIGHT}, {TEXT_WEIGHT})", k),
+            ).fetchall()
+        columns = ("item_id", "title", "item_url", "pdf_url", "position", "text")
+        return [{**dict(zip(columns, row[:-1])), "score": row[-1]} for row in rows]
+
+    def close(self) -> None:
+        with self._lock:
+            self._connection.close()
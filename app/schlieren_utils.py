@@ -1,5 +1,5 @@
 # -*- coding: utf-8 -*-
-from bs4 import BeautifulSoup
+from html.parser import HTMLParser
 import json
 import re
 from thefuzz import fuzz
@@ -7,25 +7,60 @@ from thefuzz import fuzz
 import generic_utils as gu
 
 
-def get_full_table_soup(url: str) -> BeautifulSoup:
+class _StopParsing(Exception):
+    pass
+
+
+class TablePageParser(HTMLParser):
+    """Extract the form token and the data-entities attribute of the first table from
+    the politbusiness page, without building a tree of the page. Stops as soon as
+    both are found."""
+
+    def __init__(self):
+        super().__init__()
+        self.form_token = None
+        self.entities = None
+
+    def handle_starttag(self, tag, attrs):
+        if tag == "input" and self.form_token is None:
+            attrs = dict(attrs)
+            if attrs.get("id") == "politische_geschaefte_suchformular__token":
+                self.form_token = attrs.get("value")
+        elif tag == "table" and self.entities is None:
+            self.entities = dict(attrs).get("data-entities")
+        if self.form_token is not None and self.entities is not None:
+            raise _StopParsing()
+
+
+def parse_table_page(html: str) -> TablePageParser:
+    """Return the parser after parsing html, with form_token and entities set."""
+    parser = TablePageParser()
+    try:
+        parser.feed(html)
+    except _StopParsing:
+        pass
+    return parser
+
+
+def get_full_table_html(url: str) -> str:
     """The table on the page only shows the last 10 years by default. Data for all years can be requested with a form
     that sends a GET request. For this we need a form_token, which is embedded in the form submit button."""
-    table_soup = gu.get_soup(url)
-    form_token = table_soup.find(
-        "input", id="politische_geschaefte_suchformular__token"
-    )["value"]
+    # The token page is fetched without the http cache, as a 304 would bring back the
+    # form_token of an earlier run, which the server no longer accepts.
+    form_token = parse_table_page(gu.fetch(url, use_cache=False).text).form_token
     table_url_all_years = f"{url}?politische_geschaefte_suchformular[vomStart]=&politische_geschaefte_suchformular[vomEnd]=&politische_geschaefte_suchformular[_token]={form_token}"
-    return gu.get_soup(table_url_all_years)
+    # The form token changes between runs, so cache the table independent of it.
+    return gu.fetch(table_url_all_years, cache_key=f"{url}?all_years").text
 
 
-def extract_items(soup: BeautifulSoup, root_url: str) -> list[dict]:
-    """Extract row objects from table soup."""
+def extract_items(table_html: str, root_url: str) -> list[dict]:
+    """Extract row objects from the html of the table page."""
     # The table tag has a data attribute data-entities that contains the whole
     # table data as json in a data-attribute data-entities.
     # We can use this to extract the item detail urls (which are contained in the
     # href attribute in an a tag within the title key of each json object >.<)
     # without the hassle of caring about pagination or parsing html.
-    items_raw = json.loads(soup.find("table").attrs["data-entities"])["data"]
+    items_raw = json.loads(parse_table_page(table_html).entities)["data"]
     # Add item id, full url to item detail page and replace title.
     # Each row's title is a hyperlink to the item detail page, so we can extract
     # the href from the title attribute. The item identifier is the last part of
@@ -37,7 +72,7 @@ def extract_items(soup: BeautifulSoup, root_url: str) -> list[dict]:
     return items_raw
 
 
-def add_response_links_inplace(items):
+def add_response_links_inplace(items, prev_items: dict = None):
     """
     Some items are responses ("Beantwortungen") to other items.
     Try to detect these relationships using fuzzy matching of titles
@@ -47,25 +82,71 @@ def add_response_links_inplace(items):
     Criteria for a link is a high similarity in the titles.
     We ignore titles which contain "gemeindeparlament" because these are
     protocol items and not responses.
+
+    If prev_items (the index of the items of a previous run, as returned by
+    store_utils.ItemStore.get_index) is given, links between items whose title
+    did not change are taken from their previous related_items and only new or
+    changed titles are compared against all others.
     """
-    for i in items:
-        i["related_items"] = []
-    for i1 in range(len(items)):
-        item1 = items[i1]
-        i1_title = item1["title"].lower()
-        if "gemeindeparlament" in i1_title:
+    titles = [i["title"].lower() for i in items]
+    item_indices = {i["item_id"]: k for k, i in enumerate(items)}
+    known_indices = get_known_item_indices(items, prev_items or {})
+    # Reuse links between known items. Links to items that are not known (anymore)
+    # are dropped and recomputed below if the item is still in the table. A link is
+    # kept if either of the two items has it, in case the related_items of the other
+    # one were not updated in the previous run.
+    links = [set() for _ in items]
+    for k in known_indices:
+        for related in prev_items[items[k]["item_id"]]["related_items"]:
+            j = item_indices.get(related["item_id"])
+            if j in known_indices:
+                links[k].add(j)
+                links[j].add(k)
+    # Comparing all pairs of titles is quadratic in the number of items. We only
+    # compute the partial_ratio for candidate pairs from a blocking index, which
+    # is guaranteed to contain all pairs with a ratio > 95. If there are known
+    # items, only pairs with at least one new item are needed. Otherwise we use
+    # that pairs of two protocols are always skipped below, so at least one title
+    # must not be a protocol.
+    if known_indices:
+        query_indices = [k for k in range(len(items)) if k not in known_indices]
+    else:
+        query_indices = [
+            k for k, title in enumerate(titles) if "gemeindeparlament" not in title
+        ]
+    candidate_pairs = gu.get_partial_ratio_candidate_pairs(
+        titles, min_score=95, query_indices=query_indices
+    )
+    for i1, i2 in candidate_pairs:
+        if "gemeindeparlament" in titles[i1]:
             continue
-        for i2 in range(i1 + 1, len(items)):
-            item2 = items[i2]
-            i2_title = item2["title"].lower()
-            ratio = fuzz.partial_ratio(i1_title, i2_title)
-            if ratio > 95:
-                item1["related_items"].append(
-                    {"item_id": item2["item_id"], "title": item2["title"]}
-                )
-                item2["related_items"].append(
-                    {"item_id": item1["item_id"], "title": item1["title"]}
-                )
+        ratio = fuzz.partial_ratio(titles[i1], titles[i2])
+        if ratio > 95:
+            links[i1].add(i2)
+            links[i2].add(i1)
+    # Related items are ordered as in the table, like the pairwise comparison does.
+    for item, related_indices in zip(items, links):
+        item["related_items"] = [
+            {"item_id": items[j]["item_id"], "title": items[j]["title"]}
+            for j in sorted(related_indices)
+        ]
+
+
+def get_known_item_indices(items: list[dict], prev_items: dict) -> set[int]:
+    """Return the indices of items that have the same title and related_items in
+    prev_items. Whether a pair of items is linked depends on which of them comes
+    first, so if the known items are not in the same relative order as in the
+    previous run, no item is considered known."""
+    known_indices = set()
+    for k, item in enumerate(items):
+        prev_item = prev_items.get(item["item_id"], {})
+        if prev_item.get("title") == item["title"] and "related_items" in prev_item:
+            known_indices.add(k)
+    known_ids = [items[k]["item_id"] for k in sorted(known_indices)]
+    prev_order = {item_id: n for n, item_id in enumerate(prev_items)}
+    if known_ids != sorted(known_ids, key=prev_order.__getitem__):
+        return set()
+    return known_indices
 
 
 def enrich_item_from_detail_page(item_raw: dict) -> dict:
@@ -90,6 +171,83 @@ def enrich_item_from_detail_page(item_raw: dict) -> dict:
         dict: Dict that contains key attributes for an item.
     """
 
+    # Fetch item detail page to extract author and pdf links
+    html = gu.fetch(item_raw["item_url"]).text
+    return parse_detail_page(item_raw, html)
+
+
+class DetailPageParser(HTMLParser):
+    """Extract the author and the pdf download link of an item detail page without
+    building a tree of the page:
+    - author: Text of the first link in the element following the first dt whose
+      text contains "Verfasser", or of the whole element if it has no link.
+    - pdf_href: href of the first element with "_doc" in its href and "Download"
+      in its text.
+    Stops as soon as both are found, they can come in either order. Pages without
+    author are parsed to the end.
+    """
+
+    VOID_TAGS = {"area", "base", "br", "col", "embed", "hr", "img", "input", "link"}
+
+    def __init__(self):
+        super().__init__()
+        self.author = None
+        self.pdf_href = None
+        self._author_found = False
+        self._expect_author = False
+        # Open elements whose text is collected: [tag, depth, text parts, kind, href]
+        self._open = []
+
+    def handle_starttag(self, tag, attrs):
+        for element in self._open:
+            if element[0] == tag:
+                element[1] += 1
+        if tag in self.VOID_TAGS:
+            return
+        if tag == "dt" and not self._author_found:
+            self._open.append([tag, 1, [], "dt", None])
+        elif self._expect_author:
+            self._expect_author = False
+            self._open.append([tag, 1, [], "author", None])
+        elif tag == "a" and any(e[3] == "author" for e in self._open):
+            if not any(e[3] == "author_link" for e in self._open):
+                self._open.append([tag, 1, [], "author_link", None])
+        href = dict(attrs).get("href")
+        if href and "_doc" in href and self.pdf_href is None:
+            self._open.append([tag, 1, [], "pdf", href])
+
+    def handle_data(self, data):
+        for element in self._open:
+            element[2].append(data)
+
+    def handle_endtag(self, tag):
+        for element in list(self._open):
+            if element[0] != tag:
+                continue
+            element[1] -= 1
+            if element[1] == 0:
+                self._open.remove(element)
+                self._close(element)
+
+    def _close(self, element):
+        _, _, text, kind, href = element
+        text = "".join(text)
+        if kind == "dt" and "Verfasser" in text:
+            self._author_found = True
+            self._expect_author = True
+        elif kind == "author_link":
+            self.author = text.strip()
+        elif kind == "author" and self.author is None:
+            self.author = text.strip()
+        elif kind == "pdf" and "Download" in text and self.pdf_href is None:
+            self.pdf_href = href
+        if self.author is not None and self.pdf_href is not None:
+            raise _StopParsing()
+
+
+def parse_detail_page(item_raw: dict, html: str) -> dict:
+    """Return the item dict of enrich_item_from_detail_page, given the raw item and
+    the html of its detail page."""
     # Clean and transfer item attributes from raw item.
     item_url = item_raw["item_url"]
     item = {
@@ -99,9 +257,11 @@ def enrich_item_from_detail_page(item_raw: dict) -> dict:
         "date": item_raw["_geschaeftsdatum-sort"],
         "related_items": item_raw["related_items"],
     }
-
-    # Fetch item detail page to extract author and pdf links
-    soup = gu.get_soup(item_url)
+    parser = DetailPageParser()
+    try:
+        parser.feed(html)
+    except _StopParsing:
+        pass
 
     # Add author
     # Ideally we would extract the author from the item detail page's creator (Verfasser) tag.
@@ -109,14 +269,9 @@ def enrich_item_from_detail_page(item_raw: dict) -> dict:
     # Otherwise, check if the title contains "gemeindeparlament" together with either "beschluss" or "protokoll" and set author to "Gemeindeparlament".
     # Use "Unspezifiziert" (unspecified) as fallback.
     author = "Unspezifiziert"
-    author_tag = soup.find("dt", string=re.compile("Verfasser"))
     title_lower = item["title"].lower()
-    if author_tag:
-        author_tag_a = author_tag.next_sibling.find("a")
-        if author_tag_a:
-            author = author_tag_a.get_text().strip()
-        else:
-            author = author_tag.next_sibling.get_text().strip()
+    if parser.author is not None:
+        author = parser.author
     elif "vorlage stadtrat" in title_lower:
         author = "Stadtrat"
     elif "gemeindeparlament" in title_lower and (
@@ -126,14 +281,9 @@ def enrich_item_from_detail_page(item_raw: dict) -> dict:
     item.update({"author": author.title()})
 
     # Get PDF url, which is the href attribut of a download button element.
-    pdf_url = (
-        gu.get_url_root(item_url)
-        + soup.find(
-            lambda tag: tag.has_attr("href")
-            and "_doc" in tag["href"]
-            and "Download" in tag.string
-        )["href"]
-    )
+    if parser.pdf_href is None:
+        raise ValueError(f"No pdf download link found on {item_url}.")
+    pdf_url = gu.get_url_root(item_url) + parser.pdf_href
     # Pdf identifier is the last part of the url.
     pdf_id = gu.get_rightmost_url_part(pdf_url)
     item.update({"pdf_url": pdf_url, "pdf_id": pdf_id})
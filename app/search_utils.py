@@ -0,0 +1,154 @@
+# -*- coding: utf-8 -*-
+import json
+import math
+import os
+import re
+import unicodedata
+from collections import Counter, defaultdict
+from functools import lru_cache
+from pathlib import Path
+
+import textrank_utils as tu
+
+# Fields of an item that are indexed, with the weight of a match in them.
+SEARCH_FIELDS = {"title": 3.0, "pdf_summary": 2.0, "pdf_text": 1.0}
+# BM25 parameters for the length normalization of the pdf text.
+BM25_K1 = 1.2
+BM25_B = 0.75
+# Number of shards is chosen so that a shard holds about this many postings.
+POSTINGS_PER_SHARD = 50000
+# Umlauts are reduced to their base vowel like in the CISTEM stemmer, so plurals
+# like "Schulhäuser" match the singular "Schulhaus".
+UMLAUTS = str.maketrans({"ä": "a", "ö": "o", "ü": "u", "ß": "ss"})
+# Stopwords after normalization, i.e. "für" -> "fur".
+STOPWORDS = {w.translate(UMLAUTS) for w in tu.STOPWORDS}
+
+
+def normalize(text: str) -> str:
+    """Lowercase text, reduce umlauts to their base vowel ("ä" -> "a", "ß" -> "ss")
+    and strip accents of other letters."""
+    text = text.lower().translate(UMLAUTS)
+    text = unicodedata.normalize("NFKD", text)
+    return "".join(c for c in text if not unicodedata.combining(c))
+
+
+def stem(word: str) -> str:
+    """Strip german inflection suffixes, following the CISTEM stemmer without its
+    character substitutions: after normalization "Schulhäuser" and "Schulhaus" both
+    become "schulhau", "Anfragen" and "Anfrage" both "anfrag"."""
+    while len(word) > 3:
+        if len(word) > 5 and word[-2:] in ("em", "er", "nd"):
+            word = word[:-2]
+        elif len(word) > 4 and word[-1] in "tesn":
+            word = word[:-1]
+        else:
+            break
+    return word
+
+
+def get_terms(text: str) -> list[str]:
+    """Return the search terms of text: normalized and stemmed words without
+    stopwords. The frontend (search_index.js) does exactly the same for queries."""
+    terms = []
+    for word in re.findall(r"\w+", text.lower()):
+        terms.extend(get_word_terms(word))
+    return terms
+
+
+@lru_cache(maxsize=2**16)
+def get_word_terms(word: str) -> tuple[str, ...]:
+    """Return the terms of a single word. Cached, as normalizing character by
+    character is slow and most words of a document are repeated."""
+    return tuple(
+        stem(term)
+        for term in re.findall(r"[a-z0-9]+", normalize(word))
+        if len(term) > 1 and term not in STOPWORDS
+    )
+
+
+def get_shard(term: str, n_shards: int) -> int:
+    """Return the shard of term by its 32 bit FNV-1a hash, which is cheap to compute
+    in the frontend as well."""
+    h = 0x811C9DC5
+    for byte in term.encode("utf-8"):
+        h = ((h ^ byte) * 0x01000193) & 0xFFFFFFFF
+    return h % n_shards
+
+
+def get_term_counts(item: dict) -> tuple[dict, int]:
+    """Return the term counts of every search field of item as field -> Counter,
+    and the number of words of its pdf text."""
+    counts = {
+        field: Counter(get_terms(item.get(field) or "")) for field in SEARCH_FIELDS
+    }
+    return counts, len((item.get("pdf_text") or "").split())
+
+
+def get_term_weights(
+    counts: dict, text_length: int, avg_text_length: float
+) -> defaultdict:
+    """Return the weight of every term of an item, summed over the weighted fields,
+    given its term counts and text length of get_term_counts. Term frequencies in
+    the pdf text are saturated and normalized by text length like in BM25, with the
+    average number of words of the pdf texts avg_text_length, so long documents do
+    not win by repetition."""
+    weights = defaultdict(float)
+    for field, field_weight in SEARCH_FIELDS.items():
+        if field == "pdf_text":
+            norm = BM25_K1 * (
+                1 - BM25_B + BM25_B * text_length / max(avg_text_length, 1)
+            )
+            for term, tf in counts[field].items():
+                weights[term] += field_weight * tf * (BM25_K1 + 1) / (tf + norm)
+        else:
+            for term, tf in counts[field].items():
+                weights[term] += field_weight * tf
+    return weights
+
+
+def write_search_index(items, directory: Path) -> None:
+    """Write an inverted index over title, summary and pdf text of items for the
+    static frontend.
+
+    The index is split into shards by the hash of the term, so the frontend only
+    downloads the shards of the terms of a query and never the text itself:
+    - manifest.json: number of shards, the item_id of every document number and
+      the stopwords
+    - shard_<k>.json: term -> [doc, weight, doc, weight, ...] with the weights as
+      integers (in hundredths). The idf is derived from the length of the list.
+
+    Items can be any iterable and are only iterated once. Only their term counts
+    are kept, not their texts, until the average text length is known.
+    """
+    item_ids = []
+    doc_counts = []
+    for item in items:
+        item_ids.append(item["item_id"])
+        doc_counts.append(get_term_counts(item))
+    avg_text_length = sum(length for _, length in doc_counts) / max(len(item_ids), 1)
+    postings = defaultdict(list)
+    for doc in range(len(doc_counts)):
+        counts, text_length = doc_counts[doc]
+        doc_counts[doc] = None
+        for term, weight in get_term_weights(
+            counts, text_length, avg_text_length
+        ).items():
+            postings[term].extend((doc, round(100 * weight)))
+    n_postings = sum(len(v) for v in postings.values()) // 2
+    n_shards = 2 ** math.ceil(math.log2(max(1, n_postings / POSTINGS_PER_SHARD)))
+    shards = [{} for _ in range(n_shards)]
+    for term, term_postings in sorted(postings.items()):
+        shards[get_shard(term, n_shards)][term] = term_postings
+
+    os.makedirs(directory, exist_ok=True)
+    for k, shard in enumerate(shards):
+        with open(Path(directory) / f"shard_{k}.json", "w") as f:
+            json.dump(shard, f, separators=(",", ":"))
+    manifest = {
+        "n_shards": n_shards,
+        "n_terms": len(postings),
+        "item_ids": item_ids,
+        "stopwords": sorted(STOPWORDS),
+    }
+    with open(Path(directory) / "manifest.json", "w") as f:
+        json.dump(manifest, f, separators=(",", ":"))
@@ -1,4 +1,15 @@
 $(document).ready(function () {
+    // Matches of the full text search as map item_id -> score, null without search.
+    // Rows without a match are filtered out and matches can be ordered by score.
+    let fullTextMatches = null;
+    $.fn.dataTable.ext.search.push(function (settings, data, dataIndex, row) {
+      return fullTextMatches === null || fullTextMatches.has(row.item_id);
+    });
+    $.fn.dataTable.ext.order['fulltext-score'] = function (settings, col) {
+      return this.api().column(col, {order: 'index'}).data().map(function (itemId) {
+        return fullTextMatches === null ? 0 : fullTextMatches.get(itemId) || 0;
+      });
+    };
     // Create search input element on top of table for each column
     $('#table thead th.colSearch').each(function () {
         $(this).html('<input type="text" placeholder="Durchsuchen..." />');
@@ -18,6 +29,14 @@ $(document).ready(function () {
                     text: "Download as Excel",
                     autoFilter: true,
                     className: 'btn-primary btn-sm',
+                    exportOptions: { columns: ':visible' },
+                    // Export all items, not only the years loaded so far.
+                    action: function (e, dt, button, config) {
+                        const that = this;
+                        loadAllItems().then(function () {
+                            $.fn.dataTable.ext.buttons.excelHtml5.action.call(that, e, dt, button, config);
+                        }).catch(console.error);
+                    },
                 }
             ],
             dom: {
@@ -26,16 +45,8 @@ $(document).ready(function () {
                },
             }
         },
-        ajax: {
-            url: 'items_slim.json',
-            dataSrc: function(json) {
-                // Update asof and version dom elements with json top level data.
-                // Then pass data attribute along for datatables to display.
-                document.querySelector("#asof").textContent = json.processed_asof
-                document.querySelector("#version").textContent = json.version
-                return json.data
-            }
-        },
+        // Rows are added by loadItems below.
+        data: [],
         columns: [
             {
                 data: 'date',
@@ -88,6 +99,16 @@ $(document).ready(function () {
                   }
                 }
             },
+            {
+                // Relevance of the full text search, only used for ordering.
+                name: 'score',
+                data: 'item_id',
+                visible: false,
+                searchable: false,
+                type: 'num',
+                orderDataType: 'fulltext-score',
+                orderSequence: ['desc', 'asc'],
+            },
         ],
         // Bind search event to column search elements
         initComplete: function () {
@@ -140,6 +161,22 @@ $(document).ready(function () {
                 return state;
             }
         });
+    // Only the newest year is loaded up front. The older years are loaded as soon as
+    // the user pages, orders, searches or exports the table, or right away if the
+    // restored state of the url filters the table.
+    const itemsLoaded = loadItems(table);
+    const loadAllItems = () => itemsLoaded.then(loadOlderShards => loadOlderShards());
+    itemsLoaded.then(function () {
+        const isFiltered = table.search() !== '' ||
+            table.columns().search().toArray().some(value => value !== '');
+        if (isFiltered) {
+            loadAllItems().catch(console.error);
+        }
+        table.on('page.dt length.dt order.dt search.dt', function () {
+            loadAllItems().catch(console.error);
+        });
+    }).catch(console.error);
+
     // Link excel download to dedicated button
     table.buttons().container().appendTo( $('#mainHeader') );
     // Remove "dt-buttons" from container because it messes up layouting
@@ -148,6 +185,28 @@ $(document).ready(function () {
     document.querySelector("#table_length").classList.add("float-start");
     document.querySelector("#table_paginate").classList.add("float-end");
 
+    // Full text search on the prebuilt search index, matches are ordered by score.
+    $("#fullTextSearchForm").on("submit", function(e) {
+      e.preventDefault();
+      const query = document.querySelector("#fullTextSearch").value.trim();
+      const info = document.querySelector("#fullTextSearchInfo");
+      if (query === "") {
+        fullTextMatches = null;
+        info.textContent = "";
+        table.order([[0, 'desc']]).draw();
+        return;
+      }
+      info.textContent = "Suche...";
+      searchIndex.search(query).then(function(matches) {
+        fullTextMatches = matches;
+        info.textContent = `${matches.size} Treffer`;
+        table.order([[table.column('score:name').index(), 'desc']]).draw();
+      }).catch(function(error) {
+        console.error(error);
+        info.textContent = "Die Volltextsuche ist fehlgeschlagen, bitte später erneut versuchen.";
+      });
+    });
+
     // Upon clicking an id link in a table cell, filter id column with that id
     $("#table").on("click", ".item_id_filter", function(e) {
       e.preventDefault();
@@ -164,3 +223,69 @@ $(document).ready(function () {
       }
     });
 });
+
+// Update asof and version dom elements with the top level data of the export.
+function showMetadata(json) {
+    document.querySelector("#asof").textContent = json.processed_asof;
+    document.querySelector("#version").textContent = json.version;
+}
+
+// Turn a columnar shard of the sharded export into row objects, decoding the
+// dictionary encoded columns with the dictionaries of the manifest.
+function decodeShard(shard, dictionaries) {
+    const columns = shard.columns;
+    const rows = [];
+    for (let i = 0; i < columns.item_id.length; i++) {
+        const row = {};
+        for (const [name, values] of Object.entries(columns)) {
+            row[name] = name in dictionaries ? dictionaries[name][values[i]] : values[i];
+        }
+        row.related_items = row.related_items.map(([item_id, title]) => ({ item_id: item_id, title: title }));
+        rows.push(row);
+    }
+    return rows;
+}
+
+function fetchJson(url) {
+    return fetch(url).then(response => {
+        if (!response.ok) {
+            throw new Error(`${url}: ${response.status} ${response.statusText}`);
+        }
+        return response.json();
+    });
+}
+
+// Load the sharded export if there is one and render the newest year as soon as it
+// arrives. Otherwise load items_slim.json. Resolves to a function that loads the
+// older years of the sharded export and resolves once all items are in the table.
+async function loadItems(table) {
+    const response = await fetch('data/manifest.json');
+    if (!response.ok) {
+        const json = await fetchJson('items_slim.json');
+        showMetadata(json);
+        table.rows.add(json.data).draw(false);
+        return () => Promise.resolve();
+    }
+    const manifest = await response.json();
+    showMetadata(manifest);
+    const [newest, ...older] = manifest.shards;
+    if (newest) {
+        const data = await fetchJson(`data/${newest.file}`);
+        table.rows.add(decodeShard(data, manifest.dictionaries)).draw(false);
+    }
+    // Failed downloads are not cached, so the next call tries again.
+    let olderLoaded = null;
+    return function loadOlderShards() {
+        if (olderLoaded === null) {
+            olderLoaded = Promise.all(older.map(shard => fetchJson(`data/${shard.file}`)))
+                .then(function (shards) {
+                    for (const data of shards) {
+                        table.rows.add(decodeShard(data, manifest.dictionaries));
+                    }
+                    table.draw(false);
+                });
+            olderLoaded.catch(() => { olderLoaded = null; });
+        }
+        return olderLoaded;
+    };
+}
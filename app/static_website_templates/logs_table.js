@@ -1,4 +1,29 @@
+// Fill the metrics tables with metrics.json of the last run, if there is one.
+function showMetrics(metrics) {
+    document.querySelector("#metricsRun").textContent = `${metrics.started} bis ${metrics.finished}`;
+    var counters = $('#metricsCounters tbody');
+    $.each(metrics.counters, function (name, value) {
+        if (name === 'http.bytes_downloaded') {
+            name = 'http.mb_downloaded';
+            value = (value / 2 ** 20).toFixed(1);
+        }
+        counters.append($('<tr>').append($('<td>').text(name), $('<td class="text-end">').text(value)));
+    });
+    $.each(metrics.cache_hit_rates, function (name, rate) {
+        counters.append($('<tr>').append($('<td>').text(`${name} Trefferquote`), $('<td class="text-end">').text(`${(100 * rate).toFixed(1)}%`)));
+    });
+    var timings = $('#metricsTimings tbody');
+    $.each(metrics.timings, function (name, timing) {
+        var row = $('<tr>').append($('<td>').text(name));
+        $.each([timing.count, timing.sum, timing.p50, timing.p95, timing.max], function (i, value) {
+            row.append($('<td class="text-end">').text(value));
+        });
+        timings.append(row);
+    });
+}
+
 $(document).ready(function () {
+    $.getJSON('metrics.json', showMetrics);
     // Create search input element on top of table for each column
     $('#table thead th.colSearch').each(function () {
         $(this).html('<input type="text" placeholder="Search column" />');
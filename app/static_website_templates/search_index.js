@@ -0,0 +1,104 @@
+// Full text search on the prebuilt index written by search_utils.write_search_index.
+// Only the manifest and the shards of the terms of a query are downloaded, never the
+// pdf texts. Normalization, stemming and sharding must stay identical to search_utils.
+const searchIndex = (function () {
+    const umlauts = { 'ä': 'a', 'ö': 'o', 'ü': 'u', 'ß': 'ss' };
+    const shards = {};
+    let manifest = null;
+    let stopwords = null;
+
+    function fetchJson(url) {
+        return fetch(url).then(response => {
+            if (!response.ok) {
+                throw new Error(`${url}: ${response.status} ${response.statusText}`);
+            }
+            return response.json();
+        });
+    }
+
+    // Failed downloads are not cached, so the next search tries again.
+    function loadManifest() {
+        if (manifest === null) {
+            manifest = fetchJson('search/manifest.json').then(m => {
+                stopwords = new Set(m.stopwords);
+                return m;
+            });
+            manifest.catch(() => { manifest = null; });
+        }
+        return manifest;
+    }
+
+    function loadShard(k) {
+        if (!(k in shards)) {
+            shards[k] = fetchJson(`search/shard_${k}.json`);
+            shards[k].catch(() => { delete shards[k]; });
+        }
+        return shards[k];
+    }
+
+    function normalize(text) {
+        return text
+            .toLowerCase()
+            .replace(/[äöüß]/g, c => umlauts[c])
+            .normalize('NFKD')
+            .replace(/[\u0300-\u036f]/g, '');
+    }
+
+    function stem(word) {
+        while (word.length > 3) {
+            if (word.length > 5 && ['em', 'er', 'nd'].includes(word.slice(-2))) {
+                word = word.slice(0, -2);
+            } else if (word.length > 4 && 'tesn'.includes(word.slice(-1))) {
+                word = word.slice(0, -1);
+            } else {
+                break;
+            }
+        }
+        return word;
+    }
+
+    function getTerms(text) {
+        return (normalize(text).match(/[a-z0-9]+/g) || [])
+            .filter(word => word.length > 1 && !stopwords.has(word))
+            .map(stem);
+    }
+
+    function getShard(term, nShards) {
+        // 32 bit FNV-1a, terms only contain ascii characters after normalization.
+        let h = 0x811c9dc5;
+        for (let i = 0; i < term.length; i++) {
+            h = Math.imul(h ^ term.charCodeAt(i), 0x01000193) >>> 0;
+        }
+        return h % nShards;
+    }
+
+    // Return the item_ids of the items containing all terms of query, mapped to a
+    // relevance score (sum over the terms of weight times idf).
+    async function search(query) {
+        const m = await loadManifest();
+        const terms = [...new Set(getTerms(query))];
+        const postings = await Promise.all(
+            terms.map(term => loadShard(getShard(term, m.n_shards)).then(shard => shard[term] || []))
+        );
+        let scores = null;
+        postings.forEach(termPostings => {
+            const nDocs = termPostings.length / 2;
+            const idf = Math.log(1 + (m.item_ids.length - nDocs + 0.5) / (nDocs + 0.5));
+            const termScores = new Map();
+            for (let i = 0; i < termPostings.length; i += 2) {
+                const doc = termPostings[i];
+                if (scores === null || scores.has(doc)) {
+                    termScores.set(doc, (scores === null ? 0 : scores.get(doc)) + termPostings[i + 1] * idf);
+                }
+            }
+            scores = termScores;
+        });
+        const result = new Map();
+        for (const [doc, score] of scores || []) {
+            result.set(m.item_ids[doc], score);
+        }
+        return result;
+    }
+
+    return { search: search };
+})();
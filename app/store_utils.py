@@ -0,0 +1,351 @@
+# -*- coding: utf-8 -*-
+import gzip
+import json
+import os
+import sqlite3
+import threading
+import time
+from pathlib import Path
+
+
+class ItemStore:
+    """Persistent item store in a SQLite database.
+
+    Each item is stored as a json document in its own row, together with its status
+    and its position in the table of the run that stored it, so finished items can be
+    written one by one instead of rewriting the whole result file. Every write is a
+    transaction, so the store is never left half-written if the process gets killed.
+    The connection is shared between threads and guarded by a lock.
+    """
+
+    def __init__(self, db_path: Path):
+        os.makedirs(Path(db_path).parent, exist_ok=True)
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(db_path, check_same_thread=False)
+        with self._lock, self._connection:
+            self._connection.execute(
+                "CREATE TABLE IF NOT EXISTS items "
+                "(item_id TEXT PRIMARY KEY, position INTEGER, status TEXT, data TEXT)"
+            )
+
+    def __len__(self):
+        with self._lock:
+            return self._connection.execute("SELECT COUNT(*) FROM items").fetchone()[0]
+
+    def put(self, item: dict, position: int) -> None:
+        """Insert or replace an item."""
+        self.put_many([item], [position])
+
+    def put_many(self, items: list[dict], positions: list[int]) -> None:
+        """Insert or replace several items in a single transaction."""
+        with self._lock, self._connection:
+            self._connection.executemany(
+                "INSERT OR REPLACE INTO items (item_id, position, status, data) "
+                "VALUES (?, ?, ?, ?)",
+                (
+                    (i["item_id"], position, i.get("status"), json.dumps(i))
+                    for i, position in zip(items, positions)
+                ),
+            )
+
+    def get(self, item_id: str) -> dict | None:
+        """Return the item with item_id or None if it is not stored."""
+        with self._lock:
+            row = self._connection.execute(
+                "SELECT data FROM items WHERE item_id = ?", (item_id,)
+            ).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def get_index(self) -> dict:
+        """Return a lightweight index of all stored items ordered by position:
+        item_id -> {"status": ..., "title": ..., "related_items": [...]}.
+        Only these fields are extracted from the stored json by SQLite, the full
+        items (including pdf_text) can be loaded with get when actually needed."""
+        with self._lock:
+            rows = self._connection.execute(
+                "SELECT item_id, status, json_extract(data, '$.title'), "
+                "json(json_extract(data, '$.related_items')) "
+                "FROM items ORDER BY position"
+            ).fetchall()
+        index = {}
+        for item_id, status, title, related_items in rows:
+            index[item_id] = {"status": status}
+            if title is not None:
+                index[item_id]["title"] = title
+            if related_items is not None:
+                index[item_id]["related_items"] = json.loads(related_items)
+        return index
+
+    def update_links(self, items: list[dict]) -> None:
+        """Update position and related_items of the stored items to those of items,
+        the items of the current table in table order. Stored items that are not
+        processed in this run (e.g. waiting for a retry) keep up with the table."""
+        with self._lock, self._connection:
+            self._connection.executemany(
+                "UPDATE items SET position = ?, "
+                "data = json_set(data, '$.related_items', json(?)) WHERE item_id = ?",
+                (
+                    (position, json.dumps(item["related_items"]), item["item_id"])
+                    for position, item in enumerate(items)
+                ),
+            )
+
+    def iter_all(self):
+        """Yield all stored items ordered by position."""
+        with self._lock:
+            rows = self._connection.execute(
+                "SELECT data FROM items ORDER BY position"
+            ).fetchall()
+        for row in rows:
+            yield json.loads(row[0])
+
+    def iter_items(self, item_ids: list[str], status: str = None):
+        """Yield the stored items with the given ids in the given order, optionally
+        only those with the given status. Ids that are not stored are skipped."""
+        for item_id in item_ids:
+            item = self.get(item_id)
+            if item is not None and (status is None or item["status"] == status):
+                yield item
+
+    def import_json(self, path: Path) -> None:
+        """Import all items of a result json file (see write_result_json)."""
+        with open(path, "r") as f:
+            items = json.load(f)["data"]
+        self.put_many(items, range(len(items)))
+
+    def backup(self, path: Path) -> None:
+        """Write a consistent copy of the store to path."""
+        backup_connection = sqlite3.connect(path)
+        with self._lock:
+            self._connection.backup(backup_connection)
+        backup_connection.close()
+
+    def close(self) -> None:
+        with self._lock:
+            self._connection.close()
+
+
+# Stages of a job in the JobQueue, each one the last stage the item finished. Jobs
+# are removed from the queue once the item is summarized. OCR and text extraction
+# run in one worker call, so they finish together as "extracted".
+JOB_STAGES = ("new", "fetched", "downloaded", "extracted")
+
+
+class JobQueue:
+    """Persistent queue of the items to process, in a SQLite database.
+
+    Every job stores the last stage its item finished together with the results
+    needed to continue from there, so a restarted run resumes each item where it
+    stopped. Items that end up with status ERROR are reset to stage "new" and retried
+    in a later run with exponential backoff: not before backoff_seconds after the
+    first failure, doubling with every further failure up to max_backoff_seconds.
+    Items never attempted come first, then failed items by number of attempts. The
+    connection is shared between threads and guarded by a lock.
+    """
+
+    def __init__(
+        self, db_path: Path, backoff_seconds: float, max_backoff_seconds: float
+    ):
+        os.makedirs(Path(db_path).parent, exist_ok=True)
+        self.backoff_seconds = backoff_seconds
+        self.max_backoff_seconds = max_backoff_seconds
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(db_path, check_same_thread=False)
+        with self._lock, self._connection:
+            self._connection.execute(
+                "CREATE TABLE IF NOT EXISTS jobs (item_id TEXT PRIMARY KEY, "
+                "stage TEXT, data TEXT, attempts INTEGER, next_attempt REAL, "
+                "error_msg TEXT)"
+            )
+
+    def __len__(self):
+        with self._lock:
+            row = self._connection.execute("SELECT COUNT(*) FROM jobs").fetchone()
+        return row[0]
+
+    def add_missing(self, item_ids: list[str]) -> int:
+        """Add a job in stage "new" for every item that has none and return their
+        number."""
+        with self._lock, self._connection:
+            before = self._connection.total_changes
+            self._connection.executemany(
+                "INSERT OR IGNORE INTO jobs "
+                "(item_id, stage, data, attempts, next_attempt, error_msg) "
+                "VALUES (?, 'new', '{}', 0, 0, '')",
+                ((item_id,) for item_id in item_ids),
+            )
+            return self._connection.total_changes - before
+
+    def get_due(self, item_ids: list[str]) -> list[str]:
+        """Return those of item_ids whose job is due, in the order they should be
+        processed: jobs without failures first, then by number of attempts, each in
+        the order of item_ids."""
+        with self._lock:
+            rows = self._connection.execute(
+                "SELECT item_id, attempts FROM jobs WHERE next_attempt <= ?",
+                (time.time(),),
+            ).fetchall()
+        attempts = dict(rows)
+        position = {item_id: n for n, item_id in enumerate(item_ids)}
+        return sorted(
+            (item_id for item_id in item_ids if item_id in attempts),
+            key=lambda item_id: (attempts[item_id], position[item_id]),
+        )
+
+    def get_item_ids(self, stage: str) -> set[str]:
+        """Return the ids of all items that finished at least stage."""
+        stages = JOB_STAGES[JOB_STAGES.index(stage) :]
+        with self._lock:
+            rows = self._connection.execute(
+                f"SELECT item_id FROM jobs WHERE stage IN ({', '.join('?' * len(stages))})",
+                stages,
+            ).fetchall()
+        return {item_id for (item_id,) in rows}
+
+    def get(self, item_id: str) -> dict | None:
+        """Return the job of item_id as {"stage": ..., "data": {...}, "attempts": ...}
+        or None if there is no job."""
+        with self._lock:
+            row = self._connection.execute(
+                "SELECT stage, data, attempts FROM jobs WHERE item_id = ?", (item_id,)
+            ).fetchone()
+        if row is None:
+            return None
+        return {"stage": row[0], "data": json.loads(row[1]), "attempts": row[2]}
+
+    def advance(self, item_id: str, stage: str, data: dict) -> None:
+        """Record that the item finished stage, adding data to the stored results."""
+        with self._lock, self._connection:
+            row = self._connection.execute(
+                "SELECT data FROM jobs WHERE item_id = ?", (item_id,)
+            ).fetchone()
+            self._connection.execute(
+                "UPDATE jobs SET stage = ?, data = ? WHERE item_id = ?",
+                (stage, json.dumps({**json.loads(row[0]), **data}), item_id),
+            )
+
+    def fail(self, item_id: str, error_msg: str) -> float:
+        """Reset the job to stage "new" and postpone it by the backoff. Returns the
+        backoff in seconds."""
+        with self._lock, self._connection:
+            (attempts,) = self._connection.execute(
+                "SELECT attempts FROM jobs WHERE item_id = ?", (item_id,)
+            ).fetchone()
+            backoff = min(
+                self.backoff_seconds * 2**attempts, self.max_backoff_seconds
+            )
+            self._connection.execute(
+                "UPDATE jobs SET stage = 'new', data = '{}', attempts = ?, "
+                "next_attempt = ?, error_msg = ? WHERE item_id = ?",
+                (attempts + 1, time.time() + backoff, error_msg, item_id),
+            )
+        return backoff
+
+    def finish(self, item_id: str) -> None:
+        """Remove the job of a successfully processed item, if there is one."""
+        with self._lock, self._connection:
+            self._connection.execute("DELETE FROM jobs WHERE item_id = ?", (item_id,))
+
+    def close(self) -> None:
+        with self._lock:
+            self._connection.close()
+
+
+def write_result_json(metadata: dict, items, path: Path) -> None:
+    """Write metadata and items as result json file in the format {**metadata, "data": [...]}
+    with indent=4, the same as gu.write_json would. Items can be any iterable and are
+    serialized one by one, so they never have to be held in memory all at once.
+    The file is written to a temporary file first and then moved into place."""
+    tmp_path = Path(path).with_name(f".{Path(path).name}.tmp")
+    with open(tmp_path, "w") as f:
+        f.write("{\n")
+        for key, value in metadata.items():
+            value_json = json.dumps(value, indent=4).replace("\n", "\n    ")
+            f.write(f"    {json.dumps(key)}: {value_json},\n")
+        f.write('    "data": [')
+        n_items = 0
+        for item in items:
+            f.write(",\n" if n_items else "\n")
+            f.write("        " + json.dumps(item, indent=4).replace("\n", "\n        "))
+            n_items += 1
+        f.write("\n    ]\n}" if n_items else "]\n}")
+    os.replace(tmp_path, path)
+
+
+# Columns of the sharded frontend export. Columns in FRONTEND_DICTIONARY_COLUMNS are
+# dictionary encoded: the shards contain integer codes into a list of values in the
+# manifest, which is shared by all shards.
+FRONTEND_COLUMNS = (
+    "item_id",
+    "date",
+    "title",
+    "category",
+    "author",
+    "item_url",
+    "pdf_url",
+    "pdf_summary",
+    "related_items",
+)
+FRONTEND_DICTIONARY_COLUMNS = ("date", "category", "author")
+
+
+def write_compressed(data: bytes, path: Path) -> None:
+    """Write data to path and pre-compressed to path.gz and, if brotli is installed,
+    path.br, for web servers serving precompressed files."""
+    with open(path, "wb") as f:
+        f.write(data)
+    with open(f"{path}.gz", "wb") as f:
+        f.write(gzip.compress(data, compresslevel=9))
+    try:
+        import brotli
+    except ImportError:
+        return
+    with open(f"{path}.br", "wb") as f:
+        f.write(brotli.compress(data))
+
+
+def write_frontend_shards(metadata: dict, items, directory: Path) -> None:
+    """Write items for the frontend as columnar json files, one per year of the item
+    date, newest first, so the frontend can render the current year before loading
+    the archive. Related items are written as [item_id, title] pairs.
+
+    directory/manifest.json holds metadata, the dictionaries of the dictionary
+    encoded columns and the shards as [{"year": ..., "file": ..., "n_items": ...}].
+    """
+    dictionaries = {column: {} for column in FRONTEND_DICTIONARY_COLUMNS}
+    shards = {}
+    for item in items:
+        year = item["date"][:4] if item["date"][:4].isdigit() else "unknown"
+        if year not in shards:
+            shards[year] = {column: [] for column in FRONTEND_COLUMNS}
+        for column in FRONTEND_COLUMNS:
+            value = item[column]
+            if column in dictionaries:
+                value = dictionaries[column].setdefault(
+                    value, len(dictionaries[column])
+                )
+            elif column == "related_items":
+                value = [[i["item_id"], i["title"]] for i in value]
+            shards[year][column].append(value)
+
+    os.makedirs(directory, exist_ok=True)
+    manifest_shards = []
+    # Newest year first, items without a proper date last.
+    for year in sorted(shards, key=lambda y: (y != "unknown", y), reverse=True):
+        file = f"items_{year}.json"
+        write_compressed(
+            json.dumps({"columns": shards[year]}, separators=(",", ":")).encode(),
+            Path(directory) / file,
+        )
+        manifest_shards.append(
+            {"year": year, "file": file, "n_items": len(shards[year]["item_id"])}
+        )
+    manifest = {
+        **metadata,
+        "dictionaries": {column: list(d) for column, d in dictionaries.items()},
+        "shards": manifest_shards,
+    }
+    write_compressed(
+        json.dumps(manifest, separators=(",", ":")).encode(),
+        Path(directory) / "manifest.json",
+    )
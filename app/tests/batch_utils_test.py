@@ -0,0 +1,250 @@
+# -*- coding: utf-8 -*-
+import json
+
+import pytest
+
+import batch_utils as bu
+import cache_utils as cu
+import generic_utils as gu
+
+
+class FakeSummarize:
+    """Summarize function of LocalBatchBackend that records its texts and fails for
+    texts containing "FAIL"."""
+
+    def __init__(self):
+        self.texts = []
+
+    def __call__(self, text):
+        self.texts.append(text)
+        if "FAIL" in text:
+            raise RuntimeError("model overloaded")
+        return f"TL;DR: Summary of {text.split()[0]}"
+
+
+@pytest.fixture(autouse=True)
+def small_chunks(monkeypatch):
+    # One token per word and chunks of at most 20 tokens.
+    monkeypatch.setattr(gu, "count_tokens", lambda text: len(text.split()))
+    monkeypatch.setattr(gu, "get_summary_max_chunk_tokens", lambda: 20)
+
+
+@pytest.fixture
+def reduce_requests(monkeypatch):
+    """Texts of the single requests of the reduce step."""
+    texts = []
+
+    def generate_openai_summary(text, summary_cache=None):
+        texts.append(text)
+        return "Reduced summary"
+
+    monkeypatch.setattr(gu, "generate_openai_summary", generate_openai_summary)
+    return texts
+
+
+def get_summarizer(tmp_path, summarize, summary_cache=None):
+    return bu.BatchSummarizer(
+        bu.LocalBatchBackend(summarize=summarize),
+        tmp_path / "jobs",
+        summary_cache=summary_cache,
+        poll_interval=0,
+    )
+
+
+def get_text(first_word: str, n_sentences: int) -> str:
+    return " ".join(
+        f"{first_word} Satz {k} mit ein paar weiteren Worten."
+        for k in range(n_sentences)
+    )
+
+
+def read_job_lines(tmp_path) -> list[list[dict]]:
+    return [
+        [json.loads(line) for line in open(path)]
+        for path in sorted((tmp_path / "jobs").glob("summaries_*.jsonl"))
+        if not path.name.endswith(".results.jsonl")
+    ]
+
+
+def test_short_texts_are_summarized_in_one_request_each(tmp_path, reduce_requests):
+    summarize = FakeSummarize()
+    summarizer = get_summarizer(tmp_path, summarize)
+    summarizer.add("1", "Erster kurzer Text.")
+    summarizer.add("2", "Zweiter kurzer Text.")
+    assert len(summarizer) == 2
+    summaries = summarizer.collect()
+    assert summaries == {"1": "Summary of Erster", "2": "Summary of Zweiter"}
+    assert sorted(summarize.texts) == ["Erster kurzer Text.", "Zweiter kurzer Text."]
+    assert not reduce_requests
+    assert len(summarizer) == 0
+
+
+def test_long_text_is_chunked_and_reduced(tmp_path, reduce_requests):
+    summarize = FakeSummarize()
+    summarizer = get_summarizer(tmp_path, summarize)
+    text = get_text("Lang", 10)
+    summarizer.add("1", text)
+    summaries = summarizer.collect()
+    chunks = gu.split_text_into_chunks(text, 20)
+    assert len(chunks) > 1
+    assert sorted(summarize.texts) == sorted(chunks)
+    # Partial summaries are cleaned and reduced with a single request.
+    assert reduce_requests == [" ".join(["Summary of Lang"] * len(chunks))]
+    assert summaries == {"1": "Reduced summary"}
+
+
+def test_job_files_are_split_at_max_requests(tmp_path, monkeypatch, reduce_requests):
+    monkeypatch.setattr(bu, "MAX_JOB_REQUESTS", 3)
+    summarizer = get_summarizer(tmp_path, FakeSummarize())
+    for k in range(7):
+        summarizer.add(str(k), f"Text{k} ist kurz.")
+    summaries = summarizer.collect()
+    assert [len(lines) for lines in read_job_lines(tmp_path)] == [3, 3, 1]
+    assert summaries == {str(k): f"Summary of Text{k}" for k in range(7)}
+
+
+def test_job_files_are_split_at_max_bytes(tmp_path, monkeypatch, reduce_requests):
+    summarizer = get_summarizer(tmp_path, FakeSummarize())
+    line_bytes = len(
+        json.dumps(
+            {
+                "custom_id": "0:0",
+                "method": "POST",
+                "url": "/v1/chat/completions",
+                "body": gu.get_summary_request_body("Text0 ist kurz."),
+            }
+        )
+        + "\n"
+    )
+    monkeypatch.setattr(bu, "MAX_JOB_BYTES", 2 * line_bytes)
+    for k in range(5):
+        summarizer.add(str(k), f"Text{k} ist kurz.")
+    summaries = summarizer.collect()
+    job_lines = read_job_lines(tmp_path)
+    assert [len(lines) for lines in job_lines] == [2, 2, 1]
+    for path in (tmp_path / "jobs").glob("summaries_*_?.jsonl"):
+        assert path.stat().st_size <= 2 * line_bytes
+    assert len(summaries) == 5
+
+
+def test_cached_summaries_are_not_requested(tmp_path, reduce_requests):
+    summary_cache = cu.SummaryCache(tmp_path / "summaries.sqlite")
+    summary_cache.put(
+        gu.get_summary_cache_key(summary_cache, "Bekannter Text."), "Aus dem Cache"
+    )
+    summarize = FakeSummarize()
+    summarizer = get_summarizer(tmp_path, summarize, summary_cache)
+    summarizer.add("1", "Bekannter Text.")
+    summarizer.add("2", "Neuer Text.")
+    summaries = summarizer.collect()
+    assert summaries == {"1": "Aus dem Cache", "2": "Summary of Neuer"}
+    assert summarize.texts == ["Neuer Text."]
+    assert [len(lines) for lines in read_job_lines(tmp_path)] == [1]
+    # Summaries of the batch are added to the cache.
+    summary_cache_key = gu.get_summary_cache_key(summary_cache, "Neuer Text.")
+    assert summary_cache.get(summary_cache_key) == "TL;DR: Summary of Neuer"
+    summary_cache.close()
+
+
+def test_failed_requests_map_to_exceptions_and_error_status(tmp_path, reduce_requests):
+    summarizer = get_summarizer(tmp_path, FakeSummarize())
+    summarizer.add("ok", "Guter Text.")
+    summarizer.add("failed", "Dieser Text FAIL.")
+    # A single failed chunk fails the whole item, without reduce step.
+    summarizer.add("failed_chunk", get_text("Lang", 6) + " FAIL " + get_text("Lang", 2))
+    summaries = summarizer.collect()
+    assert summaries["ok"] == "Summary of Guter"
+    assert isinstance(summaries["failed"], Exception)
+    assert "model overloaded" in str(summaries["failed"])
+    assert isinstance(summaries["failed_chunk"], Exception)
+    assert not reduce_requests
+    assert bu.get_summary_fields(summaries["ok"]) == {
+        "status": "OK",
+        "pdf_summary": "Summary of Guter",
+    }
+    for item_id in ("failed", "failed_chunk"):
+        fields = bu.get_summary_fields(summaries[item_id])
+        assert fields["status"] == "ERROR"
+        assert "model overloaded" in fields["error_msg"]
+    assert bu.get_summary_fields("")["status"] == "ERROR"
+
+
+class RemoteBackend(bu.LocalBatchBackend):
+    """LocalBatchBackend standing in for the batch API, which keeps the jobs when
+    the run stops, and can lose the connection while polling."""
+
+    def __init__(self, summarize):
+        super().__init__(summarize=summarize)
+        self.submitted = []
+        self.connected = True
+
+    def submit(self, job_path):
+        self.submitted.append(
+            [
+                json.loads(line)["body"]["messages"][-1]["content"]
+                for line in open(job_path)
+            ]
+        )
+        return super().submit(job_path)
+
+    def get_status(self, job_id):
+        if not self.connected:
+            raise ConnectionError("connection lost")
+        return super().get_status(job_id)
+
+
+def test_requests_are_written_when_added(tmp_path, reduce_requests):
+    summarizer = get_summarizer(tmp_path, FakeSummarize())
+    summarizer.add("1", "Erster kurzer Text.")
+    summarizer.add("2", get_text("Lang", 10))
+    job_lines = read_job_lines(tmp_path)
+    assert len(job_lines) == 1
+    assert [line["body"]["messages"][-1]["content"] for line in job_lines[0]] == [
+        "Erster kurzer Text."
+    ] + gu.split_text_into_chunks(get_text("Lang", 10), 20)
+
+
+def test_submitted_jobs_are_resumed_after_restart(tmp_path, reduce_requests):
+    backend = RemoteBackend(FakeSummarize())
+    backend.connected = False
+    summarizer = bu.BatchSummarizer(backend, tmp_path / "jobs", poll_interval=0)
+    summarizer.add("1", "Erster kurzer Text.")
+    summarizer.add("2", "Zweiter kurzer Text.")
+    with pytest.raises(ConnectionError):
+        summarizer.collect()
+    assert backend.submitted == [["Erster kurzer Text.", "Zweiter kurzer Text."]]
+    job_ids = summarizer.submitted_job_ids
+    assert len(job_ids) == 1
+
+    # The next run adds the same texts and a new one. Only the new one is submitted,
+    # the results of the others are taken from the job of the first run.
+    backend.connected = True
+    summarizer = bu.BatchSummarizer(backend, tmp_path / "jobs", poll_interval=0)
+    assert summarizer.submitted_job_ids == job_ids
+    summarizer.add("1", "Erster kurzer Text.")
+    summarizer.add("2", "Zweiter kurzer Text.")
+    summarizer.add("3", "Dritter kurzer Text.")
+    summaries = summarizer.collect()
+    assert summaries == {
+        "1": "Summary of Erster",
+        "2": "Summary of Zweiter",
+        "3": "Summary of Dritter",
+    }
+    assert backend.submitted[1:] == [["Dritter kurzer Text."]]
+    assert summarizer.submitted_job_ids == []
+    assert bu.BatchSummarizer(backend, tmp_path / "jobs").submitted_job_ids == []
+
+
+def test_changed_texts_of_submitted_jobs_are_submitted_again(tmp_path, reduce_requests):
+    backend = RemoteBackend(FakeSummarize())
+    backend.connected = False
+    summarizer = bu.BatchSummarizer(backend, tmp_path / "jobs", poll_interval=0)
+    summarizer.add("1", "Alter Text.")
+    with pytest.raises(ConnectionError):
+        summarizer.collect()
+
+    backend.connected = True
+    summarizer = bu.BatchSummarizer(backend, tmp_path / "jobs", poll_interval=0)
+    summarizer.add("1", "Neuer Text.")
+    assert summarizer.collect() == {"1": "Summary of Neuer"}
+    assert backend.submitted[1:] == [["Neuer Text."]]
@@ -0,0 +1,94 @@
+# -*- coding: utf-8 -*-
+import os
+
+import cache_utils as cu
+
+
+def write_pdf(tmp_path, size: int = 100):
+    path = tmp_path / "document.pdf"
+    path.write_bytes(b"%PDF" + b"0" * size)
+    return path
+
+
+def test_pdf_cache_text_is_keyed_by_backend_and_max_chars(tmp_path):
+    pdf_cache = cu.PdfCache(tmp_path / "cache", max_size_bytes=2**20)
+    pdf_path = write_pdf(tmp_path)
+    pdf_cache.put("d.pdf", "abc", pdf_path, "full text", "pypdf")
+    pdf_cache.put("d.pdf", "abc", pdf_path, "full", "pypdf", max_text_chars=4)
+    assert pdf_cache.get_text("d.pdf", "abc", "pypdf") == "full text"
+    assert pdf_cache.get_text("d.pdf", "abc", "pypdf", max_text_chars=4) == "full"
+    assert pdf_cache.get_text("d.pdf", "abc", "pymupdf") is None
+    assert pdf_cache.get_text("d.pdf", "def", "pypdf") is None
+
+
+def test_pdf_cache_evicts_pdf_with_all_its_texts(tmp_path):
+    pdf_cache = cu.PdfCache(tmp_path / "cache", max_size_bytes=500)
+    pdf_path = write_pdf(tmp_path, size=200)
+    pdf_cache.put("a.pdf", "1", pdf_path, "a", "pypdf")
+    pdf_cache.put("a.pdf", "1", pdf_path, "a", "pymupdf")
+    # Make the first entry the least recently used one.
+    for path in (tmp_path / "cache").iterdir():
+        os.utime(path, (0, 0))
+    pdf_cache.put("b.pdf", "2", pdf_path, "b", "pypdf")
+    pdf_cache.put("c.pdf", "3", pdf_path, "c", "pypdf")
+    assert sorted(path.name for path in (tmp_path / "cache").iterdir()) == [
+        "b.pdf_2.pdf",
+        "b.pdf_2.pypdf-all.txt",
+        "c.pdf_3.pdf",
+        "c.pdf_3.pypdf-all.txt",
+    ]
+    assert pdf_cache.get_text("a.pdf", "1", "pymupdf") is None
+    assert pdf_cache.get_text("b.pdf", "2", "pypdf") == "b"
+
+
+def test_pdf_cache_returns_cached_pdf_for_other_text_settings(tmp_path):
+    pdf_cache = cu.PdfCache(tmp_path / "cache", max_size_bytes=2**20)
+    assert pdf_cache.get_pdf_path("d.pdf", "abc") is None
+    pdf_cache.put("d.pdf", "abc", write_pdf(tmp_path), "full text", "pypdf")
+    cached_pdf_path = pdf_cache.get_pdf_path("d.pdf", "abc")
+    assert cached_pdf_path.read_bytes() == write_pdf(tmp_path).read_bytes()
+    assert pdf_cache.get_text("d.pdf", "abc", "pymupdf") is None
+    # Text extracted from the cached pdf is added to the same entry.
+    pdf_cache.put("d.pdf", "abc", cached_pdf_path, "full text", "pymupdf")
+    assert pdf_cache.get_text("d.pdf", "abc", "pymupdf") == "full text"
+    assert len(list((tmp_path / "cache").glob("*.pdf"))) == 1
+
+
+def test_pdf_cache_migrates_texts_without_text_settings(tmp_path):
+    directory = tmp_path / "cache"
+    directory.mkdir()
+    (directory / "d.pdf_abc.pdf").write_bytes(b"%PDF")
+    (directory / "d.pdf_abc.txt").write_text("old text", encoding="utf-8")
+    pdf_cache = cu.PdfCache(directory, max_size_bytes=2**20)
+    assert pdf_cache.get_text("d.pdf", "abc", "pypdf") == "old text"
+    assert not (directory / "d.pdf_abc.txt").exists()
+    # Opening the cache again leaves migrated texts as they are.
+    pdf_cache = cu.PdfCache(directory, max_size_bytes=2**20)
+    assert pdf_cache.get_text("d.pdf", "abc", "pypdf") == "old text"
+
+
+def test_http_cache_evicts_least_recently_used_entries(tmp_path):
+    http_cache = cu.HttpCache(tmp_path / "cache", max_size_bytes=600)
+    headers = {"ETag": '"1"', "Content-Length": "200"}
+    http_cache.put("a", headers, b"a" * 200)
+    http_cache.put("b", headers, b"b" * 200)
+    # Make both entries old, then use "a", so "b" is the least recently used one.
+    for path in (tmp_path / "cache").iterdir():
+        os.utime(path, (0, 0))
+    assert http_cache.get("a") == ({"etag": '"1"'}, b"a" * 200)
+    http_cache.put("c", headers, b"c" * 200)
+    assert http_cache.get("b") is None
+    assert http_cache.get_conditional_headers("b") == {}
+    assert http_cache.get("a") is not None
+    assert http_cache.get("c") is not None
+    assert len(list((tmp_path / "cache").iterdir())) == 4
+
+
+def test_http_cache_skips_responses_without_validators(tmp_path):
+    http_cache = cu.HttpCache(tmp_path / "cache")
+    http_cache.put("a", {"Content-Type": "text/html"}, b"a")
+    assert http_cache.get("a") is None
+    http_cache.put("a", {"Last-Modified": "Mon, 01 Jan 2024 00:00:00 GMT"}, b"a")
+    assert http_cache.get_conditional_headers("a") == {
+        "If-Modified-Since": "Mon, 01 Jan 2024 00:00:00 GMT"
+    }
@@ -0,0 +1,72 @@
+# -*- coding: utf-8 -*-
+import pytest
+
+import schlieren_utils as su
+from benchmarks import bench_parsing, fixtures
+
+DETAIL_PAGES = fixtures.load_detail_pages()
+
+
+def get_item_raw(**kwargs) -> dict:
+    return {
+        "item_url": "https://www.schlieren.ch/politbusiness/4500000",
+        "title": "Postulat von anna müller betreffend velowege",
+        "_kategorieId-sort": "postulat",
+        "_geschaeftsdatum-sort": "2024-01-01",
+        "related_items": [],
+        **kwargs,
+    }
+
+
+@pytest.mark.parametrize(
+    "page", DETAIL_PAGES, ids=[page["item_raw"]["item_id"] for page in DETAIL_PAGES]
+)
+def test_synthetic_detail_pages_parsed_like_soup(page):
+    assert bench_parsing.get_detail_fields(
+        page["html"]
+    ) == bench_parsing.get_detail_fields_soup(page["html"])
+
+
+def test_synthetic_detail_pages_cover_both_orders():
+    orders = {
+        page["html"].index("Verfasser") < page["html"].index(">Download<")
+        for page in DETAIL_PAGES
+        if "Verfasser" in page["html"]
+    }
+    assert orders == {True, False}
+
+
+@pytest.mark.parametrize(
+    "html",
+    [
+        '<dl><dt>Verfasser</dt><dd><a href="/p">Anna Müller</a></dd></dl>'
+        '<a href="/_doc/1/d.pdf">Download</a>',
+        '<a href="/_doc/1/d.pdf">Download</a>'
+        '<dl><dt>Verfasser</dt><dd><a href="/p">Anna Müller</a></dd></dl>',
+        "<dl><dt>Verfasser</dt><dd>Anna Müller</dd></dl>"
+        '<a href="/_doc/1/d.pdf">Download</a><a href="/_doc/2/e.pdf">Download</a>',
+        '<a href="/_doc/1/d.pdf">Download</a><a href="/_doc/2/e.pdf">Download</a>'
+        "<dl><dt>Verfasser</dt><dd>Anna Müller</dd></dl>",
+    ],
+)
+def test_parse_detail_page_author_and_pdf_in_any_order(html):
+    item = su.parse_detail_page(get_item_raw(), html)
+    assert item["author"] == "Anna Müller"
+    assert item["pdf_url"] == "https://www.schlieren.ch/_doc/1/d.pdf"
+    assert item["pdf_id"] == "d.pdf"
+
+
+def test_parse_detail_page_without_author():
+    item = su.parse_detail_page(
+        get_item_raw(title="Vorlage stadtrat budget"),
+        '<a href="/_doc/1/d.pdf">Download</a><dl><dt>Status</dt><dd>Offen</dd></dl>',
+    )
+    assert item["author"] == "Stadtrat"
+    assert item["pdf_url"] == "https://www.schlieren.ch/_doc/1/d.pdf"
+
+
+def test_parse_detail_page_without_pdf():
+    with pytest.raises(ValueError):
+        su.parse_detail_page(
+            get_item_raw(), "<dl><dt>Verfasser</dt><dd>Anna Müller</dd></dl>"
+        )
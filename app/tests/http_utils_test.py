@@ -0,0 +1,156 @@
+# -*- coding: utf-8 -*-
+import httpx
+import pytest
+
+import cache_utils as cu
+import http_utils as hu
+
+
+@pytest.fixture
+def server(monkeypatch, tmp_path):
+    """Serve responses from the handler set as server.handler and record the
+    headers of all requests in server.requests."""
+
+    class Server:
+        requests = []
+        handler = None
+
+    def handle(request):
+        Server.requests.append(request.headers)
+        return Server.handler(request)
+
+    client = httpx.Client(transport=httpx.MockTransport(handle))
+    monkeypatch.setattr(hu, "_client", client)
+    monkeypatch.setattr(hu, "_http_cache", cu.HttpCache(tmp_path / "http_cache"))
+    monkeypatch.setattr(hu, "_limiter", hu.HostLimiter(4, 0))
+    return Server
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    """Fake monotonic clock of http_utils, advanced by time.sleep instead of
+    sleeping. The slept durations are recorded in clock.sleeps."""
+
+    class Clock:
+        now = 1000.0
+        sleeps = []
+
+    def sleep(seconds):
+        Clock.sleeps.append(seconds)
+        # Overshoot slightly like a real sleep, otherwise a wait left by rounding
+        # errors might be too short to advance the clock.
+        Clock.now += seconds + 1e-6
+
+    monkeypatch.setattr(hu.time, "monotonic", lambda: Clock.now)
+    monkeypatch.setattr(hu.time, "sleep", sleep)
+    return Clock
+
+
+def serve_range(body: bytes, honor_range: bool = True):
+    """Return a handler serving body, answering Range requests like a server."""
+
+    def handler(request):
+        range_header = request.headers.get("Range")
+        if not range_header or not honor_range:
+            return httpx.Response(200, content=body)
+        start = int(range_header.removeprefix("bytes=").removesuffix("-"))
+        if start >= len(body):
+            return httpx.Response(416)
+        return httpx.Response(206, content=body[start:])
+
+    return handler
+
+
+def test_get_revalidates_cached_response(server):
+    server.handler = lambda request: httpx.Response(
+        304 if request.headers.get("If-None-Match") == '"1"' else 200,
+        headers={"ETag": '"1"'},
+        content=b"page",
+    )
+    assert not hu.get("https://example.org/").extensions.get("from_cache")
+    r = hu.get("https://example.org/")
+    assert r.status_code == 200
+    assert r.extensions["from_cache"]
+    assert r.content == b"page"
+
+
+def test_get_without_cache_sends_no_validators_and_stores_nothing(server):
+    tokens = iter(["token1", "token2"])
+    server.handler = lambda request: httpx.Response(
+        200, headers={"ETag": '"1"'}, content=next(tokens).encode()
+    )
+    assert hu.get("https://example.org/", use_cache=False).text == "token1"
+    assert hu.get("https://example.org/", use_cache=False).text == "token2"
+    assert all("If-None-Match" not in headers for headers in server.requests)
+    assert hu._http_cache.get("https://example.org/") is None
+
+
+def test_download_resumes_partial_file_with_range_request(server, tmp_path):
+    server.handler = serve_range(b"0123456789")
+    path = tmp_path / "document.pdf"
+    path.write_bytes(b"0123")
+    hu.download_to_file("https://example.org/document.pdf", path)
+    assert server.requests[-1]["Range"] == "bytes=4-"
+    assert path.read_bytes() == b"0123456789"
+
+
+def test_download_replaces_partial_file_if_range_is_ignored(server, tmp_path):
+    server.handler = serve_range(b"0123456789", honor_range=False)
+    path = tmp_path / "document.pdf"
+    path.write_bytes(b"0123")
+    hu.download_to_file("https://example.org/document.pdf", path)
+    assert path.read_bytes() == b"0123456789"
+
+
+def test_download_keeps_complete_file_on_416(server, tmp_path):
+    server.handler = serve_range(b"0123456789")
+    path = tmp_path / "document.pdf"
+    path.write_bytes(b"0123456789")
+    hu.download_to_file("https://example.org/document.pdf", path)
+    assert server.requests[-1]["Range"] == "bytes=10-"
+    assert path.read_bytes() == b"0123456789"
+
+
+def test_download_raises_for_error_status_and_size_limit(server, tmp_path):
+    path = tmp_path / "document.pdf"
+    server.handler = lambda request: httpx.Response(404)
+    with pytest.raises(httpx.HTTPStatusError):
+        hu.download_to_file("https://example.org/document.pdf", path)
+    server.handler = serve_range(b"0123456789")
+    with pytest.raises(hu.ResponseTooLargeError):
+        hu.download_to_file("https://example.org/document.pdf", path, max_bytes=5)
+
+
+def test_rate_limiter_waits_for_requests_and_tokens(clock):
+    limiter = hu.RateLimiter(requests_per_minute=2, tokens_per_minute=100)
+    limiter.acquire(80)
+    assert clock.sleeps == []
+    # 20 tokens are left, another 20 are refilled in 12 seconds.
+    limiter.acquire(40)
+    assert sum(clock.sleeps) == pytest.approx(12)
+    # Of the second request, 0.4 were refilled while waiting for the tokens, the
+    # rest of the third one takes another 18 seconds.
+    limiter.acquire(0)
+    assert sum(clock.sleeps) == pytest.approx(30)
+
+
+def test_rate_limiter_lets_large_requests_through_once_full(clock):
+    limiter = hu.RateLimiter(requests_per_minute=60, tokens_per_minute=100)
+    limiter.acquire(500)
+    assert clock.sleeps == []
+    limiter.acquire(500)
+    assert sum(clock.sleeps) == pytest.approx(60)
+
+
+def test_rate_limiter_follows_server_quota_and_pause(clock):
+    limiter = hu.RateLimiter(requests_per_minute=60, tokens_per_minute=600)
+    limiter.update(remaining_requests=10, remaining_tokens=0)
+    limiter.acquire(10)
+    assert sum(clock.sleeps) == pytest.approx(1)
+    limiter.pause(5)
+    limiter.acquire(0)
+    assert sum(clock.sleeps) == pytest.approx(6)
+    # Tokens given back by consume are available right away.
+    limiter.consume(-590)
+    limiter.acquire(600)
+    assert sum(clock.sleeps) == pytest.approx(6)
@@ -0,0 +1,37 @@
+# -*- coding: utf-8 -*-
+import pytest
+
+import ocr_utils as ou
+
+
+def test_run_command_applies_limits_before_the_command_starts():
+    # The shell checks its own limits, so they must be set before it is executed.
+    result = ou.run_command(
+        ["sh", "-c", 'test "$(ulimit -t)" = 7 && test "$(ulimit -v)" = 524288'],
+        timeout=10,
+        max_cpu_seconds=7,
+        max_memory_bytes=512 * 2**20,
+    )
+    assert result["status"] == "OK"
+    assert result["command"] == "sh"
+
+
+def test_run_command_without_limits():
+    assert ou.run_command(["true"], timeout=10)["returncode"] == 0
+
+
+def test_run_command_raises_with_stderr_of_failed_command():
+    with pytest.raises(ou.CommandError) as e:
+        ou.run_command(
+            ["sh", "-c", "echo kaputt >&2; exit 3"], timeout=10, max_cpu_seconds=7
+        )
+    assert e.value.result["status"] == "ERROR"
+    assert e.value.result["returncode"] == 3
+    assert "kaputt" in e.value.result["error"]
+
+
+def test_run_command_kills_command_after_timeout():
+    with pytest.raises(ou.CommandError) as e:
+        ou.run_command(["sleep", "10"], timeout=0.2)
+    assert e.value.result["status"] == "TIMEOUT"
+    assert e.value.result["seconds"] < 5
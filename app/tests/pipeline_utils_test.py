@@ -0,0 +1,42 @@
+# -*- coding: utf-8 -*-
+import threading
+import time
+
+import pytest
+
+import pipeline_utils as pu
+
+
+def test_process_items_sequential_in_order():
+    results = list(pu.process_items(lambda item: item * 2, [3, 1, 2]))
+    assert results == [(1, 6), (2, 2), (3, 4)]
+
+
+@pytest.mark.parametrize("max_in_flight", [2, 4])
+def test_process_items_bounds_items_in_flight(max_in_flight):
+    lock = threading.Lock()
+    started = []
+
+    def process_item(item):
+        with lock:
+            started.append(item)
+        time.sleep(0.001 * (item % 3))
+        return item
+
+    n_unyielded = []
+    results = []
+    for i, result in pu.process_items(process_item, range(30), max_in_flight):
+        results.append(result)
+        # Items started but whose result the caller has not seen yet.
+        with lock:
+            n_unyielded.append(len(started) - len(results))
+    assert sorted(results) == list(range(30))
+    assert max(n_unyielded) < max_in_flight
+
+
+def test_process_items_reraises():
+    def process_item(item):
+        raise RuntimeError(item)
+
+    with pytest.raises(RuntimeError):
+        list(pu.process_items(process_item, [1, 2, 3], max_in_flight=2))
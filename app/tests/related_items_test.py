@@ -0,0 +1,153 @@
+# -*- coding: utf-8 -*-
+import copy
+import random
+
+import pytest
+
+import schlieren_utils as su
+from benchmarks.bench_related_items import (
+    add_response_links_inplace_brute_force,
+    synthetic_items,
+)
+
+
+def get_index(items: list[dict]) -> dict:
+    """Index of a run like ItemStore.get_index, in table order."""
+    return {
+        item["item_id"]: {
+            "status": "OK",
+            "title": item["title"],
+            "related_items": copy.deepcopy(item["related_items"]),
+        }
+        for item in items
+    }
+
+
+def add_links_incrementally(items: list[dict], prev_index: dict) -> list[dict]:
+    items = copy.deepcopy(items)
+    su.add_response_links_inplace(items, prev_index)
+    return items
+
+
+def add_links_fully(items: list[dict]) -> list[dict]:
+    items = copy.deepcopy(items)
+    su.add_response_links_inplace(items)
+    return items
+
+
+def add_links_brute_force(items: list[dict]) -> list[dict]:
+    items = copy.deepcopy(items)
+    add_response_links_inplace_brute_force(items)
+    return items
+
+
+def adversarial_items(n_items: int, seed: int) -> list[dict]:
+    """Titles that are hard for the blocking index: a small alphabet, so that every
+    piece is common, very short titles, repeated pieces, a long shared prefix and
+    copies of earlier titles with typos or embedded in longer titles."""
+    rng = random.Random(seed)
+    titles = []
+    for k in range(n_items):
+        r = rng.random()
+        if r < 0.15:
+            title = "".join(rng.choice("ab ") for _ in range(rng.randint(0, 12)))
+        elif r < 0.3:
+            title = rng.choice(["abc", "aab", "ab ", "vorlage "]) * rng.randint(1, 12)
+        elif r < 0.5 or not titles:
+            tail = "".join(rng.choice("abcd ") for _ in range(rng.randint(1, 15)))
+            title = "vorlage stadtrat " + tail
+        elif r < 0.8:
+            title = list(rng.choice(titles))
+            for _ in range(rng.randint(1, max(1, len(title) // 12))):
+                pos = rng.randrange(len(title) + 1)
+                if rng.random() < 0.5:
+                    title.insert(pos, rng.choice("abcd "))
+                else:
+                    del title[pos : pos + 1]
+            title = "".join(title)
+        else:
+            affix = "".join(rng.choice("abcd ") for _ in range(rng.randint(0, 20)))
+            title = rng.choice([affix + rng.choice(titles), rng.choice(titles) + affix])
+        titles.append(title)
+    return [{"item_id": str(k), "title": title} for k, title in enumerate(titles)]
+
+
+@pytest.mark.parametrize("seed", [1, 2])
+def test_links_equal_brute_force_on_synthetic_titles(seed):
+    items = synthetic_items(400, seed=seed)
+    assert add_links_fully(items) == add_links_brute_force(items)
+
+
+@pytest.mark.parametrize("seed", [1, 2, 3])
+def test_links_equal_brute_force_on_adversarial_titles(seed):
+    items = adversarial_items(300, seed=seed)
+    expected = add_links_brute_force(items)
+    assert sum(len(item["related_items"]) for item in expected) > 100
+    assert add_links_fully(items) == expected
+    # Incrementally, with a third of the items new.
+    known = [item for k, item in enumerate(items) if k % 3]
+    prev_index = get_index(add_links_fully(known))
+    assert add_links_incrementally(items, prev_index) == expected
+
+
+@pytest.fixture
+def all_items():
+    return synthetic_items(600, seed=7)
+
+
+def test_incremental_links_equal_full_recomputation_over_runs(all_items):
+    # Every run, new items are added to the table, an item is renamed and an item
+    # is removed, like between runs of the scraper.
+    table = all_items[:300]
+    prev_index = get_index(add_links_fully(table))
+    for run in range(1, 5):
+        table = table + all_items[200 + 100 * run : 300 + 100 * run]
+        table[10 * run] = {
+            **table[10 * run],
+            "title": "Beantwortung " + table[run]["title"],
+        }
+        del table[5 * run]
+        expected = add_links_fully(table)
+        assert add_links_incrementally(table, prev_index) == expected
+        prev_index = get_index(expected)
+
+
+def test_incremental_links_with_stale_previous_items(all_items):
+    # Items that are not processed in a run (e.g. waiting for their retry backoff)
+    # may keep related_items of an earlier run, while the items linking to them are
+    # up to date. The links must still be the same as when computing all of them.
+    first = add_links_fully(all_items[:300])
+    table = all_items[:400]
+    second = add_links_fully(table)
+    prev_index = get_index(second)
+    n_stale = 0
+    for item_first, item_second in zip(first, second):
+        if item_first["related_items"] != item_second["related_items"]:
+            prev_index[item_first["item_id"]]["related_items"] = item_first[
+                "related_items"
+            ]
+            n_stale += 1
+    assert n_stale
+    assert add_links_incrementally(table, prev_index) == second
+
+
+def test_new_item_links_to_stale_item():
+    # Run 1 stores B without links, run 2 adds C which links to B, but B is not
+    # processed again in run 2. Run 3 must still link B to C.
+    table = [
+        {"item_id": "B", "title": "Postulat betreffend velowege im quartier"},
+        {"item_id": "A", "title": "Vorlage stadtrat budget"},
+    ]
+    prev_index = get_index(add_links_fully(table))
+    table = [
+        {
+            "item_id": "C",
+            "title": "Beantwortung postulat betreffend velowege im quartier",
+        },
+    ] + table
+    second = add_links_incrementally(table, prev_index)
+    prev_index = get_index(second)
+    prev_index["B"]["related_items"] = []
+    third = add_links_incrementally(table, prev_index)
+    assert third == add_links_fully(table)
+    assert [related["item_id"] for related in third[1]["related_items"]] == ["C"]
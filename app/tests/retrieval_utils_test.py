@@ -0,0 +1,68 @@
+# -*- coding: utf-8 -*-
+import retrieval_utils as ru
+
+
+def get_item(item_id: str, title: str, pdf_text: str) -> dict:
+    return {
+        "item_id": item_id,
+        "title": title,
+        "item_url": f"https://example.org/{item_id}",
+        "pdf_url": f"https://example.org/{item_id}.pdf",
+        "pdf_text": pdf_text,
+    }
+
+
+ITEMS = [
+    get_item("a", "Schulhaus Allmend", "Der Kredit für die Sanierung des Schulhauses."),
+    get_item("b", "Velowege", "Die Velowege entlang der Seestrasse sind zu schmal."),
+    get_item("c", "Budget 2024", "Das Budget sieht einen Überschuss vor."),
+]
+
+
+def test_split_passages_overlap(monkeypatch):
+    monkeypatch.setattr(ru, "PASSAGE_WORDS", 4)
+    monkeypatch.setattr(ru, "PASSAGE_OVERLAP_WORDS", 1)
+    assert ru.split_passages("a b c d e f g") == ["a b c d", "d e f g"]
+    assert ru.split_passages("a b") == ["a b"]
+    assert ru.split_passages("") == [""]
+
+
+def test_passage_index_search(tmp_path):
+    passage_index = ru.PassageIndex(tmp_path / "passages.db")
+    assert passage_index.update(ITEMS) == 3
+    results = passage_index.search("Schulhäuser")
+    assert [r["item_id"] for r in results] == ["a"]
+    assert results[0]["title"] == "Schulhaus Allmend"
+    assert results[0]["pdf_url"] == "https://example.org/a.pdf"
+    assert results[0]["position"] == 0
+    assert results[0]["text"] == ITEMS[0]["pdf_text"]
+    assert results[0]["score"] > 0
+    # Any term of the query matches.
+    assert {r["item_id"] for r in passage_index.search("Velowege Budget")} == {
+        "b",
+        "c",
+    }
+    assert passage_index.search("Parkplätze") == []
+    assert passage_index.search("und der") == []
+
+
+def test_passage_index_updates_changed_items_only(tmp_path):
+    passage_index = ru.PassageIndex(tmp_path / "passages.db")
+    passage_index.update(ITEMS)
+    passage_index.close()
+    # The index is persisted, unchanged items are not indexed again.
+    passage_index = ru.PassageIndex(tmp_path / "passages.db")
+    changed = get_item("b", "Velowege", "Die Parkplätze an der Seestrasse fallen weg.")
+    assert passage_index.update([ITEMS[0], changed, ITEMS[2]]) == 1
+    assert len(passage_index) == 3
+    assert passage_index.search("schmal") == []
+    assert [r["item_id"] for r in passage_index.search("Parkplätze")] == ["b"]
+
+
+def test_passage_index_remove_except(tmp_path):
+    passage_index = ru.PassageIndex(tmp_path / "passages.db")
+    passage_index.update(ITEMS)
+    assert passage_index.remove_except(["a", "c", "d"]) == 1
+    assert len(passage_index) == 2
+    assert passage_index.search("Velowege") == []
+    assert [r["item_id"] for r in passage_index.search("Budget")] == ["c"]
@@ -0,0 +1,53 @@
+# -*- coding: utf-8 -*-
+import json
+
+import search_utils as sr
+
+
+def read_postings(directory, term: str) -> list[int]:
+    with open(directory / "manifest.json") as f:
+        manifest = json.load(f)
+    with open(
+        directory / f"shard_{sr.get_shard(term, manifest['n_shards'])}.json"
+    ) as f:
+        return json.load(f).get(term, [])
+
+
+def test_terms_are_normalized_stemmed_and_without_stopwords():
+    assert sr.get_terms("Die Schulhäuser") == sr.get_terms("das Schulhaus")
+    assert sr.get_terms("Anfragen für Café") == ["anfrag", "cafe"]
+
+
+def test_search_index_weights_fields(tmp_path):
+    items = [
+        {"item_id": "a", "title": "Schulhaus Allmend", "pdf_text": "Kredit"},
+        {"item_id": "b", "title": "Kredit", "pdf_summary": "Neue Schulhäuser"},
+        {"item_id": "c", "title": "Velowege", "pdf_text": "Das Schulhaus ist alt."},
+        {"item_id": "d", "title": "Budget", "pdf_text": None},
+    ]
+    # Items are only iterated once, so a generator works as well.
+    sr.write_search_index((item for item in items), tmp_path)
+    with open(tmp_path / "manifest.json") as f:
+        manifest = json.load(f)
+    assert manifest["item_ids"] == ["a", "b", "c", "d"]
+    assert "fur" in manifest["stopwords"]
+    postings = read_postings(tmp_path, "schulhau")
+    weights = dict(zip(postings[::2], postings[1::2]))
+    # Title matches weigh more than summary matches, which weigh more than text.
+    assert weights.keys() == {0, 1, 2}
+    assert weights[0] > weights[1] > weights[2] > 0
+    assert read_postings(tmp_path, "das") == []
+    assert read_postings(tmp_path, sr.stem("budget")) == [3, 300]
+
+
+def test_search_index_is_split_into_shards_by_term(tmp_path, monkeypatch):
+    monkeypatch.setattr(sr, "POSTINGS_PER_SHARD", 2)
+    items = [{"item_id": str(k), "title": f"Wort{k} Thema"} for k in range(4)]
+    sr.write_search_index(items, tmp_path)
+    with open(tmp_path / "manifest.json") as f:
+        manifest = json.load(f)
+    assert manifest["n_shards"] == 4
+    assert manifest["n_terms"] == 5
+    for term in ["thema", "wort0", "wort3"]:
+        assert read_postings(tmp_path, term)
+    assert read_postings(tmp_path, "thema")[::2] == [0, 1, 2, 3]
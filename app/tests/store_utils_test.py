@@ -0,0 +1,102 @@
+# -*- coding: utf-8 -*-
+import store_utils as st
+
+
+def get_items(n: int) -> list[dict]:
+    return [
+        {
+            "item_id": str(k),
+            "title": f"Item {k}",
+            "status": "DONE" if k % 2 else "ERROR",
+            "related_items": [],
+            "pdf_text": f"Text {k}",
+        }
+        for k in range(n)
+    ]
+
+
+def test_item_store_round_trip(tmp_path):
+    items = get_items(3)
+    item_store = st.ItemStore(tmp_path / "items.db")
+    item_store.put_many(items[1:], [1, 2])
+    item_store.put(items[0], 0)
+    item_store.close()
+    # Items are persisted across connections.
+    item_store = st.ItemStore(tmp_path / "items.db")
+    assert len(item_store) == 3
+    assert item_store.get("1") == items[1]
+    assert item_store.get("3") is None
+    assert list(item_store.iter_all()) == items
+    assert list(item_store.iter_items(["2", "3", "0"])) == [items[2], items[0]]
+    assert list(item_store.iter_items(["0", "1", "2"], status="DONE")) == [items[1]]
+    assert item_store.get_index() == {
+        "0": {"status": "ERROR", "title": "Item 0", "related_items": []},
+        "1": {"status": "DONE", "title": "Item 1", "related_items": []},
+        "2": {"status": "ERROR", "title": "Item 2", "related_items": []},
+    }
+
+
+def test_item_store_update_links_keeps_other_fields(tmp_path):
+    items = get_items(3)
+    item_store = st.ItemStore(tmp_path / "items.db")
+    item_store.put_many(items, range(3))
+    # The table of the next run has the items in reverse order and new links.
+    table = [
+        {"item_id": "2", "related_items": [{"item_id": "0"}]},
+        {"item_id": "1", "related_items": []},
+        {"item_id": "0", "related_items": [{"item_id": "2"}]},
+    ]
+    item_store.update_links(table)
+    assert [item["item_id"] for item in item_store.iter_all()] == ["2", "1", "0"]
+    assert item_store.get("2") == {**items[2], "related_items": [{"item_id": "0"}]}
+    assert item_store.get_index()["0"]["related_items"] == [{"item_id": "2"}]
+
+
+def test_job_queue_resumes_jobs_at_their_last_stage(tmp_path):
+    job_queue = st.JobQueue(tmp_path / "jobs.db", 10, 60)
+    assert job_queue.add_missing(["a", "b", "c"]) == 3
+    job_queue.advance("a", "fetched", {"pdf_url": "a.pdf"})
+    job_queue.advance("a", "downloaded", {"pdf_path": "a.pdf"})
+    job_queue.advance("b", "fetched", {"pdf_url": "b.pdf"})
+    job_queue.finish("c")
+    job_queue.close()
+
+    job_queue = st.JobQueue(tmp_path / "jobs.db", 10, 60)
+    # Jobs of finished items are not added again while they are in the table.
+    assert job_queue.add_missing(["a", "b"]) == 0
+    assert len(job_queue) == 2
+    assert job_queue.get("a") == {
+        "stage": "downloaded",
+        "data": {"pdf_url": "a.pdf", "pdf_path": "a.pdf"},
+        "attempts": 0,
+    }
+    assert job_queue.get("c") is None
+    assert job_queue.get_item_ids("fetched") == {"a", "b"}
+    assert job_queue.get_item_ids("downloaded") == {"a"}
+    assert job_queue.get_item_ids("extracted") == set()
+
+
+def test_job_queue_postpones_failed_jobs_with_exponential_backoff(
+    tmp_path, monkeypatch
+):
+    now = [1000.0]
+    monkeypatch.setattr(st.time, "time", lambda: now[0])
+    job_queue = st.JobQueue(tmp_path / "jobs.db", 10, 30)
+    job_queue.add_missing(["a", "b", "c"])
+    job_queue.advance("a", "fetched", {"pdf_url": "a.pdf"})
+    assert job_queue.fail("a", "Download failed") == 10
+    # Failed jobs start over and are not due before their backoff has passed.
+    assert job_queue.get("a") == {"stage": "new", "data": {}, "attempts": 1}
+    assert job_queue.get_due(["a", "b", "c"]) == ["b", "c"]
+    now[0] += 10
+    # Jobs that failed before come after those never attempted.
+    assert job_queue.get_due(["a", "b", "c"]) == ["b", "c", "a"]
+    assert job_queue.fail("a", "Download failed") == 20
+    assert job_queue.fail("b", "OCR failed") == 10
+    now[0] += 10
+    assert job_queue.get_due(["a", "b", "c"]) == ["c", "b"]
+    now[0] += 10
+    assert job_queue.get_due(["a", "b", "c"]) == ["c", "b", "a"]
+    # The backoff doubles with every failure up to the maximum.
+    assert job_queue.fail("a", "Download failed") == 30
+    assert job_queue.fail("a", "Download failed") == 30
@@ -0,0 +1,120 @@
+# -*- coding: utf-8 -*-
+import math
+import re
+from collections import Counter, defaultdict
+
+# Frequent german words that carry no meaning on their own and are ignored when
+# comparing sentences.
+STOPWORDS = set(
+    """
+    aber alle allem allen aller alles als also am an ander andere anderen anderer
+    anderes auch auf aus bei beim bereits bis bisher da damit dann darauf darf das
+    dass dem den denen der deren des dessen die dies diese diesem diesen dieser dieses
+    doch dort durch ein eine einem einen einer eines einige er es etwa etwas für gegen
+    hat hatte haben hier ihr ihre ihrem ihren ihrer im in ist ja jede jedem jeden jeder
+    jedoch kann kein keine können man mehr mit muss nach nicht noch nun nur ob oder
+    ohne sehr sei seit sich sie sind so soll sollen sowie um und uns unter vom von vor
+    war waren was weil welche welchen welcher wenn wer werden wie wieder wir wird wurde
+    wurden zu zum zur zwischen über
+    """.split()
+)
+# Sentences shorter or longer than this many words are not used in summaries. Short
+# ones are mostly headings and page numbers, long ones tables or OCR garbage.
+MIN_SENTENCE_WORDS = 6
+MAX_SENTENCE_WORDS = 60
+# Words occurring in more than this share of the sentences, or in more than this
+# many sentences, are too common to link sentences. The absolute limit also bounds
+# the number of compared pairs in long documents.
+MAX_WORD_SENTENCE_SHARE = 0.1
+MAX_WORD_SENTENCES = 50
+# Power iteration stops after ITERATIONS or once no score changes more than TOLERANCE.
+DAMPING = 0.85
+ITERATIONS = 30
+TOLERANCE = 1e-4
+
+
+def split_sentences(text: str) -> list[str]:
+    """Split text at sentence ends. Abbreviations like "Nr." or "z.B." can cause
+    wrong splits, which only costs a slightly worse ranking."""
+    return [s for s in re.split(r"(?<=[.!?])\s+(?=[A-ZÄÖÜ0-9])", text) if s]
+
+
+def get_words(sentence: str) -> list[str]:
+    words = re.findall(r"[a-zäöüß]+", sentence.lower())
+    return [w for w in words if len(w) > 2 and w not in STOPWORDS]
+
+
+def is_candidate(sentence: str) -> bool:
+    """Whether sentence is a proper sentence, not a heading, table or OCR garbage."""
+    n_words = len(sentence.split())
+    if not MIN_SENTENCE_WORDS <= n_words <= MAX_SENTENCE_WORDS:
+        return False
+    n_letters = sum(c.isalpha() for c in sentence)
+    return n_letters >= 0.7 * len(sentence.replace(" ", ""))
+
+
+def rank_sentences(sentences: list[str]) -> list[float]:
+    """Return the TextRank score of every sentence.
+
+    Sentences are linked by their shared words, weighted like in the original
+    TextRank paper by the number of shared words divided by the log lengths of both
+    sentences. Pairs are only compared if they share a word, found with an inverted
+    index, so long documents do not cost a comparison of all pairs.
+    """
+    words = [Counter(get_words(s)) for s in sentences]
+    postings = defaultdict(list)
+    for i, sentence_words in enumerate(words):
+        for word in sentence_words:
+            postings[word].append(i)
+    max_postings = max(
+        2, min(MAX_WORD_SENTENCES, int(MAX_WORD_SENTENCE_SHARE * len(sentences)))
+    )
+    overlaps = defaultdict(int)
+    for word, sentence_ids in postings.items():
+        if len(sentence_ids) > max_postings:
+            continue
+        for a in range(len(sentence_ids)):
+            for b in range(a + 1, len(sentence_ids)):
+                overlaps[(sentence_ids[a], sentence_ids[b])] += min(
+                    words[sentence_ids[a]][word], words[sentence_ids[b]][word]
+                )
+    lengths = [sum(w.values()) for w in words]
+    weights = defaultdict(list)
+    weight_sums = [0.0] * len(sentences)
+    for (a, b), overlap in overlaps.items():
+        weight = overlap / (math.log(lengths[a] + 1) + math.log(lengths[b] + 1))
+        weights[a].append((b, weight))
+        weights[b].append((a, weight))
+        weight_sums[a] += weight
+        weight_sums[b] += weight
+    # Incoming edges of every sentence with the weights normalized by the total
+    # outgoing weight of their source, as lists for a fast inner loop.
+    edges = []
+    for i in range(len(sentences)):
+        sources = [j for j, _ in weights[i]]
+        edges.append((sources, [weight / weight_sums[j] for j, weight in weights[i]]))
+    scores = [1.0] * len(sentences)
+    for _ in range(ITERATIONS):
+        new_scores = [
+            (1 - DAMPING)
+            + DAMPING * sum(scores[j] * w for j, w in zip(sources, normalized))
+            for sources, normalized in edges
+        ]
+        converged = max(abs(a - b) for a, b in zip(scores, new_scores)) < TOLERANCE
+        scores = new_scores
+        if converged:
+            break
+    return scores
+
+
+def summarize_text(text: str, max_sentences: int = 5) -> str:
+    """Return an extractive summary of a german text: its max_sentences most central
+    sentences according to TextRank, in their original order. Runs locally on the
+    CPU without any model. Falls back to the beginning of the text if it contains no
+    proper sentences."""
+    sentences = [s for s in split_sentences(text) if is_candidate(s)]
+    if not sentences:
+        return " ".join(text.split()[:MAX_SENTENCE_WORDS])
+    scores = rank_sentences(sentences)
+    best = sorted(range(len(sentences)), key=lambda i: -scores[i])[:max_sentences]
+    return " ".join(sentences[i] for i in sorted(best))
@@ -0,0 +1,58 @@
+# -*- coding: utf-8 -*-
+"""Answer questions about the political business of Schlieren with passages of the
+pdf texts retrieved from the local passage index written by app/main.py. Only the
+retrieved passages are sent to the model, with item_id and pdf_url as sources.
+Run from the assistant directory:
+
+    python ask.py
+"""
+import sys
+from pathlib import Path
+
+from openai import OpenAI
+
+sys.path.append(str(Path(__file__).resolve().parent.parent / "app"))
+import retrieval_utils as ru  # noqa: E402
+
+passages_db = Path("../dev/data/passages.sqlite")
+model = "gpt-4-1106-preview"
+n_passages = 8
+
+instructions = """
+  You are a helpful assistant fluent in German. You are asked to answer questions about the Schlieren city council.
+  You are given passages of documents of the city council, each with the item_id, title and pdf_url of its document.
+  Answer only based on these passages. If they do not contain the answer, say so.
+  Reference your sources with the link to the original PDF document (pdf_url).
+  """
+
+
+def get_context(passages: list[dict]) -> str:
+    return "\n\n".join(
+        f"[{p['item_id']}] {p['title']} ({p['pdf_url']}):\n{p['text']}"
+        for p in passages
+    )
+
+
+client = OpenAI()
+passage_index = ru.PassageIndex(passages_db)
+print(f"{len(passage_index)} passages in index.")
+while True:
+    question = input("What do you want to know?\n")
+    passages = passage_index.search(question, k=n_passages)
+    response = client.chat.completions.create(
+        model=model,
+        messages=[
+            {"role": "system", "content": instructions},
+            {
+                "role": "user",
+                "content": f"Passages:\n\n{get_context(passages)}\n\nQuestion: {question}",
+            },
+        ],
+    )
+    print("ANTWORT:")
+    print(response.choices[0].message.content)
+    print("QUELLEN:")
+    for item_id, pdf_url in dict.fromkeys(
+        (p["item_id"], p["pdf_url"]) for p in passages
+    ):
+        print(f"{item_id}: {pdf_url}")